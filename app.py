@@ -1,13 +1,31 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import pandas as pd
 import numpy as np
 import requests # For GooglePlaces class and Lybrate
 import json # For GooglePlaces class
+import gzip
 import time # For GooglePlaces class
 import googlemaps # For geocoding hospital names
-from bs4 import BeautifulSoup # For Lybrate scraping
+import math
 import os
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+from http_pool import http_pool # Shared keep-alive sessions for all outbound calls
+from cache import MISSING, Uncached, response_cache, details_key, nearby_key, geocode_key, unwrap
+from singleflight import upstream_flights # Identical concurrent upstream calls share one request
+from pagination import CursorStore, DelayedExecutor
+from refresher import REFRESH_WORKERS
+from throttle import (DETAILS_ATMOSPHERE_FIELDS, DETAILS_BASIC_FIELDS, DETAILS_CONTACT_FIELDS, QuotaLimiter,
+                      RateLimiter, details_sku, priority_class, with_current_priority)
+from crawler import MAX_PAGES_PER_TARGET, CrawlManager, CrawlTarget
+from lybrate_parser import parse_doctor_cards # For Lybrate scraping
+from spatial_index import COVERAGE_CELL_DEG, NearbyIndex, haversine_m
+from name_match import NAME_MATCH_THRESHOLD, NameIndex, name_similarity
+from dataset import DoctorStore, HospitalStore, doctor_store, hospital_store # Columnar store of everything scraped
+from metrics import (TRACE_ALL_REQUESTS, TRACE_HEADER, end_trace, observe_phase, profiler, render_samples,
+                     phase_latency, request_latency, server_timing, start_trace, timed, with_current_trace)
 
 app = Flask(__name__)
 
@@ -18,63 +36,218 @@ GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "YOUR_GOOGLE_API_KEY_PLACEHOLD
 if GOOGLE_API_KEY == "YOUR_GOOGLE_API_KEY_PLACEHOLDER":
     print("WARNING: GOOGLE_API_KEY is not set. Please set it as an environment variable or in the script.")
 
-gmaps_client = googlemaps.Client(key=GOOGLE_API_KEY)
+# Upstream base URLs can be pointed at a local stand-in (see benchmarks/fake_upstream.py)
+GOOGLE_MAPS_BASE_URL = os.environ.get("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com").rstrip('/')
+LYBRATE_BASE_URL = os.environ.get("LYBRATE_BASE_URL", "https://www.lybrate.com").rstrip('/')
+
+# Per-upstream (connect, read) timeouts in seconds
+GOOGLE_TIMEOUT = (3.05, float(os.environ.get("GOOGLE_READ_TIMEOUT", "10")))
+LYBRATE_TIMEOUT = (3.05, float(os.environ.get("LYBRATE_READ_TIMEOUT", "15")))
+http_pool.set_timeout(GOOGLE_MAPS_BASE_URL, GOOGLE_TIMEOUT)
+http_pool.set_timeout(LYBRATE_BASE_URL, LYBRATE_TIMEOUT)
+
+gmaps_client = googlemaps.Client(key=GOOGLE_API_KEY,
+                                 timeout=GOOGLE_TIMEOUT[1],
+                                 requests_session=http_pool.session_for(GOOGLE_MAPS_BASE_URL),
+                                 base_url=GOOGLE_MAPS_BASE_URL)
+
+# Nearby search pagination: initial page + 2 more pages (total 3 pages of results)
+NEARBY_MAX_PAGES = 3
+NEARBY_RESULT_CAP = 60 # Google never returns more per search, so a search that reaches it may be truncated
+NEARBY_PAGE_SIZE = 20 # Results per nearby page
+NEARBY_MAX_RADIUS = 50000 # Meters; Google's own maximum for a nearby search
+NEARBY_PAGE_TOKEN_DELAY = float(os.environ.get("NEARBY_PAGE_TOKEN_DELAY", "2")) # Seconds before a next_page_token is usable
+PLACES_OK_STATUSES = ('OK', 'ZERO_RESULTS') # Any other status (OVER_QUERY_LIMIT, REQUEST_DENIED, ...) is a failed call
+NEARBY_PAGE_TOKEN_RETRIES = int(os.environ.get("NEARBY_PAGE_TOKEN_RETRIES", "2")) # Retries of a page token Google says is not usable yet
+NEARBY_PAGE_TOKEN_BACKOFF = float(os.environ.get("NEARBY_PAGE_TOKEN_BACKOFF", "0.5")) # Seconds before the first retry, doubled for each next one
+
+def _token_not_ready(results):
+    """True for a pagetoken call answered INVALID_REQUEST, which Google sends while the token is not usable yet."""
+    return results is not None and results.get('status') == 'INVALID_REQUEST'
 
 # --- Google Places API Functionality (from notebooks) ---
 class GooglePlaces(object):
-    def __init__(self, apiKey):
+    def __init__(self, apiKey, cache=None, place_index=None, name_index=None, flights=None, quota=None, store=None):
         super(GooglePlaces, self).__init__()
         self.apiKey = apiKey
+        self.cache = cache # Optional ResponseCache; failed lookups (None) are never cached
+        self.flights = flights # Optional SingleFlight for calls the cache does not coalesce
+        self.quota = quota # Optional QuotaLimiter every upstream request waits on
+        self.place_index = place_index # Optional NearbyIndex fed from every Places response
+        self.name_index = name_index # Optional NameIndex of every place name seen
+        self.store = store # Optional HospitalStore keeping ratings of every place seen
 
     def search_places_by_coordinate(self, location, radius, types):
-        endpoint_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-        places = []
+        if self.cache is None:
+            return unwrap(self._coalesce('nearby', nearby_key(location, radius, types),
+                                         lambda: self._search_places_by_coordinate(location, radius, types)))
+        return self.cache.get_or_load('nearby', nearby_key(location, radius, types),
+                                      lambda: self._search_places_by_coordinate(location, radius, types))
+
+    def get_place_details(self, place_id, fields):
+        if self.cache is None:
+            return self._coalesce('details', details_key(place_id, fields),
+                                  lambda: self._get_place_details(place_id, fields))
+        return self.cache.get_or_load('details', details_key(place_id, fields),
+                                      lambda: self._get_place_details(place_id, fields))
+
+    def _coalesce(self, group, key, fn):
+        if self.flights is None:
+            return fn()
+        return self.flights.do(group, key, fn)
+
+    def _search_places_by_coordinate(self, location, radius, types):
+        steps = self.nearby_search_steps(location, radius, types)
+        try:
+            pagetoken, delay = next(steps)
+            while True:
+                if delay:
+                    with timed('nearby_page_wait'):
+                        time.sleep(delay) # Google API requires a short delay before fetching the next page
+                pagetoken, delay = steps.send(self.fetch_nearby_page(location, radius, types, pagetoken))
+        except StopIteration as done:
+            return done.value
+
+    def nearby_search_steps(self, location, radius, types):
+        """
+        One paginated nearby search, whatever the transport: yields (pagetoken, seconds to wait
+        first) for each page to fetch and is sent that page's fetch_nearby_page result.
+        Returns the places, or None if a page failed. A page token that is still not usable
+        after its retries ends the search with the pages so far, as Uncached(places): an
+        incomplete list is neither cached nor counted as coverage.
+        """
+        results = yield None, 0
+        if results is None:
+            return None
+        places = list(results.get('results', []))
+        page_count = 1 # Limit number of pages to avoid excessive calls
+        while "next_page_token" in results and page_count < NEARBY_MAX_PAGES:
+            pagetoken, delay = results['next_page_token'], NEARBY_PAGE_TOKEN_DELAY
+            for retry in range(NEARBY_PAGE_TOKEN_RETRIES + 1):
+                results = yield pagetoken, delay
+                if not _token_not_ready(results):
+                    break
+                delay = NEARBY_PAGE_TOKEN_BACKOFF * 2 ** retry
+            if _token_not_ready(results):
+                print(f"Google Places page token for {location} still not usable; returning {page_count} page(s)")
+                return Uncached(places)
+            if results is None:
+                return None
+            places.extend(results.get('results', []))
+            page_count += 1
+        self.record_coverage(location, radius, types, results, len(places))
+        return places
+
+    def record_coverage(self, location, radius, types, last_page, total):
+        """
+        Marks the search circle as covered in the place index if Google returned everything in it:
+        no further page and fewer results than its cap. Every page got here with an OK or
+        ZERO_RESULTS status; failed pages end the search with None.
+        """
+        if self.place_index is None or "next_page_token" in last_page or total >= NEARBY_RESULT_CAP:
+            return
+        try:
+            lat, lon = [float(x) for x in str(location).split(',')]
+            self.place_index.mark_covered(lat, lon, float(radius), types)
+        except ValueError:
+            pass
+
+    def record_nearby_results(self, results, types):
+        """Feeds one nearby response page to the place index, name index and dataset."""
+        if self.place_index is not None:
+            self.place_index.ingest(results.get('results', []), types)
+        if self.name_index is not None:
+            self.name_index.add_places(results.get('results', []))
+        if self.store is not None:
+            self.store.ingest_places(results.get('results', []), types)
+
+    def record_details(self, place_id, place_details):
+        """Feeds one details response to the place index, name index and dataset."""
+        result = place_details.get('result')
+        if not result:
+            return
+        if self.place_index is not None:
+            self.place_index.update_place(result)
+        if self.name_index is not None:
+            self.name_index.add(result.get('place_id', place_id), result.get('name'))
+        if self.store is not None:
+            self.store.update_details(dict(result, place_id=place_id))
+
+    def fetch_nearby_page(self, location, radius, types, pagetoken=None):
+        """Fetches a single page of nearby results; returns the raw response dict or None on error."""
+        return self._coalesce('nearby_page', f"{nearby_key(location, radius, types)}|{pagetoken or ''}",
+                              lambda: self._fetch_nearby_page(location, radius, types, pagetoken))
+
+    def nearby_request(self, location, radius, types, pagetoken=None):
+        """(endpoint URL, params) of one Nearby Search page."""
+        endpoint_url = f"{GOOGLE_MAPS_BASE_URL}/maps/api/place/nearbysearch/json"
         params = {
             'location': location,
             'radius': radius,
             'types': types,
             'key': self.apiKey
         }
+        if pagetoken:
+            params['pagetoken'] = pagetoken
+        return endpoint_url, params
+
+    def handle_nearby_page(self, location, types, results, pagetoken=None):
+        """
+        Checks a decoded nearby page and feeds it to the indexes; returns it, or None for a failed
+        call. A pagetoken call whose token is not usable yet is returned as is, to be retried.
+        """
+        if pagetoken and _token_not_ready(results):
+            return results
+        if results.get('status') not in PLACES_OK_STATUSES: # Errors come back as HTTP 200 with no results
+            print(f"Google Places API error for {location}: {results.get('status')} {results.get('error_message', '')}")
+            return None
+        self.record_nearby_results(results, types)
+        return results
+
+    def details_request(self, place_id, fields):
+        """(endpoint URL, params) of one Place Details call."""
+        endpoint_url = f"{GOOGLE_MAPS_BASE_URL}/maps/api/place/details/json"
+        params = {
+            'place_id': place_id, # Corrected from 'placeid'
+            'fields': ",".join(fields),
+            'key': self.apiKey
+        }
+        return endpoint_url, params
+
+    def handle_details(self, place_id, place_details):
+        """Feeds a decoded details response to the indexes and returns its 'result' part."""
+        self.record_details(place_id, place_details)
+        return place_details.get('result')
+
+    def _fetch_nearby_page(self, location, radius, types, pagetoken=None):
+        endpoint_url, params = self.nearby_request(location, radius, types, pagetoken)
+        if self.quota is not None and not self.quota.acquire('nearby'):
+            print(f"Google Places quota: nearby search throttled for {location}")
+            return None
         try:
-            res = requests.get(endpoint_url, params=params, timeout=10)
-            res.raise_for_status()  # Raise an exception for HTTP errors
-            results = res.json()
-            places.extend(results.get('results', []))
-            
-            # Handle pagination
-            page_count = 0 # Limit number of pages to avoid excessive calls
-            max_pages = 2 # Fetch initial + 2 more pages (total 3 pages of results)
-
-            while "next_page_token" in results and page_count < max_pages:
-                params['pagetoken'] = results['next_page_token']
-                time.sleep(2) # Google API requires a short delay before fetching the next page
-                res = requests.get(endpoint_url, params=params, timeout=10)
-                res.raise_for_status()
+            with timed('nearby_page'):
+                res = http_pool.get(endpoint_url, params=params)
+                res.raise_for_status()  # Raise an exception for HTTP errors
                 results = res.json()
-                places.extend(results.get('results', []))
-                page_count += 1
-                if 'next_page_token' not in results:
-                    break
+            return self.handle_nearby_page(location, types, results, pagetoken)
         except requests.exceptions.RequestException as e:
             print(f"Error during Google Places API request: {e}")
             return None # Or raise an error / return an error structure
         except json.JSONDecodeError as e:
             print(f"Error decoding JSON from Google Places API: {e}")
             return None
-        return places
 
-    def get_place_details(self, place_id, fields):
-        endpoint_url = "https://maps.googleapis.com/maps/api/place/details/json"
-        params = {
-            'place_id': place_id, # Corrected from 'placeid'
-            'fields': ",".join(fields),
-            'key': self.apiKey
-        }
+    def _get_place_details(self, place_id, fields):
+        endpoint_url, params = self.details_request(place_id, fields)
+        if self.quota is not None and not self.quota.acquire('details', details_sku(fields)):
+            print(f"Google Places quota: details throttled for {place_id}")
+            return None
         try:
-            res = requests.get(endpoint_url, params=params, timeout=10)
-            res.raise_for_status()
-            place_details = res.json()
-            return place_details.get('result') # Return the 'result' part
+            with timed('details'):
+                res = http_pool.get(endpoint_url, params=params)
+                res.raise_for_status()
+                place_details = res.json()
+            return self.handle_details(place_id, place_details) # Return the 'result' part
         except requests.exceptions.RequestException as e:
             print(f"Error fetching place details: {e}")
             return None
@@ -82,12 +255,24 @@ class GooglePlaces(object):
             print(f"Error decoding JSON for place details: {e}")
             return None
 
-google_places_api = GooglePlaces(GOOGLE_API_KEY)
+nearby_index = NearbyIndex()
+name_index = NameIndex()
+google_quota = QuotaLimiter() # Shared by Nearby, Details and Geocoding; budgets via QUOTA_*_QPS
+google_places_api = GooglePlaces(GOOGLE_API_KEY, cache=response_cache, place_index=nearby_index, name_index=name_index,
+                                 flights=upstream_flights, quota=google_quota, store=hospital_store)
+
+def _geocode(hospital_name):
+    if not google_quota.acquire('geocode'):
+        print(f"Geocoding quota: throttled for {hospital_name}")
+        return None
+    with timed('geocode'):
+        return gmaps_client.geocode(hospital_name)
 
 def get_hospital_coordinates(hospital_name):
     """Geocodes a hospital name to get latitude and longitude using googlemaps client."""
     try:
-        geocode_result = gmaps_client.geocode(hospital_name)
+        geocode_result = response_cache.get_or_load('geocode', geocode_key(hospital_name),
+                                                    lambda: _geocode(hospital_name))
         if geocode_result and len(geocode_result) > 0:
             lat = geocode_result[0]['geometry']['location']['lat']
             lon = geocode_result[0]['geometry']['location']['lng']
@@ -98,65 +283,398 @@ def get_hospital_coordinates(hospital_name):
         print(f"Error during geocoding {hospital_name}: {e}")
         return None, None
 
+# --- Response shaping ---
+NEARBY_FIELDS = ["name", "place_id", "rating", "user_ratings_total", "vicinity", "location"] # Keys of _simplify_place
+DETAILS_FIELDS = DETAILS_BASIC_FIELDS | DETAILS_CONTACT_FIELDS | DETAILS_ATMOSPHERE_FIELDS
+GZIP_MIN_SIZE = int(os.environ.get("GZIP_MIN_SIZE", "1024")) # Smaller bodies are sent uncompressed
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "5"))
+
+def _parse_fields(allowed, default=None, args=None):
+    """
+    Reads the comma-separated `fields` query param (from `args`, default: this request's).
+    Returns (fields, error message); fields is `default` when the param is absent.
+    """
+    raw = (request.args if args is None else args).get('fields')
+    if raw is None or not raw.strip():
+        return default, None
+    fields = []
+    for field in raw.split(','):
+        field = field.strip()
+        if field and field not in fields:
+            fields.append(field)
+    invalid = [field for field in fields if field not in allowed]
+    if invalid:
+        return None, f"Unsupported fields: {', '.join(invalid)}"
+    return fields, None
+
+def _radius_error(radius):
+    """Error message for a nearby search radius Google would not accept, or None."""
+    try:
+        radius = float(radius)
+    except ValueError:
+        return "Invalid radius parameter, expected meters"
+    if not 0 < radius <= NEARBY_MAX_RADIUS: # Also false for NaN
+        return f"radius must be more than 0 and at most {NEARBY_MAX_RADIUS} meters"
+    return None
+
+def _is_compact(args=None):
+    return (request.args if args is None else args).get('compact', '').lower() in ('1', 'true', 'yes')
+
+def _drop_empty(record):
+    return {key: value for key, value in record.items() if value not in (None, '', [], {})}
+
+def _shape_places(places, fields=None, compact=False):
+    """
+    Projects simplified places onto `fields`. Compact output is columnar:
+    {"fields": [...], "rows": [[...], ...]}, so keys are not repeated for every place.
+    """
+    fields = fields or NEARBY_FIELDS
+    if compact:
+        return {"fields": fields, "rows": [[place.get(field) for field in fields] for place in places]}
+    if fields == NEARBY_FIELDS:
+        return places
+    return [{field: place.get(field) for field in fields} for place in places]
+
+def _conditional_json(payload):
+    """JSON response with a weak ETag; answers 304 when the client's If-None-Match still matches."""
+    response = jsonify(payload)
+    response.add_etag(weak=True) # Weak, so the gzipped and plain bodies share one validator
+    return response.make_conditional(request)
+
+def _should_gzip(response, request_headers):
+    return (response.status_code == 200 and 'Content-Encoding' not in response.headers
+            and 'gzip' in request_headers.get('Accept-Encoding', '').lower()
+            and response.mimetype in ('application/json', 'text/plain'))
+
+@app.after_request
+def _gzip_response(response):
+    if response.is_streamed or response.direct_passthrough or not _should_gzip(response, request.headers):
+        return response
+    body = response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+# --- Non-blocking nearby pagination ---
+# Follow-up pages are fetched by a background scheduler once their page token is usable,
+# instead of sleeping in the request thread (opt-in via /hospital/nearby?mode=cursor|stream).
+PAGINATION_WORKERS = int(os.environ.get("PAGINATION_WORKERS", "4"))
+page_scheduler = DelayedExecutor(max_workers=PAGINATION_WORKERS, thread_name_prefix="nearby-pages")
+nearby_cursors = CursorStore()
+NEARBY_STREAM_PAGE_TIMEOUT = 30 # Seconds a stream waits for one scheduled page
+
+def _simplify_place(place):
+    """Simplified nearby entry: names, place_ids and location."""
+    return {
+        "name": place.get("name"),
+        "place_id": place.get("place_id"),
+        "rating": place.get("rating"),
+        "user_ratings_total": place.get("user_ratings_total"),
+        "vicinity": place.get("vicinity"),
+        "location": place.get("geometry", {}).get("location")
+    }
+
+def _schedule_next_page(location, radius, types, results, pages_fetched, places_so_far):
+    """
+    Schedules the page after `results` for when its token becomes usable and returns its cursor.
+    Returns None once the search is complete, caching the full result list.
+    """
+    if "next_page_token" not in results or pages_fetched >= NEARBY_MAX_PAGES:
+        google_places_api.record_coverage(location, radius, types, results, len(places_so_far))
+        if google_places_api.cache is not None:
+            google_places_api.cache.set('nearby', nearby_key(location, radius, types), places_so_far)
+        return None
+    future = page_scheduler.schedule(NEARBY_PAGE_TOKEN_DELAY, _fetch_scheduled_page, location, radius, types,
+                                     results['next_page_token'], pages_fetched, places_so_far, time.perf_counter())
+    return nearby_cursors.add(future, time.time() + NEARBY_PAGE_TOKEN_DELAY)
+
+def _fetch_scheduled_page(location, radius, types, pagetoken, pages_fetched, places_so_far, scheduled_at):
+    """Runs on the scheduler: fetches one follow-up page and schedules the one after it."""
+    observe_phase('nearby_page_wait', time.perf_counter() - scheduled_at)
+    results = google_places_api.fetch_nearby_page(location, radius, types, pagetoken)
+    for retry in range(NEARBY_PAGE_TOKEN_RETRIES):
+        if not _token_not_ready(results):
+            break
+        with timed('nearby_page_wait'):
+            time.sleep(NEARBY_PAGE_TOKEN_BACKOFF * 2 ** retry) # Rare; the token was not usable yet
+        results = google_places_api.fetch_nearby_page(location, radius, types, pagetoken)
+    if results is None or _token_not_ready(results): # Earlier pages were already served; nothing is cached
+        return {"results": None, "next_cursor": None}
+    page_places = results.get('results', [])
+    places_so_far = places_so_far + page_places
+    next_cursor = _schedule_next_page(location, radius, types, results, pages_fetched + 1, places_so_far)
+    return {"results": page_places, "next_cursor": next_cursor}
+
+def start_nearby_search(location, radius, types):
+    """
+    Returns (first page of places, cursor for the next page) without waiting on page tokens.
+    A fully cached search comes back whole with no cursor; places is None on upstream errors.
+    """
+    if google_places_api.cache is not None:
+        cached = google_places_api.cache.get('nearby', nearby_key(location, radius, types))
+        if cached is not MISSING:
+            return cached, None
+    results = google_places_api.fetch_nearby_page(location, radius, types)
+    if results is None:
+        return None, None
+    places = results.get('results', [])
+    return places, _schedule_next_page(location, radius, types, results, 1, places)
+
+def _nearby_cursor_response(cursor, fields=None, compact=False):
+    """Returns the page behind `cursor`, or 202 with a retry hint if it has not been fetched yet."""
+    future, ready_at = nearby_cursors.get(cursor)
+    if future is None:
+        return jsonify({"error": "Unknown or expired cursor"}), 404
+    if not future.done():
+        retry_after = max(0.25, ready_at - time.time())
+        response = jsonify({"results": [], "next_cursor": cursor, "retry_after": round(retry_after, 2)})
+        response.headers['Retry-After'] = str(int(retry_after + 0.999))
+        return response, 202
+    page = future.result()
+    if page['results'] is None:
+        return jsonify({"error": "Failed to fetch data from Google Places API or no results."}), 500
+    return jsonify({"results": _shape_places([_simplify_place(place) for place in page['results']], fields, compact),
+                    "next_cursor": page['next_cursor']})
+
+def _nearby_stream(places, next_cursor, fields=None, compact=False):
+    """Yields NDJSON lines, one per page, as the scheduler fetches them."""
+    page_number = 1
+    yield json.dumps({"page": page_number,
+                      "results": _shape_places([_simplify_place(place) for place in places], fields, compact)}) + "\n"
+    while next_cursor:
+        page_number += 1
+        future, _ = nearby_cursors.get(next_cursor)
+        if future is None:
+            yield json.dumps({"page": page_number, "error": "Pagination cursor expired"}) + "\n"
+            return
+        try:
+            page = future.result(timeout=NEARBY_STREAM_PAGE_TIMEOUT)
+        except Exception as e:
+            print(f"Error waiting for nearby page {page_number}: {e}")
+            page = {"results": None}
+        if page['results'] is None:
+            yield json.dumps({"page": page_number, "error": "Failed to fetch page from Google Places API"}) + "\n"
+            return
+        yield json.dumps({"page": page_number,
+                          "results": _shape_places([_simplify_place(place) for place in page['results']], fields, compact)}) + "\n"
+        next_cursor = page['next_cursor']
+
+# --- Local answers for /hospital/nearby ---
+NEARBY_INDEX_ENABLED = os.environ.get("NEARBY_INDEX_ENABLED", "1") == "1"
+NEARBY_INDEX_FILL_CELLS = int(os.environ.get("NEARBY_INDEX_FILL_CELLS", "4")) # Max uncovered cells searched on their own
+NEARBY_FILL_WORKERS = int(os.environ.get("NEARBY_FILL_WORKERS", "8")) # Threads running cell searches concurrently
+nearby_fill_executor = ThreadPoolExecutor(max_workers=NEARBY_FILL_WORKERS, thread_name_prefix="nearby-fill")
+
+def _cell_search_circles(cells):
+    """(location, radius) of the nearby search circumscribing each coverage cell."""
+    for i, j in cells:
+        centre_lat, centre_lon = (i + 0.5) * COVERAGE_CELL_DEG, (j + 0.5) * COVERAGE_CELL_DEG
+        cell_radius = float(haversine_m(centre_lat, centre_lon, i * COVERAGE_CELL_DEG, j * COVERAGE_CELL_DEG))
+        yield f"{centre_lat:.6f},{centre_lon:.6f}", str(int(math.ceil(cell_radius)))
+
+def _estimated_calls(lat, lon, radius_m, place_type):
+    """Nearby calls a search of the circle is expected to take, judging by the places already known in it."""
+    known = len(nearby_index.query(lat, lon, radius_m, place_type))
+    return min(NEARBY_MAX_PAGES, known // NEARBY_PAGE_SIZE + 1)
+
+def _fill_is_cheaper(lat, lon, radius_m, place_type, cells):
+    """
+    True if searching `cells` on their own should take no more calls than one search of the whole
+    circle, and should cover them: none is known to hold Google's result cap or more.
+    """
+    if len(cells) > NEARBY_INDEX_FILL_CELLS or nearby_index.any_dense(cells, place_type):
+        return False
+    fill_calls = 0
+    for cell_location, cell_radius in _cell_search_circles(cells):
+        cell_lat, cell_lon = [float(x) for x in cell_location.split(',')]
+        known = len(nearby_index.query(cell_lat, cell_lon, float(cell_radius), place_type))
+        if known >= NEARBY_RESULT_CAP:
+            return False
+        fill_calls += min(NEARBY_MAX_PAGES, known // NEARBY_PAGE_SIZE + 1)
+    return fill_calls <= _estimated_calls(lat, lon, radius_m, place_type)
+
+def plan_nearby_search(lat, lon, radius, place_type):
+    """
+    Decides, without calling Google, how a nearby query is answered: ('local', places) when the
+    circle is freshly covered (nearest first), ('fill', cells) when searching just the uncovered
+    cells is no dearer than searching the circle, or ('google', None) to search the whole circle.
+    """
+    try:
+        lat, lon, radius_m = float(lat), float(lon), float(radius)
+    except ValueError:
+        return 'google', None
+    if not NEARBY_INDEX_ENABLED:
+        return 'google', None
+    uncovered = nearby_index.uncovered_cells(lat, lon, radius_m, place_type)
+    if uncovered is None: # Too many cells to track; Google answers it
+        nearby_index.count_answer(local=False)
+        return 'google', None
+    if not uncovered:
+        nearby_index.count_answer(local=True)
+        return 'local', nearby_index.query(lat, lon, radius_m, place_type)
+    if _fill_is_cheaper(lat, lon, radius_m, place_type, uncovered):
+        return 'fill', uncovered
+    nearby_index.count_answer(local=False)
+    return 'google', None
+
+def answer_after_fill(lat, lon, radius, place_type, cells, searches):
+    """
+    The local answer once `cells` were searched (`searches` holds their results), or None if one
+    of those searches failed. The circle is not searched again after spending calls on its cells:
+    a cell whose own search still hit Google's cap is only marked dense, and the answer is what
+    the cells returned, which a capped search of the whole circle would not have beaten.
+    """
+    if any(places_data is None for places_data in searches):
+        return None
+    lat, lon, radius_m = float(lat), float(lon), float(radius)
+    uncovered = nearby_index.uncovered_cells(lat, lon, radius_m, place_type) or []
+    # Later queries search the whole circle instead of filling these cells again
+    nearby_index.mark_dense(set(cells) & set(uncovered), place_type)
+    nearby_index.count_answer(local=True)
+    return nearby_index.query(lat, lon, radius_m, place_type)
+
+def find_nearby_places(lat, lon, radius, place_type):
+    """
+    Simplified nearby places, answered from the local index when the circle is freshly covered
+    (nearest first). Otherwise the uncovered cells are searched on Google, concurrently, when
+    that should take no more calls than searching the circle; else the whole circle is searched.
+    Returns None on upstream errors.
+    """
+    action, value = plan_nearby_search(lat, lon, radius, place_type)
+    if action == 'local':
+        return value
+    if action == 'fill':
+        search = with_current_trace(with_current_priority(google_places_api.search_places_by_coordinate))
+        futures = [nearby_fill_executor.submit(search, cell_location, cell_radius, place_type)
+                   for cell_location, cell_radius in _cell_search_circles(value)]
+        return answer_after_fill(lat, lon, radius, place_type, value, [future.result() for future in futures])
+    places_data = google_places_api.search_places_by_coordinate(f"{lat},{lon}", radius, place_type)
+    return None if places_data is None else [_simplify_place(place) for place in places_data]
+
 @app.route('/hospital/nearby', methods=['GET'])
 def get_nearby_hospitals():
     """
     Fetches nearby hospitals based on latitude, longitude, and radius.
-    Query Params: lat, lon, radius (in meters), type (e.g., hospital)
+    Query Params: lat, lon, radius (in meters), type (e.g., hospital),
+                  mode (optional: 'cursor' returns page 1 plus a next_cursor immediately,
+                        'stream' streams pages as NDJSON as they become available),
+                  cursor (fetches a later page from a previous mode=cursor response),
+                  fields (optional: comma-separated subset of the place keys),
+                  compact (optional: 1 for columnar {"fields", "rows"} results)
     """
+    fields, error = _parse_fields(NEARBY_FIELDS)
+    if error:
+        return jsonify({"error": error}), 400
+    compact = _is_compact()
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        return _nearby_cursor_response(cursor, fields, compact)
+
     lat = request.args.get('lat')
     lon = request.args.get('lon')
     radius = request.args.get('radius', '5000') # Default 5km
     place_type = request.args.get('type', 'hospital') # Default type 'hospital'
+    mode = request.args.get('mode')
 
     if not lat or not lon:
         return jsonify({"error": "Missing latitude or longitude parameters"}), 400
+    if mode not in (None, 'cursor', 'stream'):
+        return jsonify({"error": "Invalid mode parameter, expected 'cursor' or 'stream'"}), 400
+    error = _radius_error(radius)
+    if error:
+        return jsonify({"error": error}), 400
     
     location = f"{lat},{lon}"
     
     if GOOGLE_API_KEY == "YOUR_GOOGLE_API_KEY_PLACEHOLDER":
         return jsonify({"error": "Google API Key not configured on the server."}), 500
 
-    places_data = google_places_api.search_places_by_coordinate(location, radius, place_type)
+    if mode:
+        places_data, next_cursor = start_nearby_search(location, radius, place_type)
+        if places_data is None:
+            return jsonify({"error": "Failed to fetch data from Google Places API or no results."}), 500
+        if mode == 'stream':
+            return Response(_nearby_stream(places_data, next_cursor, fields, compact), mimetype='application/x-ndjson')
+        return jsonify({"results": _shape_places([_simplify_place(place) for place in places_data], fields, compact),
+                        "next_cursor": next_cursor})
 
-    if places_data is None:
-        return jsonify({"error": "Failed to fetch data from Google Places API or no results."}), 500
-    
     # Simplified response: list of names and place_ids
-    hospitals = []
-    for place in places_data:
-        hospitals.append({
-            "name": place.get("name"),
-            "place_id": place.get("place_id"),
-            "rating": place.get("rating"),
-            "user_ratings_total": place.get("user_ratings_total"),
-            "vicinity": place.get("vicinity"),
-            "location": place.get("geometry", {}).get("location")
-        })
-    return jsonify(hospitals)
+    hospitals = find_nearby_places(lat, lon, radius, place_type)
+
+    if hospitals is None:
+        return jsonify({"error": "Failed to fetch data from Google Places API or no results."}), 500
+    return _conditional_json(_shape_places(hospitals, fields, compact))
+
+HOSPITAL_DETAILS_FIELDS = ['name', 'website', 'formatted_phone_number', 'rating', 'reviews', 'vicinity', 'geometry']
 
 @app.route('/hospital/details', methods=['GET'])
 def get_hospital_details_endpoint():
     """
     Fetches details for a specific hospital using its place_id.
-    Query Params: place_id
+    Query Params: place_id,
+                  fields (optional: comma-separated Places details fields to request from Google,
+                          default: HOSPITAL_DETAILS_FIELDS),
+                  compact (optional: 1 to omit empty values)
+    Responses carry an ETag; a matching If-None-Match gets 304.
     """
     place_id = request.args.get('place_id')
     if not place_id:
         return jsonify({"error": "Missing place_id parameter"}), 400
+    fields, error = _parse_fields(DETAILS_FIELDS, default=HOSPITAL_DETAILS_FIELDS)
+    if error:
+        return jsonify({"error": error}), 400
 
     if GOOGLE_API_KEY == "YOUR_GOOGLE_API_KEY_PLACEHOLDER":
         return jsonify({"error": "Google API Key not configured on the server."}), 500
 
-    fields = ['name', 'website', 'formatted_phone_number', 'rating', 'reviews', 'vicinity', 'geometry']
-    details = google_places_api.get_place_details(place_id, fields)
+    details = google_places_api.get_place_details(place_id, fields) # Fewer fields can mean a cheaper SKU
 
     if details:
-        return jsonify(details)
+        return _conditional_json(_drop_empty(details) if _is_compact() else details)
     else:
         return jsonify({"error": "Could not retrieve details for the given place_id"}), 404
 
 
+# --- Concurrent detail lookups for name matching ---
+DETAILS_POOL_SIZE = int(os.environ.get("DETAILS_POOL_SIZE", "32")) # Shared by all requests
+FIND_BY_NAME_CONCURRENCY = int(os.environ.get("FIND_BY_NAME_CONCURRENCY", "4")) # Per-request cap on in-flight details calls
+details_executor = ThreadPoolExecutor(max_workers=DETAILS_POOL_SIZE, thread_name_prefix="place-details")
+
+def _names_match(query_name, name):
+    """Fuzzy match on normalized names (see name_match.py)."""
+    return name_similarity(query_name, name) >= NAME_MATCH_THRESHOLD
+
+def first_matching_details(candidates, query_name, fields, max_in_flight=None):
+    """
+    Fetches details for `candidates` (in ranking order) on the shared details pool and
+    returns the first one, in ranking order, whose detailed name still matches.
+    At most `max_in_flight` lookups are outstanding per call; lookups queued behind a
+    confirmed match are cancelled (ones already running just finish into the cache).
+    """
+    max_in_flight = max_in_flight or FIND_BY_NAME_CONCURRENCY
+    futures = {} # candidate index -> future
+    next_to_submit = 0
+    try:
+        for index in range(len(candidates)):
+            # Keep a window of up to max_in_flight lookups running ahead of the one we wait on
+            while next_to_submit < len(candidates) and next_to_submit < index + max_in_flight:
+                futures[next_to_submit] = details_executor.submit(
+                    with_current_trace(with_current_priority(google_places_api.get_place_details)),
+                    candidates[next_to_submit]['place_id'], fields)
+                next_to_submit += 1
+            details = futures.pop(index).result()
+            # Check again if the detailed name is a better match
+            if details and _names_match(query_name, details.get('name', '')):
+                return details
+        return None
+    finally:
+        for future in futures.values():
+            future.cancel()
+
 @app.route('/hospital/find_by_name', methods=['GET'])
 def find_hospital_by_name():
     """
@@ -173,222 +691,185 @@ def find_hospital_by_name():
     if GOOGLE_API_KEY == "YOUR_GOOGLE_API_KEY_PLACEHOLDER":
         return jsonify({"error": "Google API Key not configured on the server."}), 500
 
+    payload, status = resolve_hospital_by_name(hospital_name_query, place_type)
+    return jsonify(payload), status
+
+FIND_BY_NAME_RADIUS = "500" # The original notebook used "200" meter radius for name search; increased slightly
+FIND_BY_NAME_FIELDS = ['name', 'website', 'formatted_phone_number', 'rating', 'reviews', 'vicinity', 'geometry', 'place_id']
+
+def resolve_hospital_by_name(hospital_name_query, place_type='hospital'):
+    """
+    Geocodes the name, searches nearby, and tries to match the name.
+    Returns (response dict, HTTP status) so it can run outside a request context.
+    """
     lat, lon = get_hospital_coordinates(hospital_name_query)
 
     if not lat or not lon:
-        return jsonify({"error": f"Could not geocode hospital name: {hospital_name_query}"}), 404
+        return {"error": f"Could not geocode hospital name: {hospital_name_query}"}, 404
 
     # Search in a smaller radius around the geocoded point
-    # The original notebook used "200" meter radius for name search.
-    nearby_places = google_places_api.search_places_by_coordinate(f"{lat},{lon}", "500", place_type) # Increased radius slightly
+    nearby_places = google_places_api.search_places_by_coordinate(f"{lat},{lon}", FIND_BY_NAME_RADIUS, place_type)
 
     if nearby_places is None:
-        return jsonify({"error": "Failed to fetch data from Google Places API after geocoding."}), 500
+        return {"error": "Failed to fetch data from Google Places API after geocoding."}, 500
     
-    found_hospital_details = None
-    for place in nearby_places:
-        # Normalize names for comparison (lower case, remove common terms if needed)
-        place_name_normalized = place.get('name', '').lower()
-        query_name_normalized = hospital_name_query.lower()
-        
-        # Simple exact match or containment check
-        if query_name_normalized in place_name_normalized or place_name_normalized in query_name_normalized :
-            fields = ['name', 'website', 'formatted_phone_number', 'rating', 'reviews', 'vicinity', 'geometry', 'place_id']
-            details = google_places_api.get_place_details(place['place_id'], fields)
-            if details:
-                # Check again if the detailed name is a better match
-                detailed_name_normalized = details.get('name','').lower()
-                if query_name_normalized in detailed_name_normalized or detailed_name_normalized in query_name_normalized:
-                    found_hospital_details = details
-                    break # Found a good match
+    # Candidates are ranked by name similarity and only those close to the best score are kept,
+    # so usually just the top candidate gets a details call
+    candidates = name_index.rank(hospital_name_query, nearby_places)
+    found_hospital_details = first_matching_details(candidates, hospital_name_query, FIND_BY_NAME_FIELDS)
     
     if found_hospital_details:
-        return jsonify(found_hospital_details)
+        return found_hospital_details, 200
+    else:
+        return _potential_matches(hospital_name_query, nearby_places), 200 # 200 because we are returning potential matches
+
+def _potential_matches(hospital_name_query, nearby_places):
+    """
+    Fallback: return list of nearby places if no exact match by name was confirmed
+    This provides some results even if the precise name match failed.
+    """
+    hospitals = []
+    for place in nearby_places:
+        hospitals.append({
+            "name": place.get("name"),
+            "place_id": place.get("place_id"),
+            "rating": place.get("rating"),
+            "vicinity": place.get("vicinity")
+        })
+    return {
+        "message": f"Exact match for '{hospital_name_query}' not found. Returning nearby places.",
+        "potential_matches": hospitals
+    }
+
+# --- Bulk lookups ---
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "500"))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "16"))
+BATCH_RATE_LIMIT = float(os.environ.get("BATCH_RATE_LIMIT", "20")) # Items started per second, across all batches
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+batch_rate_limiter = RateLimiter(BATCH_RATE_LIMIT)
+
+# Every thread that can call Google at once keeps its own pooled connection, instead of the
+# pool discarding the extra ones after each burst of details lookups
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", "16")) # Request threads of the WSGI server (e.g. gunicorn --threads)
+GOOGLE_CALLER_THREADS = (SERVER_THREADS + DETAILS_POOL_SIZE + BATCH_WORKERS + PAGINATION_WORKERS + NEARBY_FILL_WORKERS
+                         + REFRESH_WORKERS)
+http_pool.set_pool_size(GOOGLE_MAPS_BASE_URL, max(http_pool.pool_maxsize, GOOGLE_CALLER_THREADS))
+
+def _resolve_batch_item(kind, value, place_type):
+    """Resolves one batch entry to an NDJSON-ready dict with a per-item status or error."""
+    batch_rate_limiter.acquire()
+    try:
+        with priority_class('batch'): # Interactive requests are served Google quota first
+            if kind == 'place_id':
+                details = google_places_api.get_place_details(value, HOSPITAL_DETAILS_FIELDS)
+                if details:
+                    payload, status = details, 200
+                else:
+                    payload, status = {"error": "Could not retrieve details for the given place_id"}, 404
+            else:
+                payload, status = resolve_hospital_by_name(value, place_type)
+    except Exception as e:
+        print(f"Error resolving batch {kind} {value}: {e}")
+        payload, status = {"error": f"Internal error: {e}"}, 500
+    item = {"kind": kind, "input": value, "status": status}
+    if status == 200:
+        item["result"] = payload
     else:
-        # Fallback: return list of nearby places if no exact match by name was confirmed
-        # This provides some results even if the precise name match failed.
-        hospitals = []
-        for place in nearby_places:
-            hospitals.append({
-                "name": place.get("name"),
-                "place_id": place.get("place_id"),
-                "rating": place.get("rating"),
-                "vicinity": place.get("vicinity")
-            })
-        return jsonify({
-            "message": f"Exact match for '{hospital_name_query}' not found. Returning nearby places.",
-            "potential_matches": hospitals
-        }), 200 # 200 because we are returning potential matches
+        item["error"] = payload.get("error")
+    return item
+
+def _batch_stream(futures, started):
+    """Yields one NDJSON line per item as it completes, then a summary line."""
+    errors = 0
+    try:
+        for future in as_completed(futures):
+            item = future.result()
+            errors += item["status"] != 200
+            yield json.dumps(item) + "\n"
+    finally:
+        for future in futures:
+            future.cancel() # Client went away; drop work that has not started
+    yield json.dumps({"done": True, "items": len(futures), "errors": errors,
+                      "elapsed_ms": round((time.time() - started) * 1000, 1)}) + "\n"
+
+@app.route('/hospital/batch', methods=['POST'])
+def batch_hospital_lookup():
+    """
+    Resolves many hospital names and/or place_ids in one request.
+    JSON body: {"names": [...], "place_ids": [...], "type": "hospital"}
+    Duplicates are resolved once. Results stream back as NDJSON in completion order,
+    one line per item with its own status, followed by a summary line.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object body"}), 400
+    names = body.get('names') or []
+    place_ids = body.get('place_ids') or []
+    place_type = body.get('type', 'hospital')
+    if not isinstance(names, list) or not isinstance(place_ids, list):
+        return jsonify({"error": "'names' and 'place_ids' must be lists"}), 400
+
+    # Dedupe: names by their normalized form, place_ids exactly; keep first-seen order
+    items = {}
+    for name in names:
+        if isinstance(name, str) and name.strip():
+            items.setdefault(('name', geocode_key(name)), name.strip())
+    for place_id in place_ids:
+        if isinstance(place_id, str) and place_id.strip():
+            items.setdefault(('place_id', place_id.strip()), place_id.strip())
+    if not items:
+        return jsonify({"error": "Provide at least one name or place_id"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items: {len(items)} (max {BATCH_MAX_ITEMS})"}), 400
+
+    if GOOGLE_API_KEY == "YOUR_GOOGLE_API_KEY_PLACEHOLDER":
+        return jsonify({"error": "Google API Key not configured on the server."}), 500
+
+    started = time.time()
+    futures = [batch_executor.submit(_resolve_batch_item, kind, value, place_type)
+               for (kind, _), value in items.items()]
+    return Response(_batch_stream(futures, started), mimetype='application/x-ndjson')
 
 # --- Lybrate Doctor Scraping Functionality ---
 def scrape_lybrate_doctors(city, specialty, page=1):
     """
     Scrapes doctor information from Lybrate for a given city, specialty, and page number.
+    Concurrent scrapes of the same page share one fetch.
     """
-    doctors_data = []
+    return upstream_flights.do('lybrate', (city, specialty, str(page)),
+                               lambda: _scrape_lybrate_doctors(city, specialty, page))
+
+LYBRATE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def _lybrate_page_url(city, specialty, page):
     # Construct URL: lybrate.com/{city}/{specialty}
     # The specialty string from the notebook often included counts like "Dentistry(665)"
     # We need to clean it up for URL construction if it comes in that format.
     # For this API, we expect a clean specialty string like "dentist", "gynaecologist".
-    base_url = f"https://www.lybrate.com/{city.lower().replace(' ', '-')}/{specialty.lower().replace(' ', '-')}"
-    page_url = f"{base_url}?page={page}"
-
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+    base_url = f"{LYBRATE_BASE_URL}/{city.lower().replace(' ', '-')}/{specialty.lower().replace(' ', '-')}"
+    return f"{base_url}?page={page}"
 
+def _scrape_lybrate_doctors(city, specialty, page):
+    page_url = _lybrate_page_url(city, specialty, page)
     try:
-        response = requests.get(page_url, headers=headers, timeout=15)
-        response.raise_for_status() # Check for HTTP errors
+        with timed('lybrate_fetch'):
+            response = http_pool.get(page_url, headers=LYBRATE_HEADERS)
+            response.raise_for_status() # Check for HTTP errors
     except requests.exceptions.RequestException as e:
         print(f"Error fetching Lybrate page {page_url}: {e}")
         return {"error": f"Could not fetch Lybrate page: {str(e)}", "doctors": []}
+    return _lybrate_page_result(response.content, city, specialty, page_url)
 
-    soup = BeautifulSoup(response.content, 'lxml') # Using lxml as it's generally faster
+def _lybrate_page_result(content, city, specialty, page_url):
+    """Parses a fetched listing page into the /doctors/lybrate response and adds its doctors to the dataset."""
+    # Single pass per card over the listing container only; see lybrate_parser for the selectors
+    doctors_data, potential_cards = parse_doctor_cards(content, city, specialty)
+    doctor_store.ingest(doctors_data)
 
-    # The structure from Doctor_rating_lr.ipynb:
-    # soup.find('div', {'class': 'grid__col-lt-20 lybMar-top-btm--half lybPad-left-right--quar'})
-    # then grid_cells = required_html.findAll('div', {'class': 'grid'})
-    # This structure might change. Let's try a more direct approach to find doctor cards.
-    # Common pattern for doctor cards on Lybrate: look for elements with itemprop="itemListElement" or similar
-    
-    # Attempting to find doctor cards. Lybrate's class names can be dynamic or complex.
-    # The notebook used 'grid' class, which is very generic.
-    # Let's look for a container that holds multiple doctor profiles.
-    # Based on typical Lybrate structure, doctor profiles are often within <div> elements
-    # that have specific classes or attributes. The notebook's selector was:
-    # 'div.grid__col-lt-20 > div.grid' (implicitly)
-    
-    # Updated selector strategy: find elements that are likely individual doctor cards.
-    # This might need adjustment if Lybrate's HTML structure has changed significantly.
-    doctor_cards_container = soup.find('div', class_=re.compile(r'grid__col-lt-20')) # Looser match for main container
-    if not doctor_cards_container:
-        doctor_cards_container = soup # Fallback to search whole soup if specific container not found
-
-    # Try to find individual doctor entries. The notebook used very generic 'div' with class 'grid'.
-    # This is highly prone to breaking. A more specific selector is needed.
-    # For example, if each doctor has a specific 'itemtype="http://schema.org/Physician"'
-    # Or a class like 'doctor-profile-card' (hypothetical)
-
-    # The notebook's logic for extracting details:
-    # heading = grid_cell.find('h2', {'itemprop': 'name'})
-    # name_link = heading.find('a')
-    # name = name_link.get_text().strip()
-    # profile_link = name_link['href']
-    # degree_tag = grid_cell.find('div', {'class': 'lybEllipsis ly-doctor__degree grid__col-20'})
-    # address_tag = grid_cell.find('span', {'itemprop': 'streetAddress'})
-    # right_part = grid_cell.findAll('div', {'class': 'grid__col-xs-10 grid--direction-row'}) for rating, exp, charges
-
-    # Let's try to find elements that are likely to be doctor cards.
-    # Often these are <article> tags or <div>s with specific schema.org attributes.
-    # The class 'grid' is too generic.
-    # Looking for elements that might contain an <h2> with itemprop="name"
-    
-    potential_cards = doctor_cards_container.find_all('div', class_=lambda x: x and 'ly-doctor' in x) # Heuristic
-    if not potential_cards: # Fallback to a more generic search if the above fails
-        # This is closer to the notebook's very broad 'grid' search, but we need to be careful.
-        # The notebook's `grid_cells = required_html.findAll('div', {'class': 'grid'})`
-        # followed by `if grid_cell['class'][0] != 'grid' or len(grid_cell['class']) != 1: continue`
-        # implies it was looking for <div class="grid"> specifically.
-        potential_cards = doctor_cards_container.find_all('div', class_='grid')
-
-
-    for card in potential_cards:
-        # The notebook's filter: `if grid_cell['class'][0] != 'grid' or len(grid_cell['class']) != 1: continue`
-        # This was to ensure it's exactly `class="grid"`. We need to be careful applying this if class list is longer.
-        if not (card.get('class') and card.get('class') == ['grid']): # Trying to replicate the notebook's specific filter
-            # If this filter is too strict, many valid cards might be skipped.
-            # Consider removing or adjusting if no results are found.
-            # print(f"Skipping card due to class filter: {card.get('class')}")
-            pass # Allow to proceed to try and extract, but be mindful this might pick up wrong divs
-
-
-        name_tag = card.find('h2', itemprop='name')
-        if not name_tag or not name_tag.find('a'):
-            continue # Skip if essential name link is missing
-
-        name_link_tag = name_tag.find('a')
-        name = name_link_tag.get_text(strip=True)
-        profile_link = name_link_tag.get('href', '')
-        if not profile_link.startswith('http'):
-            profile_link = "https://www.lybrate.com" + profile_link if profile_link.startswith('/') else ""
-        
-        scraped_city = profile_link.split('/')[3] if len(profile_link.split('/')) > 3 else city # Extract city from URL if possible
-
-        degree_tag = card.find('div', class_=re.compile(r'ly-doctor__degree'))
-        degree = degree_tag.get_text(strip=True).replace('\n', ' ').replace(',', ';') if degree_tag else "N/A"
-
-        address_tag = card.find('span', itemprop='streetAddress')
-        address = address_tag.get_text(strip=True).replace('\n', ' ').replace(',', ';') if address_tag else "N/A"
-        
-        rating = "0%"
-        experience = "0 years experience"
-        charges = "N/A"
-
-        # Extracting rating, experience, charges (from 'grid__col-xs-10 grid--direction-row')
-        # This part is tricky as class names can be very specific or change.
-        # The notebook used: `right_part = grid_cell.findAll('div', {'class': 'grid__col-xs-10 grid--direction-row'})`
-        # This selector is also quite generic.
-        
-        # Attempting to find the block containing rating/experience/charges
-        # These are often in a separate div or spans.
-        # Let's look for text patterns.
-        
-        # Votes/Rating (e.g., "95% (123 votes)")
-        rating_tag = card.find('span', class_=re.compile(r'lybRating')) # Common class for ratings
-        if rating_tag and rating_tag.find('span', class_=re.compile(r'lybRating__percentage')):
-            rating_text = rating_tag.find('span', class_=re.compile(r'lybRating__percentage')).get_text(strip=True)
-            votes_text_tag = rating_tag.find('span', class_=re.compile(r'lybRating__count'))
-            votes_text = votes_text_tag.get_text(strip=True) if votes_text_tag else ""
-            rating = f"{rating_text} {votes_text}".strip()
-        else: # Fallback to notebook's method if specific rating class not found
-            # This requires iterating through multiple divs as in the notebook
-            info_blocks = card.find_all('div', class_=re.compile(r'grid__col-xs-10')) # General info blocks
-            for block in info_blocks:
-                block_text = block.get_text(strip=True)
-                if '%' in block_text and 'vote' in block_text.lower(): # Heuristic for rating
-                    rating = block_text.replace('\n', ' ')
-                    break 
-        
-        # Experience
-        experience_tag = card.find(string=re.compile(r'\d+ Years Experience', re.IGNORECASE))
-        if experience_tag:
-            experience = experience_tag.strip()
-        else: # Fallback
-            info_blocks = card.find_all('div', class_=re.compile(r'grid__col-xs-10'))
-            for block in info_blocks:
-                block_text = block.get_text(strip=True)
-                if 'experience' in block_text.lower():
-                    experience = block_text.replace('\n', ' ')
-                    break
-        
-        # Consultation Fee / Charges
-        fee_tag = card.find('span', itemprop='priceRange')
-        if fee_tag:
-            charges = fee_tag.get_text(strip=True)
-        else: # Fallback
-            info_blocks = card.find_all('div', class_=re.compile(r'grid__col-xs-10'))
-            for block in info_blocks:
-                block_text = block.get_text(strip=True)
-                if '₹' in block_text or 'consultation fee' in block_text.lower():
-                    charges = block_text.replace('\n', ' ')
-                    break
-        
-        if name: # Only add if a name was found
-            doctors_data.append({
-                "name": name,
-                "profile_link": profile_link,
-                "degree": degree,
-                "address": address,
-                "rating_votes": rating,
-                "experience": experience,
-                "charges": charges,
-                "scraped_specialty": specialty, # The specialty used for search
-                "scraped_city": scraped_city
-            })
-            
     if not doctors_data and potential_cards:
-         print(f"Warning: Found {len(potential_cards)} potential doctor cards but extracted no data. Check selectors for page {page_url}")
+         print(f"Warning: Found {potential_cards} potential doctor cards but extracted no data. Check selectors for page {page_url}")
     elif not potential_cards:
          print(f"Warning: No potential doctor cards found on page {page_url}. Check main card container selector.")
 
@@ -411,17 +892,295 @@ def get_lybrate_doctors():
     if not city or not specialty:
         return jsonify({"error": "Missing city or specialty parameters"}), 400
 
-    # Basic input cleaning for URL
-    city_clean = re.sub(r'[^a-zA-Z0-9\s-]', '', city).strip().lower()
-    specialty_clean = re.sub(r'[^a-zA-Z0-9\s-]', '', specialty).strip().lower()
-    
-    # Replace spaces with hyphens for URL
-    city_url_part = city_clean.replace(' ', '-')
-    specialty_url_part = specialty_clean.replace(' ', '-')
+    scraped_data = scrape_lybrate_doctors(_lybrate_url_part(city), _lybrate_url_part(specialty), page)
+    return jsonify(scraped_data)
 
+def _lybrate_url_part(text):
+    """Basic input cleaning for URL: drops special characters, lowercases, replaces spaces with hyphens."""
+    return re.sub(r'[^a-zA-Z0-9\s-]', '', text).strip().lower().replace(' ', '-')
 
-    scraped_data = scrape_lybrate_doctors(city_url_part, specialty_url_part, page)
-    return jsonify(scraped_data)
+# --- Lybrate crawl jobs ---
+CRAWL_MAX_TARGETS = 1000
+crawl_manager = CrawlManager(scrape_lybrate_doctors)
+
+def _crawl_text(entry, field):
+    value = entry.get(field)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"'{field}' must be a string")
+    return value
+
+def _crawl_page(entry, field, default):
+    value = entry.get(field, default)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    raise ValueError(f"'{field}' must be a whole number")
+
+def _parse_crawl_target(entry):
+    """
+    Builds a CrawlTarget from {"city", "specialty"} or a notebook-style {"link": "https://www.lybrate.com/<city>/<specialty>"},
+    with optional "first_page" (default 1) and "last_page" (default 9).
+    """
+    if not isinstance(entry, dict):
+        raise ValueError("must be an object")
+    city, specialty, link = _crawl_text(entry, 'city'), _crawl_text(entry, 'specialty'), _crawl_text(entry, 'link')
+    if link:
+        path_parts = [part for part in urlsplit(link).path.split('/') if part]
+        if len(path_parts) < 2:
+            raise ValueError(f"'link' must look like https://www.lybrate.com/<city>/<specialty>, got {link}")
+        city, specialty = path_parts[0], path_parts[1]
+    if not city or not specialty:
+        raise ValueError("needs 'city' and 'specialty', or a 'link'")
+    first_page = _crawl_page(entry, 'first_page', 1)
+    last_page = _crawl_page(entry, 'last_page', 9)
+    if first_page < 1:
+        raise ValueError("'first_page' must be 1 or more")
+    if last_page < first_page or last_page - first_page >= MAX_PAGES_PER_TARGET:
+        raise ValueError(f"'last_page' must be from first_page to first_page + {MAX_PAGES_PER_TARGET - 1}, "
+                         f"got {first_page}-{last_page}")
+    return CrawlTarget(_lybrate_url_part(city), _lybrate_url_part(specialty), first_page, last_page)
+
+@app.route('/doctors/lybrate/crawl', methods=['POST'])
+def start_lybrate_crawl():
+    """
+    Starts a background crawl over many (city, specialty, page range) targets.
+    JSON body: {"targets": [{"city": "delhi", "specialty": "dentist", "first_page": 1, "last_page": 9}, ...]}
+    Returns 202 with the job id; poll /doctors/lybrate/crawl/<job_id> for progress.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('targets'), list) or not body['targets']:
+        return jsonify({"error": "Expected a JSON body with a non-empty 'targets' list"}), 400
+    if len(body['targets']) > CRAWL_MAX_TARGETS:
+        return jsonify({"error": f"Too many targets: {len(body['targets'])} (max {CRAWL_MAX_TARGETS})"}), 400
+    targets = []
+    for i, entry in enumerate(body['targets']):
+        try:
+            targets.append(_parse_crawl_target(entry))
+        except ValueError as e:
+            return jsonify({"error": f"targets[{i}]: {e}"}), 400
+
+    # Duplicate links were skipped in the notebook too
+    unique_targets = OrderedDict()
+    for target in targets:
+        unique_targets.setdefault((target.city, target.specialty), target)
+    job = crawl_manager.submit(list(unique_targets.values()))
+    return jsonify({"job_id": job.job_id, "status": job.status,
+                    "status_url": f"/doctors/lybrate/crawl/{job.job_id}"}), 202
+
+@app.route('/doctors/lybrate/crawl/<job_id>', methods=['GET'])
+def get_lybrate_crawl_status(job_id):
+    """
+    Reports status and progress of a crawl job; output_path is set once it is done.
+    """
+    job = crawl_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown crawl job"}), 404
+    return jsonify(job.to_dict())
+
+# --- Dataset queries (columnar store of everything scraped) ---
+DATASET_MAX_LIMIT = 500
+DOCTOR_QUERY_FIELDS = ["name", "profile_link", "degree", "address", "scraped_city", "scraped_specialty",
+                       "rating_percent", "votes", "experience_years", "fee", "score"]
+HOSPITAL_QUERY_FIELDS = ["place_id", "name", "vicinity", "type", "rating", "user_ratings_total",
+                         "lat", "lng", "score", "distance_m"]
+
+def _number_arg(name, cast=float):
+    """Optional numeric query param; raises ValueError with a client-facing message."""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        number = cast(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} parameter")
+    if math.isnan(number):
+        raise ValueError(f"Invalid {name} parameter")
+    return number
+
+def _page_args():
+    limit = _number_arg('limit', int)
+    offset = _number_arg('offset', int) or 0
+    limit = 20 if limit is None else limit
+    if not 1 <= limit <= DATASET_MAX_LIMIT or offset < 0:
+        raise ValueError(f"limit must be 1-{DATASET_MAX_LIMIT} and offset non-negative")
+    return limit, offset
+
+@app.route('/doctors/search', methods=['GET'])
+def search_doctors():
+    """
+    Filters and ranks doctors already scraped from Lybrate, without scraping again.
+    Query Params: city, specialty, min_rating (percent), min_votes, max_fee, min_experience (years),
+                  sort ('score' (default, rating weighted by votes), 'rating', 'votes', 'experience', 'fee'),
+                  limit (default 20), offset, fields, compact
+    """
+    sort = request.args.get('sort', 'score')
+    if sort not in DoctorStore.SORTS:
+        return jsonify({"error": f"Invalid sort parameter, expected one of {', '.join(DoctorStore.SORTS)}"}), 400
+    fields, error = _parse_fields(DOCTOR_QUERY_FIELDS,
+                                  [field for field in DOCTOR_QUERY_FIELDS if field != 'score' or sort == 'score'])
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        limit, offset = _page_args()
+        filters = {name: _number_arg(name) for name in ('min_rating', 'min_votes', 'max_fee', 'min_experience')}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    city, specialty = request.args.get('city'), request.args.get('specialty')
+
+    doctors, total = doctor_store.query(city=_lybrate_url_part(city) if city else None,
+                                        specialty=_lybrate_url_part(specialty) if specialty else None,
+                                        sort=sort, limit=limit, offset=offset, **filters)
+    return jsonify({"total": total, "results": _shape_places(doctors, fields, _is_compact())})
+
+@app.route('/hospital/top', methods=['GET'])
+def top_hospitals():
+    """
+    Ranks places already seen in Places responses, without calling Google.
+    Query Params: lat, lon, radius (meters; all three to restrict to a circle), type,
+                  min_rating, min_reviews, sort ('score' (default, rating weighted by review count), 'rating', 'reviews'),
+                  limit (default 20), offset, fields, compact
+    """
+    sort = request.args.get('sort', 'score')
+    if sort not in HospitalStore.SORTS:
+        return jsonify({"error": f"Invalid sort parameter, expected one of {', '.join(HospitalStore.SORTS)}"}), 400
+    try:
+        limit, offset = _page_args()
+        lat, lon, radius = _number_arg('lat'), _number_arg('lon'), _number_arg('radius')
+        min_rating, min_reviews = _number_arg('min_rating'), _number_arg('min_reviews')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if (lat is None) != (lon is None):
+        return jsonify({"error": "lat and lon must be given together"}), 400
+    if lat is not None and radius is None:
+        radius = 5000.0 # Same default as /hospital/nearby
+    fields, error = _parse_fields(HOSPITAL_QUERY_FIELDS,
+                                  [field for field in HOSPITAL_QUERY_FIELDS
+                                   if (field != 'score' or sort == 'score') and (field != 'distance_m' or lat is not None)])
+    if error:
+        return jsonify({"error": error}), 400
+
+    places, total = hospital_store.query(lat=lat, lon=lon, radius=radius, place_type=request.args.get('type'),
+                                         min_rating=min_rating, min_reviews=min_reviews,
+                                         sort=sort, limit=limit, offset=offset)
+    return jsonify({"total": total, "results": _shape_places(places, fields, _is_compact())})
+
+@app.route('/dataset/stats', methods=['GET'])
+def get_dataset_stats():
+    """
+    Reports rows, unflushed rows, Parquet parts and category counts of the doctor and hospital stores.
+    """
+    return jsonify({"doctors": doctor_store.table.stats(), "hospitals": hospital_store.table.stats()})
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """
+    Reports size, hits, misses and evictions of the response cache per lookup kind.
+    """
+    return jsonify(response_cache.stats())
+
+@app.route('/quota/stats', methods=['GET'])
+def get_quota_stats():
+    """
+    Reports Google calls, rejections, throttling waits and estimated spend per SKU, and queue depth per budget.
+    """
+    return jsonify(google_quota.stats())
+
+@app.route('/upstream/coalescing/stats', methods=['GET'])
+def get_coalescing_stats():
+    """
+    Reports upstream calls made, calls coalesced into an in-flight one, and failures, per lookup kind.
+    """
+    return jsonify(upstream_flights.stats())
+
+@app.route('/hospital/index/stats', methods=['GET'])
+def get_nearby_index_stats():
+    """
+    Reports places held in the local nearby index and how often it answered locally.
+    """
+    return jsonify(nearby_index.stats())
+
+# --- Request metrics ---
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    if TRACE_ALL_REQUESTS or request.headers.get(TRACE_HEADER) == "1":
+        start_trace()
+    profiler.track()
+
+@app.after_request
+def _record_request_metrics(response):
+    # Streamed bodies (NDJSON) are timed until their first byte, not until the stream ends
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_latency.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    trace = end_trace()
+    if trace:
+        response.headers['Server-Timing'] = server_timing(trace)
+    return response
+
+@app.teardown_request
+def _stop_request_profiling(exc):
+    profiler.untrack()
+
+def _stats_samples():
+    """Counters and gauges from the cache, coalescing, quota and nearby index stats, in text format."""
+    blocks = []
+    cache_stats = response_cache.stats()
+    for counter in ("hits", "stale_hits", "misses", "evictions"):
+        blocks.append(render_samples(f"response_cache_{counter}_total", "counter", f"Response cache {counter} per lookup kind.",
+                                     [({"kind": kind}, cache_stats[kind][counter]) for kind in response_cache.memory]))
+    if 'refresh' in cache_stats:
+        blocks.append(render_samples("response_cache_refreshes_total", "counter",
+                                     "Background refreshes of hot entries, by outcome.",
+                                     [({"outcome": outcome}, cache_stats['refresh'][outcome])
+                                      for outcome in ("scheduled", "completed", "failed", "skipped_pending", "skipped_rate")]))
+        blocks.append(render_samples("response_cache_stale_served_total", "counter",
+                                     "Expired entries served while refreshing or after a failed reload.",
+                                     [({}, cache_stats['refresh']['stale_served'])]))
+    flight_stats = upstream_flights.stats()
+    blocks.append(render_samples("upstream_calls_total", "counter", "Upstream calls made, per lookup kind.",
+                                 [({"kind": kind}, stats["calls"]) for kind, stats in flight_stats.items()]))
+    blocks.append(render_samples("upstream_coalesced_calls_total", "counter",
+                                 "Calls that shared an identical in-flight upstream call, per lookup kind.",
+                                 [({"kind": kind}, stats["coalesced"]) for kind, stats in flight_stats.items()]))
+    quota_stats = google_quota.stats()
+    blocks.append(render_samples("google_quota_calls_total", "counter", "Google calls granted quota, per SKU and priority.",
+                                 [({"sku": sku, "priority": priority}, count)
+                                  for sku, stats in quota_stats["skus"].items()
+                                  for priority, count in stats["by_priority"].items()]))
+    blocks.append(render_samples("google_quota_rejected_total", "counter", "Google calls that gave up waiting for quota.",
+                                 [({"sku": sku}, stats["rejected"]) for sku, stats in quota_stats["skus"].items()]))
+    blocks.append(render_samples("google_quota_wait_seconds_total", "counter", "Seconds spent queued for quota.",
+                                 [({"sku": sku}, stats["wait_seconds"]) for sku, stats in quota_stats["skus"].items()]))
+    blocks.append(render_samples("google_estimated_spend_usd_total", "counter", "Estimated Google spend at list prices.",
+                                 [({"sku": sku}, stats["estimated_spend_usd"]) for sku, stats in quota_stats["skus"].items()]))
+    for name, store in (("doctors", doctor_store), ("hospitals", hospital_store)):
+        blocks.append(render_samples(f"dataset_{name}_rows", "gauge", f"Rows in the {name} dataset.",
+                                     [({}, len(store.table))]))
+    index_stats = nearby_index.stats()
+    blocks.append(render_samples("nearby_index_places", "gauge", "Places held in the local nearby index, per type.",
+                                 [({"type": place_type}, count) for place_type, count in index_stats["places"].items()]))
+    return blocks
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus text format: request latency per route, upstream phase latency, and the stats counters.
+    """
+    blocks = [request_latency.render(), phase_latency.render()] + _stats_samples()
+    return Response("\n".join(blocks) + "\n", mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile', methods=['GET'])
+def get_profile():
+    """
+    Collapsed stacks sampled from request threads (PROFILER_INTERVAL > 0), for flamegraph tools.
+    Query Params: reset (1 to clear the samples after reading)
+    """
+    if not profiler.enabled:
+        return jsonify({"error": "Sampling profiler is disabled; set PROFILER_INTERVAL (seconds) to enable it."}), 404
+    return Response(profiler.collapsed(reset=request.args.get('reset') == '1'), mimetype='text/plain')
 
 # --- Root Endpoint ---
 @app.route('/')
@@ -432,7 +1191,17 @@ def home():
             "/hospital/nearby": "GET (params: lat, lon, radius, type) - Find nearby hospitals.",
             "/hospital/details": "GET (params: place_id) - Get details of a specific hospital.",
             "/hospital/find_by_name": "GET (params: name, type) - Find hospital by name.",
-            "/doctors/lybrate": "GET (params: city, specialty, page) - Scrape doctor info from Lybrate."
+            "/hospital/batch": "POST (JSON: names, place_ids, type) - Bulk lookup, streamed as NDJSON.",
+            "/doctors/lybrate": "GET (params: city, specialty, page) - Scrape doctor info from Lybrate.",
+            "/doctors/lybrate/crawl": "POST (JSON: targets) - Start a multi-page crawl job; GET /doctors/lybrate/crawl/<job_id> for progress.",
+            "/cache/stats": "GET - Response cache hit/miss/eviction counters.",
+            "/hospital/index/stats": "GET - Local nearby index size and local answer counts.",
+            "/upstream/coalescing/stats": "GET - Upstream calls made vs coalesced into identical in-flight calls.",
+            "/quota/stats": "GET - Google calls, throttling and estimated spend per SKU.",
+            "/doctors/search": "GET (params: city, specialty, min_rating, min_votes, max_fee, min_experience, sort, limit) - Rank scraped doctors from the local dataset.",
+            "/hospital/top": "GET (params: lat, lon, radius, type, min_rating, min_reviews, sort, limit) - Rank places seen so far by rating weighted by review count.",
+            "/dataset/stats": "GET - Rows and Parquet parts of the doctor and hospital datasets.",
+            "/metrics": "GET - Prometheus metrics: latency per route and upstream phase, plus the stats counters."
         },
         "google_api_key_status": "CONFIGURED" if GOOGLE_API_KEY != "YOUR_GOOGLE_API_KEY_PLACEHOLDER" else "NOT CONFIGURED (Functionality limited)"
     })
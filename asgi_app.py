@@ -0,0 +1,382 @@
+"""
+Async serving mode (ASGI):
+
+    hypercorn asgi_app:application --bind 0.0.0.0:5001
+    uvicorn asgi_app:application --port 5001 (if uvicorn is installed)
+
+/hospital/nearby, /hospital/details, /hospital/find_by_name and /doctors/lybrate
+are served by async Quart views that call Google and Lybrate through one
+pooled aiohttp.ClientSession. A request waiting on an upstream, or on a page token
+delay, holds a coroutine instead of a worker thread, so one process can keep
+thousands of slow upstream calls in flight. The views keep the Flask routes'
+parameters, responses, status codes, ETags and gzip, and share their cache,
+coalescing and quota counters, indexes and dataset.
+
+Every other route, and the cursor/stream modes of /hospital/nearby, is handed
+to the Flask app in app.py, which runs on a thread pool.
+"""
+import asyncio
+import functools
+import gzip
+import json
+import os
+import time
+from urllib.parse import parse_qs
+
+import aiohttp
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, g, jsonify, request
+from werkzeug.http import generate_etag
+
+import app as sync_app
+from app import (FIND_BY_NAME_CONCURRENCY, FIND_BY_NAME_FIELDS, FIND_BY_NAME_RADIUS, GOOGLE_API_KEY,
+                 GOOGLE_MAPS_BASE_URL, GZIP_LEVEL, GZIP_MIN_SIZE, HOSPITAL_DETAILS_FIELDS, LYBRATE_HEADERS,
+                 NEARBY_FIELDS, DETAILS_FIELDS, PLACES_OK_STATUSES, _cell_search_circles, _drop_empty, _is_compact,
+                 _lybrate_page_result, _lybrate_page_url, _lybrate_url_part, _names_match, _parse_fields,
+                 _potential_matches, _radius_error, _shape_places, _should_gzip, _simplify_place, answer_after_fill,
+                 google_places_api, google_quota, name_index, plan_nearby_search, response_cache)
+from cache import details_key, geocode_key, nearby_key, unwrap
+from http_pool import AsyncSessionPool, http_pool
+from metrics import TRACE_ALL_REQUESTS, TRACE_HEADER, end_trace, request_latency, server_timing, start_trace, timed
+from singleflight import AsyncSingleFlight, upstream_flights
+from throttle import details_sku
+
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get("ASYNC_MAX_IN_FLIGHT", "5000")) # Async requests handled at once
+ASYNC_MAX_QUEUED = int(os.environ.get("ASYNC_MAX_QUEUED", "5000")) # Requests waiting for a slot before 503s
+WSGI_MAX_BODY_SIZE = 16 * 1024 * 1024 # POST bodies passed to the Flask app (e.g. /hospital/batch)
+UPSTREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) # Connection, HTTP status and timeout failures
+
+async_app = Quart(__name__)
+async_http = AsyncSessionPool(http_pool) # Same per-host timeouts and retries as the sync pool
+async_flights = AsyncSingleFlight(shared=upstream_flights) # Counted in /upstream/coalescing/stats
+
+# --- Google Places API, async ---
+class AsyncGooglePlaces(object):
+    """Async counterpart of app.GooglePlaces, sharing its cache, quota, indexes and dataset."""
+
+    def __init__(self, places, http, flights):
+        self.places = places
+        self.http = http
+        self.flights = flights
+
+    async def search_places_by_coordinate(self, location, radius, types):
+        key = nearby_key(location, radius, types)
+        if self.places.cache is None:
+            return unwrap(await self.flights.do('nearby', key,
+                                                lambda: self._search_places_by_coordinate(location, radius, types)))
+        return await self.places.cache.get_or_load_async(
+            'nearby', key, lambda: self._search_places_by_coordinate(location, radius, types), self.flights)
+
+    async def get_place_details(self, place_id, fields):
+        key = details_key(place_id, fields)
+        if self.places.cache is None:
+            return await self.flights.do('details', key, lambda: self._get_place_details(place_id, fields))
+        return await self.places.cache.get_or_load_async(
+            'details', key, lambda: self._get_place_details(place_id, fields), self.flights)
+
+    async def _search_places_by_coordinate(self, location, radius, types):
+        steps = self.places.nearby_search_steps(location, radius, types)
+        try:
+            pagetoken, delay = next(steps)
+            while True:
+                if delay:
+                    with timed('nearby_page_wait'):
+                        await asyncio.sleep(delay) # Waits on the event loop, not in a thread
+                pagetoken, delay = steps.send(await self.fetch_nearby_page(location, radius, types, pagetoken))
+        except StopIteration as done:
+            return done.value
+
+    async def fetch_nearby_page(self, location, radius, types, pagetoken=None):
+        return await self.flights.do('nearby_page', f"{nearby_key(location, radius, types)}|{pagetoken or ''}",
+                                     lambda: self._fetch_nearby_page(location, radius, types, pagetoken))
+
+    async def _fetch_nearby_page(self, location, radius, types, pagetoken=None):
+        endpoint_url, params = self.places.nearby_request(location, radius, types, pagetoken)
+        if self.places.quota is not None and not await self.places.quota.acquire_async('nearby'):
+            print(f"Google Places quota: nearby search throttled for {location}")
+            return None
+        try:
+            with timed('nearby_page'):
+                res = await self.http.get(endpoint_url, params=params)
+                res.raise_for_status()
+                results = json.loads(await res.read())
+            return self.places.handle_nearby_page(location, types, results, pagetoken)
+        except UPSTREAM_ERRORS as e:
+            print(f"Error during Google Places API request: {e}")
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON from Google Places API: {e}")
+            return None
+
+    async def _get_place_details(self, place_id, fields):
+        endpoint_url, params = self.places.details_request(place_id, fields)
+        if self.places.quota is not None and not await self.places.quota.acquire_async('details', details_sku(fields)):
+            print(f"Google Places quota: details throttled for {place_id}")
+            return None
+        try:
+            with timed('details'):
+                res = await self.http.get(endpoint_url, params=params)
+                res.raise_for_status()
+                place_details = json.loads(await res.read())
+            return self.places.handle_details(place_id, place_details)
+        except UPSTREAM_ERRORS as e:
+            print(f"Error fetching place details: {e}")
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON for place details: {e}")
+            return None
+
+    async def geocode(self, hospital_name):
+        """Geocoding API results for `hospital_name`, as googlemaps.Client.geocode returns them; None on errors."""
+        if not await google_quota.acquire_async('geocode'):
+            print(f"Geocoding quota: throttled for {hospital_name}")
+            return None
+        with timed('geocode'):
+            res = await self.http.get(f"{GOOGLE_MAPS_BASE_URL}/maps/api/geocode/json",
+                                      params={'address': hospital_name, 'key': self.places.apiKey})
+            res.raise_for_status()
+            body = json.loads(await res.read())
+        if body.get('status') not in PLACES_OK_STATUSES:
+            print(f"Error during geocoding {hospital_name}: {body.get('status')} {body.get('error_message', '')}")
+            return None
+        return body.get('results', [])
+
+async_places = AsyncGooglePlaces(google_places_api, async_http, async_flights)
+
+async def get_hospital_coordinates(hospital_name):
+    try:
+        geocode_result = await response_cache.get_or_load_async(
+            'geocode', geocode_key(hospital_name), lambda: async_places.geocode(hospital_name), async_flights)
+        if geocode_result and len(geocode_result) > 0:
+            location = geocode_result[0]['geometry']['location']
+            return location['lat'], location['lng']
+        return None, None
+    except Exception as e:
+        print(f"Error during geocoding {hospital_name}: {e}")
+        return None, None
+
+async def find_nearby_places(lat, lon, radius, place_type):
+    """app.find_nearby_places with the upstream searches awaited; the index lookups are quick enough to run inline."""
+    action, value = plan_nearby_search(lat, lon, radius, place_type)
+    if action == 'local':
+        return value
+    if action == 'fill':
+        searches = await asyncio.gather(*[async_places.search_places_by_coordinate(cell_location, cell_radius, place_type)
+                                          for cell_location, cell_radius in _cell_search_circles(value)])
+        return answer_after_fill(lat, lon, radius, place_type, value, searches)
+    places_data = await async_places.search_places_by_coordinate(f"{lat},{lon}", radius, place_type)
+    return None if places_data is None else [_simplify_place(place) for place in places_data]
+
+async def first_matching_details(candidates, query_name, fields, max_in_flight=None):
+    """
+    app.first_matching_details with tasks instead of pool threads: the first candidate, in ranking
+    order, whose detailed name still matches. Lookups behind a confirmed match are cancelled;
+    a cancelled lookup that is already in flight still finishes into the cache.
+    """
+    max_in_flight = max_in_flight or FIND_BY_NAME_CONCURRENCY
+    tasks = {} # candidate index -> task
+    next_to_submit = 0
+    try:
+        for index in range(len(candidates)):
+            while next_to_submit < len(candidates) and next_to_submit < index + max_in_flight:
+                tasks[next_to_submit] = asyncio.ensure_future(
+                    async_places.get_place_details(candidates[next_to_submit]['place_id'], fields))
+                next_to_submit += 1
+            details = await tasks.pop(index)
+            if details and _names_match(query_name, details.get('name', '')):
+                return details
+        return None
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+async def resolve_hospital_by_name(hospital_name_query, place_type='hospital'):
+    lat, lon = await get_hospital_coordinates(hospital_name_query)
+    if not lat or not lon:
+        return {"error": f"Could not geocode hospital name: {hospital_name_query}"}, 404
+
+    nearby_places = await async_places.search_places_by_coordinate(f"{lat},{lon}", FIND_BY_NAME_RADIUS, place_type)
+    if nearby_places is None:
+        return {"error": "Failed to fetch data from Google Places API after geocoding."}, 500
+
+    candidates = name_index.rank(hospital_name_query, nearby_places)
+    found_hospital_details = await first_matching_details(candidates, hospital_name_query, FIND_BY_NAME_FIELDS)
+    if found_hospital_details:
+        return found_hospital_details, 200
+    return _potential_matches(hospital_name_query, nearby_places), 200
+
+# --- Lybrate, async ---
+async def scrape_lybrate_doctors(city, specialty, page=1):
+    return await async_flights.do('lybrate', (city, specialty, str(page)),
+                                  lambda: _scrape_lybrate_doctors(city, specialty, page))
+
+async def _scrape_lybrate_doctors(city, specialty, page):
+    page_url = _lybrate_page_url(city, specialty, page)
+    try:
+        with timed('lybrate_fetch'):
+            response = await async_http.get(page_url, headers=LYBRATE_HEADERS)
+            response.raise_for_status()
+            content = await response.read()
+    except UPSTREAM_ERRORS as e:
+        print(f"Error fetching Lybrate page {page_url}: {e}")
+        return {"error": f"Could not fetch Lybrate page: {str(e)}", "doctors": []}
+    # Parsing is CPU-bound, so it runs on a worker thread rather than stalling the event loop
+    return await asyncio.to_thread(_lybrate_page_result, content, city, specialty, page_url)
+
+# --- Views ---
+_slots = asyncio.Semaphore(ASYNC_MAX_IN_FLIGHT)
+_queued = 0
+
+def bounded(view):
+    """Caps requests handled at once; past ASYNC_MAX_QUEUED waiting requests, new ones get 503."""
+    @functools.wraps(view)
+    async def run(*args, **kwargs):
+        global _queued
+        if _slots.locked() and _queued >= ASYNC_MAX_QUEUED:
+            response = jsonify({"error": "Server busy, retry later"})
+            response.headers['Retry-After'] = "1"
+            return response, 503
+        _queued += 1
+        try:
+            await _slots.acquire()
+        finally:
+            _queued -= 1
+        try:
+            return await view(*args, **kwargs)
+        finally:
+            _slots.release()
+    return run
+
+async def _conditional_json(payload):
+    response = jsonify(payload)
+    # Werkzeug's digest rather than Quart's, so a validator from either server matches the other;
+    # weak, so the gzipped and plain bodies share one
+    response.set_etag(generate_etag(await response.get_data()), weak=True)
+    return await response.make_conditional(request)
+
+def _api_key_missing():
+    return GOOGLE_API_KEY == "YOUR_GOOGLE_API_KEY_PLACEHOLDER"
+
+@async_app.route('/hospital/nearby', methods=['GET'])
+@bounded
+async def get_nearby_hospitals():
+    """Same contract as app.get_nearby_hospitals; mode and cursor requests are served by the Flask app."""
+    fields, error = _parse_fields(NEARBY_FIELDS, args=request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    compact = _is_compact(request.args)
+    lat = request.args.get('lat')
+    lon = request.args.get('lon')
+    radius = request.args.get('radius', '5000')
+    place_type = request.args.get('type', 'hospital')
+
+    if not lat or not lon:
+        return jsonify({"error": "Missing latitude or longitude parameters"}), 400
+    error = _radius_error(radius)
+    if error:
+        return jsonify({"error": error}), 400
+    if _api_key_missing():
+        return jsonify({"error": "Google API Key not configured on the server."}), 500
+
+    hospitals = await find_nearby_places(lat, lon, radius, place_type)
+    if hospitals is None:
+        return jsonify({"error": "Failed to fetch data from Google Places API or no results."}), 500
+    return await _conditional_json(_shape_places(hospitals, fields, compact))
+
+@async_app.route('/hospital/details', methods=['GET'])
+@bounded
+async def get_hospital_details_endpoint():
+    """Same contract as app.get_hospital_details_endpoint."""
+    place_id = request.args.get('place_id')
+    if not place_id:
+        return jsonify({"error": "Missing place_id parameter"}), 400
+    fields, error = _parse_fields(DETAILS_FIELDS, default=HOSPITAL_DETAILS_FIELDS, args=request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    if _api_key_missing():
+        return jsonify({"error": "Google API Key not configured on the server."}), 500
+
+    details = await async_places.get_place_details(place_id, fields)
+    if details:
+        return await _conditional_json(_drop_empty(details) if _is_compact(request.args) else details)
+    return jsonify({"error": "Could not retrieve details for the given place_id"}), 404
+
+@async_app.route('/hospital/find_by_name', methods=['GET'])
+@bounded
+async def find_hospital_by_name():
+    """Same contract as app.find_hospital_by_name."""
+    hospital_name_query = request.args.get('name')
+    place_type = request.args.get('type', 'hospital')
+    if not hospital_name_query:
+        return jsonify({"error": "Missing 'name' parameter for hospital search"}), 400
+    if _api_key_missing():
+        return jsonify({"error": "Google API Key not configured on the server."}), 500
+
+    payload, status = await resolve_hospital_by_name(hospital_name_query, place_type)
+    return jsonify(payload), status
+
+@async_app.route('/doctors/lybrate', methods=['GET'])
+@bounded
+async def get_lybrate_doctors():
+    """Same contract as app.get_lybrate_doctors."""
+    city = request.args.get('city')
+    specialty = request.args.get('specialty')
+    try:
+        page = int(request.args.get('page', '1'))
+    except ValueError:
+        return jsonify({"error": "Invalid page number"}), 400
+    if not city or not specialty:
+        return jsonify({"error": "Missing city or specialty parameters"}), 400
+
+    scraped_data = await scrape_lybrate_doctors(_lybrate_url_part(city), _lybrate_url_part(specialty), page)
+    return jsonify(scraped_data)
+
+# --- Request metrics and compression, as in app.py ---
+@async_app.before_request
+async def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    if TRACE_ALL_REQUESTS or request.headers.get(TRACE_HEADER) == "1":
+        start_trace()
+
+@async_app.after_request
+async def _finish_response(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_latency.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    trace = end_trace()
+    if trace:
+        response.headers['Server-Timing'] = server_timing(trace)
+
+    if not _should_gzip(response, request.headers):
+        return response
+    body = await response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@async_app.after_serving
+async def _close_upstream_clients():
+    await async_http.close()
+
+# --- ASGI entry point ---
+ASYNC_ROUTES = frozenset(['/hospital/nearby', '/hospital/details', '/hospital/find_by_name', '/doctors/lybrate'])
+wsgi_fallback = AsyncioWSGIMiddleware(sync_app.app, max_body_size=WSGI_MAX_BODY_SIZE)
+
+def _served_async(scope):
+    if scope['path'] not in ASYNC_ROUTES:
+        return False
+    if scope['path'] == '/hospital/nearby': # Cursor pagination lives in the Flask app's scheduler
+        params = parse_qs(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+        return 'mode' not in params and 'cursor' not in params
+    return True
+
+async def application(scope, receive, send):
+    """Routes the async views to Quart and everything else to the Flask app."""
+    if scope['type'] == 'http' and not _served_async(scope):
+        await wsgi_fallback(scope, receive, send)
+    else:
+        await async_app(scope, receive, send) # Includes lifespan events
@@ -0,0 +1,245 @@
+"""
+Sync (Flask on a worker thread pool) vs async (asgi_app under hypercorn) serving.
+
+Starts the fake upstream with a slow --latency, then each server in its own
+process, and sends --requests distinct requests per route with --concurrency
+of them in flight at once. The sync server stands in for a gunicorn gthread
+worker: --threads request threads, one request per connection. Reports
+throughput, p50/p95/p99 latency, errors, and the server's peak RSS and thread
+count, read from /proc.
+
+    python benchmarks/bench_async.py --requests 4000 --concurrency 2000 --latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, REPO_DIR)
+
+from quota_env import disable_quota
+
+ROUTES = ['details', 'lybrate', 'nearby']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def proc_status(pid):
+    """(peak RSS in MB, thread count) of process `pid`."""
+    status = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            status[key] = value.split()
+    return int(status['VmHWM'][0]) / 1024.0, int(status['Threads'][0])
+
+
+def serve_sync(port, threads):
+    """Flask app on `threads` pooled request threads, like `gunicorn -k gthread --threads N`."""
+    import logging
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    import app
+
+    class Handler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.0" # A connection is closed after its response, so idle clients hold no thread
+
+    class PooledWSGIServer(BaseWSGIServer):
+        request_queue_size = 4096
+
+        def __init__(self, *args, **kwargs):
+            super(PooledWSGIServer, self).__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="request")
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # No access log lines
+    PooledWSGIServer('127.0.0.1', port, app.app, handler=Handler).serve_forever()
+
+
+def serve_async(port):
+    """asgi_app under hypercorn, in this process (the hypercorn CLI would serve from a child process)."""
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    from asgi_app import application
+
+    config = Config()
+    config.bind = [f'127.0.0.1:{port}']
+    config.backlog = 4096
+    asyncio.run(serve(application, config))
+
+
+def start_server(mode, port, args, env):
+    command = [sys.executable, os.path.abspath(__file__), f'--serve-{mode}', str(port), '--threads', str(args.threads)]
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env)
+    try:
+        wait_for_port(port, process, timeout=120)
+    except Exception:
+        process.kill()
+        process.wait()
+        raise
+    return process
+
+
+def route_inputs(route, first, count, place_ids):
+    """Requests `first` to `first + count` of `route`; all distinct, so each one misses the cache and waits on the upstream."""
+    if route == 'details':
+        return [('/hospital/details', {'place_id': place_ids[i], 'fields': 'name,rating,website'})
+                for i in range(first, first + count)]
+    if route == 'lybrate':
+        return [('/doctors/lybrate', {'city': f"city-{i // 9}", 'specialty': 'dentist', 'page': str(1 + i % 9)})
+                for i in range(first, first + count)]
+    return [('/hospital/nearby', {'lat': f"{10.0 + (i % 400) * 0.05:.4f}", 'lon': f"{70.0 + (i // 400) * 0.05:.4f}",
+                                  'radius': '500'})
+            for i in range(first, first + count)]
+
+
+async def collect_place_ids(fake_url, count):
+    """Place ids the fake upstream can answer details for (it knows places from earlier nearby searches)."""
+    async def search(client, i):
+        params = {'location': f"{20.0 + i * 0.01:.4f},75.0", 'radius': '500', 'types': 'hospital'}
+        async with client.get(f"{fake_url}/maps/api/place/nearbysearch/json", params=params) as response:
+            return (await response.json(content_type=None))['results']
+
+    async with aiohttp.ClientSession() as client:
+        pages = await asyncio.gather(*[search(client, i) for i in range(count // 20 + 1)])
+    return [place['place_id'] for page in pages for place in page][:count]
+
+
+async def drive(base_url, inputs, concurrency, pid):
+    """Sends every request in `inputs`, `concurrency` at a time; samples the server's threads meanwhile."""
+    latencies = []
+    statuses = {}
+    peak_threads = [0]
+    pending = iter(inputs)
+
+    async def sample_threads():
+        while True:
+            peak_threads[0] = max(peak_threads[0], proc_status(pid)[1])
+            await asyncio.sleep(0.05)
+
+    async def worker(client):
+        for path, params in pending:
+            start = time.perf_counter()
+            try:
+                async with client.get(base_url + path, params=params) as response:
+                    await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    sampler = asyncio.ensure_future(sample_threads())
+    start = time.perf_counter()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=600)) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    return latencies, statuses, elapsed, peak_threads[0]
+
+
+def report(mode, route, latencies, statuses, elapsed, peak_rss, peak_threads):
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000.0, [50, 95, 99])
+    errors = sum(count for status, count in statuses.items() if status != 200)
+    print(f"{mode:>5} {route:>8}: {len(latencies) / elapsed:8.1f} req/s  p50 {p50:8.1f}ms  p95 {p95:8.1f}ms  "
+          f"p99 {p99:8.1f}ms  errors {errors}  peak rss {peak_rss:6.1f}MB  peak threads {peak_threads}")
+    if errors:
+        print(f"      statuses: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async serving under slow upstreams")
+    parser.add_argument('--routes', default='details,lybrate', help="Comma-separated subset of " + ','.join(ROUTES))
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--requests', type=int, default=4000, help="Requests per route")
+    parser.add_argument('--concurrency', type=int, default=2000, help="Requests in flight at once")
+    parser.add_argument('--latency', type=float, default=1.0, help="Seconds added to every upstream response")
+    parser.add_argument('--threads', type=int, default=64, help="Request threads of the sync server")
+    parser.add_argument('--serve-sync', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    parser.add_argument('--serve-async', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve_sync:
+        serve_sync(args.serve_sync, args.threads)
+        return
+    if args.serve_async:
+        serve_async(args.serve_async)
+        return
+
+    fake_port = free_port()
+    dataset_dir = tempfile.mkdtemp(prefix="bench_async_")
+    fake = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, 'fake_upstream.py'), '--port', str(fake_port),
+                             '--latency', str(args.latency), '--connect-delay', '0', '--token-delay', '0'],
+                            stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(fake_port, fake)
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        env = dict(os.environ, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "AIza-benchmark-key"),
+                   GOOGLE_MAPS_BASE_URL=fake_url, LYBRATE_BASE_URL=fake_url, NEARBY_PAGE_TOKEN_DELAY="0",
+                   CACHE_REFRESH_ENABLED="0")
+        disable_quota(env) # The upstream latency is the only limit
+        place_ids = asyncio.run(collect_place_ids(fake_url, args.requests * 2))
+
+        for i, mode in enumerate(m.strip() for m in args.modes.split(',') if m.strip()):
+            port = free_port()
+            # A dataset directory per mode, so neither server starts by loading what the other one scraped
+            server = start_server(mode, port, args, dict(env, DATASET_DIR=os.path.join(dataset_dir, mode)))
+            try:
+                for route in [r.strip() for r in args.routes.split(',') if r.strip()]:
+                    if route not in ROUTES:
+                        parser.error(f"Unknown route {route}")
+                    # Each mode gets its own inputs, so nothing is answered from the other run's dataset or index
+                    inputs = route_inputs(route, i * args.requests, args.requests, place_ids)
+                    latencies, statuses, elapsed, peak_threads = asyncio.run(
+                        drive(f"http://127.0.0.1:{port}", inputs, args.concurrency, server.pid))
+                    report(mode, route, latencies, statuses, elapsed, proc_status(server.pid)[0], peak_threads)
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        fake.terminate()
+        fake.wait()
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Throughput of POST /hospital/batch against one request per item.
+
+Resolves --names hospital names and --place-ids place_ids via the local fake
+upstream, first with serial GET /hospital/find_by_name and /hospital/details
+calls, then with a single batch request. Reports items/second for each.
+
+    python benchmarks/bench_batch.py --names 100 --place-ids 100
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fake_upstream import HOSPITAL_NAMES, start_fake_upstream
+from quota_env import disable_quota
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch endpoint throughput")
+    parser.add_argument('--names', type=int, default=100)
+    parser.add_argument('--place-ids', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every upstream response")
+    parser.add_argument('--rate-limit', type=float, default=1000, help="BATCH_RATE_LIMIT for the run")
+    args = parser.parse_args()
+
+    fake = start_fake_upstream(latency=args.latency)
+    os.environ.setdefault("GOOGLE_API_KEY", "AIza-benchmark-key")
+    os.environ["GOOGLE_MAPS_BASE_URL"] = fake.base_url
+    os.environ["LYBRATE_BASE_URL"] = fake.base_url
+    os.environ["NEARBY_PAGE_TOKEN_DELAY"] = "0" # The fake's page tokens are usable immediately
+    os.environ["BATCH_RATE_LIMIT"] = str(args.rate_limit)
+    disable_quota(os.environ) # Only BATCH_RATE_LIMIT paces the batch
+
+    import app
+    client = app.app.test_client()
+
+    names = [f"{HOSPITAL_NAMES[i % len(HOSPITAL_NAMES)]} Branch {i}" for i in range(args.names)]
+    place_ids = []
+    lat = 28.5
+    while len(place_ids) < args.place_ids:
+        places = app.google_places_api.search_places_by_coordinate(f"{lat},77.1", "5000", "hospital")
+        place_ids.extend(place['place_id'] for place in places)
+        lat += 0.01
+    place_ids = place_ids[:args.place_ids]
+    items = len(names) + len(place_ids)
+
+    app.response_cache.clear()
+    fake.reset_counters()
+    start = time.perf_counter()
+    for name in names:
+        client.get('/hospital/find_by_name', query_string={'name': name})
+    for place_id in place_ids:
+        client.get('/hospital/details', query_string={'place_id': place_id})
+    serial = time.perf_counter() - start
+    print(f"  serial: {items / serial:8.1f} items/s  ({serial:.2f}s, upstream calls {fake.stats()['calls']})")
+
+    app.response_cache.clear()
+    fake.reset_counters()
+    start = time.perf_counter()
+    response = client.post('/hospital/batch', json={'names': names, 'place_ids': place_ids})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    batch = time.perf_counter() - start
+    summary = lines[-1]
+    print(f"   batch: {items / batch:8.1f} items/s  ({batch:.2f}s, {summary['errors']} errors, "
+          f"upstream calls {fake.stats()['calls']})")
+    fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
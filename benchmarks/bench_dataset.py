@@ -0,0 +1,110 @@
+"""
+Query latency of the columnar doctor and hospital stores (dataset.py).
+
+Loads --doctors synthetic doctors and --hospitals places, times filter/rank
+queries of the kind /doctors/search and /hospital/top serve, checks one
+doctor query against a pandas reference, and times a Parquet reload.
+
+    python benchmarks/bench_dataset.py --doctors 2000000 --hospitals 500000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("DATASET_FLUSH_ROWS", "1000000000") # Flushed explicitly below
+os.environ.setdefault("DATASET_FLUSH_INTERVAL", "1e9")
+from dataset import DoctorStore, HospitalStore
+
+CITIES = ["delhi", "mumbai", "bangalore", "chennai", "kolkata", "hyderabad", "pune", "jaipur", "lucknow", "gurgaon"]
+SPECIALTIES = ["dentist", "gynaecologist", "general-physician", "dermatologist", "ent-specialist", "cardiologist",
+               "orthopedist", "pediatrician", "psychiatrist", "ophthalmologist"]
+
+
+def _timed(label, fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{label:<58} total={result[1]:>8}  p50={timings[len(timings) // 2] * 1000:7.2f}ms  "
+          f"max={timings[-1] * 1000:7.2f}ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar dataset query latency")
+    parser.add_argument('--doctors', type=int, default=1000000)
+    parser.add_argument('--hospitals', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n = args.doctors
+    doctors = pd.DataFrame({
+        "profile_link": [f"https://www.lybrate.com/doctor/dr-{i}" for i in range(n)],
+        "name": [f"Dr. Doctor {i}" for i in range(n)],
+        "scraped_city": np.array(CITIES)[rng.integers(0, len(CITIES), n)],
+        "scraped_specialty": np.array(SPECIALTIES)[rng.integers(0, len(SPECIALTIES), n)],
+        "rating_percent": np.where(rng.random(n) < 0.2, np.nan, rng.integers(50, 101, n)),
+        "votes": rng.integers(0, 500, n).astype(float),
+        "experience_years": rng.integers(0, 40, n).astype(float),
+        "fee": np.where(rng.random(n) < 0.1, np.nan, rng.integers(1, 30, n) * 50.0),
+    })
+    m = args.hospitals
+    hospitals = pd.DataFrame({
+        "place_id": [f"place_{i}" for i in range(m)],
+        "name": [f"Hospital {i}" for i in range(m)],
+        "type": np.array(["hospital", "doctor", "dentist"])[rng.integers(0, 3, m)],
+        "rating": np.round(1 + rng.random(m) * 4, 1),
+        "user_ratings_total": rng.integers(0, 5000, m).astype(float),
+        "lat": 28.40 + rng.random(m) * 0.50, # Delhi NCR
+        "lng": 76.85 + rng.random(m) * 0.65,
+    })
+
+    directory = tempfile.mkdtemp(prefix="bench_dataset_")
+    try:
+        doctor_store, hospital_store = DoctorStore(directory), HospitalStore(directory)
+        start = time.perf_counter()
+        doctor_store.table.upsert_frame(doctors)
+        hospital_store.table.upsert_frame(hospitals)
+        print(f"loaded {n} doctors and {m} places in {time.perf_counter() - start:.2f}s")
+
+        _timed("doctors: delhi dentists by score", lambda: doctor_store.query(city="delhi", specialty="dentist"),
+               args.repeat)
+        _, total = _timed("doctors: rating>=90, fee<=500, experience>=10 by score",
+                          lambda: doctor_store.query(min_rating=90, max_fee=500, min_experience=10), args.repeat)
+        expected = ((doctors.rating_percent >= 90) & (doctors.fee <= 500) & (doctors.experience_years >= 10)).sum()
+        assert total == expected, (total, expected)
+        found, _ = _timed("doctors: mumbai by fee, offset 100",
+                          lambda: doctor_store.query(city="mumbai", sort='fee', offset=100), args.repeat)
+        reference = doctors[doctors.scraped_city == "mumbai"].sort_values("fee", kind='stable')["fee"]
+        assert [doctor["fee"] for doctor in found] == reference.iloc[100:120].astype(int).tolist()
+        _timed("doctors: all by votes", lambda: doctor_store.query(sort='votes'), args.repeat)
+        _timed("hospitals: all by score", lambda: hospital_store.query(), args.repeat)
+        _timed("hospitals: 5 km around Connaught Place, min 100 reviews",
+               lambda: hospital_store.query(lat=28.63, lon=77.22, radius=5000, min_reviews=100), args.repeat)
+        _timed("hospitals: type dentist, rating>=4.5",
+               lambda: hospital_store.query(place_type="dentist", min_rating=4.5), args.repeat)
+
+        start = time.perf_counter()
+        doctor_store.table.flush()
+        hospital_store.table.flush()
+        print(f"wrote Parquet parts in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        reloaded = DoctorStore(directory)
+        assert len(reloaded.table) == n
+        print(f"reloaded {n} doctors from Parquet in {time.perf_counter() - start:.2f}s")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures connection reuse of the pooled HTTP layer against bare requests.get.
+
+Both modes fetch place details from the local fake upstream, which charges
+--connect-delay for every new connection as a stand-in for the TCP+TLS
+handshake. Reports connections opened and p50/p99 latency per mode.
+
+    python benchmarks/bench_http_pool.py --calls 200 --threads 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fake_upstream import start_fake_upstream
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(label, call, calls, threads, fake):
+    fake.reset_counters()
+    latencies = []
+
+    def timed_call(_):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed_call, range(calls)))
+    wall = time.perf_counter() - wall_start
+    stats = fake.stats()
+    print(f"{label:>8}: connections={stats['connections']:>4}  "
+          f"p50={percentile(latencies, 50) * 1000:7.2f}ms  p99={percentile(latencies, 99) * 1000:7.2f}ms  "
+          f"mean={statistics.mean(latencies) * 1000:7.2f}ms  throughput={calls / wall:8.1f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pooled vs unpooled upstream HTTP calls")
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.005, help="Seconds added to every response")
+    parser.add_argument('--connect-delay', type=float, default=0.03, help="Seconds added per new connection")
+    args = parser.parse_args()
+
+    fake = start_fake_upstream(latency=args.latency, connect_delay=args.connect_delay)
+    os.environ.setdefault("GOOGLE_API_KEY", "AIza-benchmark-key")
+    os.environ["GOOGLE_MAPS_BASE_URL"] = fake.base_url
+    os.environ["LYBRATE_BASE_URL"] = fake.base_url
+
+    import requests
+    import app
+    from http_pool import http_pool
+
+    places = app.google_places_api.search_places_by_coordinate("28.6191,77.0798", "5000", "hospital")
+    place_id = places[0]['place_id']
+    fields = ['name', 'rating', 'formatted_phone_number']
+    details_url = f"{fake.base_url}/maps/api/place/details/json"
+    params = {'place_id': place_id, 'fields': ",".join(fields), 'key': app.GOOGLE_API_KEY}
+
+    print(f"{args.calls} details calls on {args.threads} threads "
+          f"(latency={args.latency * 1000:.0f}ms, connect_delay={args.connect_delay * 1000:.0f}ms)")
+    run("bare", lambda: requests.get(details_url, params=params, timeout=10).json(),
+        args.calls, args.threads, fake)
+    # The same request through the app's pool, below its response cache, so every call reaches the fake
+    run("pooled", lambda: http_pool.get(details_url, params=params).json(),
+        args.calls, args.threads, fake)
+    fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
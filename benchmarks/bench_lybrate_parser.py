@@ -0,0 +1,71 @@
+"""
+Lybrate listing extraction: original implementation vs lybrate_parser backends.
+
+Parses every saved page in benchmarks/fixtures/, checks that each backend
+returns exactly the records of the original scrape_lybrate_doctors loop, and
+reports pages/second and doctors/second per implementation.
+
+    python benchmarks/bench_lybrate_parser.py --seconds 3
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+from legacy_lybrate import legacy_extract
+from lybrate_parser import parse_doctor_cards
+
+
+def load_fixtures():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(BENCH_DIR, 'fixtures', 'lybrate_*.html'))):
+        with open(path, 'rb') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def measure(extract, pages, seconds):
+    """Parses the fixture set repeatedly for about `seconds`; returns (pages/s, doctors/s)."""
+    parsed = doctors = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _, content in pages:
+            records, _ = extract(content)
+            parsed += 1
+            doctors += len(records)
+    elapsed = time.perf_counter() - start
+    return parsed / elapsed, doctors / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lybrate extraction throughput")
+    parser.add_argument('--seconds', type=float, default=3.0, help="Time spent per implementation")
+    args = parser.parse_args()
+
+    pages = load_fixtures()
+    implementations = [
+        ("original", lambda content: legacy_extract(content, 'delhi', 'dentist')),
+        ("bs4", lambda content: parse_doctor_cards(content, 'delhi', 'dentist', backend='bs4')),
+        ("lxml", lambda content: parse_doctor_cards(content, 'delhi', 'dentist', backend='lxml')),
+    ]
+
+    for name, content in pages:
+        expected = implementations[0][1](content)
+        for label, extract in implementations[1:]:
+            if extract(content) != expected:
+                print(f"MISMATCH: {label} backend differs from the original on {name}")
+                sys.exit(1)
+    print(f"{len(pages)} fixture pages, all backends match the original output")
+
+    baseline = None
+    for label, extract in implementations:
+        pages_per_s, doctors_per_s = measure(extract, pages, args.seconds)
+        baseline = baseline or doctors_per_s
+        print(f"{label:>9}: {pages_per_s:8.1f} pages/s  {doctors_per_s:9.1f} docs/s  ({doctors_per_s / baseline:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Radius query latency of the local nearby index (spatial_index.py).
+
+Loads --places random places around Delhi and times radius queries at
+several radii, checking each result count against a brute-force haversine
+scan over all places.
+
+    python benchmarks/bench_spatial_index.py --places 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from spatial_index import NearbyIndex, haversine_m
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nearby index radius query latency")
+    parser.add_argument('--places', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Delhi NCR, roughly 55 km x 65 km
+    lats = 28.40 + rng.random(args.places) * 0.50
+    lons = 76.85 + rng.random(args.places) * 0.65
+    index = NearbyIndex()
+    start = time.perf_counter()
+    index.ingest([{"place_id": f"place_{i}", "name": f"Hospital {i}",
+                   "geometry": {"location": {"lat": float(lats[i]), "lng": float(lons[i])}}}
+                  for i in range(args.places)], 'hospital')
+    print(f"ingested {args.places} places in {time.perf_counter() - start:.2f}s")
+
+    random.seed(0)
+    for radius in (200, 500, 1000, 2000, 5000):
+        timings = []
+        for _ in range(args.queries):
+            lat, lon = 28.45 + random.random() * 0.4, 76.9 + random.random() * 0.55
+            start = time.perf_counter()
+            found = index.query(lat, lon, radius, 'hospital')
+            timings.append(time.perf_counter() - start)
+        expected = int((haversine_m(lat, lon, lats, lons) <= radius).sum())
+        assert len(found) == expected, (radius, len(found), expected)
+        timings.sort()
+        print(f"radius {radius:>5} m: ~{len(found):>5} results  "
+              f"p50={timings[len(timings) // 2] * 1000:.3f}ms  p99={timings[int(len(timings) * 0.99)] * 1000:.3f}ms")
+
+    start = time.perf_counter()
+    for _ in range(20):
+        distances = haversine_m(28.6, 77.1, lats, lons)
+        np.nonzero(distances <= 2000)[0]
+    print(f"brute-force scan (2 km, no result building): {(time.perf_counter() - start) / 20 * 1000:.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+Local stand-in for the Google Places / Geocoding APIs and Lybrate listing pages.
+
+Used by the benchmarks so performance changes to app.py can be measured
+without spending real quota or hitting lybrate.com. Point the app at it with:
+
+    GOOGLE_MAPS_BASE_URL=http://127.0.0.1:<port> LYBRATE_BASE_URL=http://127.0.0.1:<port>
+
+Latency can be set per kind of call, page tokens only become valid after a
+readiness delay (like Google's), a fraction of calls can be failed on
+purpose, and Lybrate listings can be served from the saved pages in
+benchmarks/fixtures instead of generated ones.
+
+Run standalone with `python benchmarks/fake_upstream.py --port 8099`.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+HOSPITAL_NAMES = [
+    "Max Super Speciality Hospital, Vaishali",
+    "Max Institute Of Cancer Care, Vaishali",
+    "Maharaja Agrasen Hospital",
+    "Institute of Liver and Biliary Sciences",
+    "Chetna Neuropsychiatry and De-Addiction Centre",
+    "International Fertility Centre",
+    "Akanksha IVF Centre",
+    "St Stephen's Hospital",
+    "Sir Ganga Ram Hospital",
+    "Fortis Escorts Heart Institute",
+    "Indraprastha Apollo Hospital",
+    "BLK Super Speciality Hospital",
+]
+
+
+def _stable_hash(text):
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def render_lybrate_page(city, specialty, page, doctors_per_page):
+    """Renders a listing page with the card structure scrape_lybrate_doctors expects."""
+    cards = []
+    for i in range(doctors_per_page):
+        n = (page - 1) * doctors_per_page + i
+        slug = f"dr-{specialty}-{n}"
+        if i % 2 == 0:
+            rating_html = (f'<span class="lybRating"><span class="lybRating__percentage">{80 + n % 20}%</span>'
+                           f'<span class="lybRating__count">({10 + n} votes)</span></span>')
+        else:
+            rating_html = f'<div class="grid__col-xs-10 grid--direction-row">{80 + n % 20}% ({10 + n} votes)</div>'
+        if i % 3 == 0:
+            fee_html = f'<span itemprop="priceRange">&#8377; {300 + 50 * (n % 10)}</span>'
+        else:
+            fee_html = f'<div class="grid__col-xs-10 grid--direction-row">&#8377; {300 + 50 * (n % 10)} Consultation Fee</div>'
+        cards.append(f"""
+  <div class="ly-doctor">
+    <div class="grid__col-xs-20">
+      <h2 itemprop="name"><a href="/{city}/doctor/{slug}">Dr. {specialty.title()} Doctor {n}</a></h2>
+      <div class="lybEllipsis ly-doctor__degree grid__col-20">BDS, MDS - Oral Medicine and Radiology</div>
+      <span itemprop="streetAddress">Block {n % 7}, Sector {n % 60}, {city.title()}</span>
+    </div>
+    <div class="grid__col-xs-10 grid--direction-row">
+      {rating_html}
+      <div class="grid__col-xs-10 grid--direction-row">{1 + n % 35} Years Experience</div>
+      {fee_html}
+    </div>
+  </div>""")
+    if doctors_per_page:
+        # Promoted listing without a profile link; the scraper must skip it
+        cards.append("""
+  <div class="ly-doctor ly-doctor--promoted">
+    <h2 itemprop="name">Book a consultation</h2>
+    <div class="grid__col-xs-10 grid--direction-row">Consult online &#8377; 199</div>
+  </div>""")
+    # Site chrome around the listing, so parsing cost resembles a real page
+    nav = ''.join(f'<li class="nav__item"><a href="/{city}/speciality-{i}">Speciality {i}</a></li>' for i in range(150))
+    filters = ''.join(f'<div class="grid filter"><label><input type="checkbox" name="locality" value="{i}"> Locality {i}</label></div>'
+                      for i in range(80))
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{specialty} in {city} - page {page}</title>
+<script>window.__STATE__ = {{"page": {page}, "city": "{city}", "items": [{', '.join(str(i) for i in range(300))}]}};</script>
+<style>.grid {{ display: flex; }} .ly-doctor {{ margin: 0; }}</style></head>
+<body>
+<div class="header"><a href="/">Lybrate</a><ul class="nav">{nav}</ul></div>
+<div class="grid__col-lt-5 sidebar">{filters}</div>
+<div class="grid__col-lt-20 lybMar-top-btm--half lybPad-left-right--quar">{''.join(cards)}
+</div>
+<div class="footer">Page {page}<ul class="nav">{nav}</ul></div>
+</body></html>"""
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture_pages():
+    """Saved Lybrate listing pages, as bytes, in a stable order."""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, 'lybrate_*.html'))):
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    return pages
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    """Threaded HTTP/1.1 server that counts connections and upstream calls."""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 2048 # Listen backlog; bench_async opens thousands of connections at once
+
+    def __init__(self, address, latency=0.0, connect_delay=0.0, results_per_page=20,
+                 nearby_pages=3, doctors_per_page=10, lybrate_pages=9, latencies=None,
+                 token_delay=0.0, error_rate=0.0, error_status=500, use_fixtures=False, seed=0):
+        super(FakeUpstreamServer, self).__init__(address, FakeUpstreamHandler)
+        self.latency = latency # Added to every response
+        self.latencies = latencies or {} # Per kind ('nearby', 'details', 'geocode', 'lybrate'), overrides latency
+        self.connect_delay = connect_delay # Paid once per new connection, stands in for TCP+TLS setup
+        self.token_delay = token_delay # Seconds before a next_page_token is accepted; earlier use is INVALID_REQUEST
+        self.error_rate = error_rate # Fraction of calls answered with error_status
+        self.error_status = error_status
+        self.fixture_pages = load_fixture_pages() if use_fixtures else None
+        self.tokens = {} # next_page_token -> time it becomes valid
+        self.random = random.Random(seed)
+        self.results_per_page = results_per_page
+        self.nearby_pages = nearby_pages
+        self.doctors_per_page = doctors_per_page
+        self.lybrate_pages = lybrate_pages
+        self.places = {} # place_id -> place record, filled by nearby searches
+        self.geocoded = {} # "lat,lon" -> name, so nearby searches can return the geocoded place
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.calls = {}
+        self.errors = {}
+
+    def process_request_thread(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        if self.connect_delay:
+            time.sleep(self.connect_delay)
+        super(FakeUpstreamServer, self).process_request_thread(request, client_address)
+
+    def count_call(self, kind):
+        with self.lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def inject_error(self, kind):
+        """Decides whether this call fails, counting injected errors per kind."""
+        if not self.error_rate:
+            return False
+        with self.lock:
+            if self.random.random() >= self.error_rate:
+                return False
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            return True
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.calls = {}
+            self.errors = {}
+
+    def stats(self):
+        with self.lock:
+            return {"connections": self.connections, "calls": dict(self.calls), "injected_errors": dict(self.errors)}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, so connection reuse is observable
+    disable_nagle_algorithm = True # Headers and body are separate writes; avoid the 40ms delayed-ACK stall
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, data, status=200):
+        self._send(status, json.dumps(data), "application/json")
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        routes = {
+            "/maps/api/place/nearbysearch/json": "nearby",
+            "/maps/api/place/details/json": "details",
+            "/maps/api/geocode/json": "geocode",
+        }
+        kind = routes.get(parts.path, "lybrate" if parts.path.count('/') == 2 else None)
+        latency = server.latencies.get(kind, server.latency)
+        if latency:
+            time.sleep(latency)
+        if kind is None:
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        server.count_call(kind)
+        if server.inject_error(kind):
+            self._send_json({"error": "injected failure"}, status=server.error_status)
+        elif kind == "nearby":
+            self._send_json(self._nearby(params))
+        elif kind == "details":
+            self._send_json(self._details(params))
+        elif kind == "geocode":
+            self._send_json(self._geocode(params))
+        else:
+            _, city, specialty = parts.path.split('/')
+            page = int(params.get('page', '1'))
+            count = server.doctors_per_page if page <= server.lybrate_pages else 0
+            if server.fixture_pages and count:
+                body = server.fixture_pages[(page - 1) % len(server.fixture_pages)].decode('utf-8')
+            else:
+                body = render_lybrate_page(city, specialty, page, count)
+            self._send(200, body, "text/html; charset=utf-8")
+
+    def _nearby(self, params):
+        server = self.server
+        location = params.get('location', '0,0')
+        page = 0
+        if 'pagetoken' in params:
+            with server.lock:
+                ready_at = server.tokens.get(params['pagetoken'])
+            if ready_at is None or time.time() < ready_at: # Unknown or not yet valid, as Google does
+                return {"status": "INVALID_REQUEST", "results": []}
+            page = int(params['pagetoken'].rsplit(':', 1)[1])
+        try:
+            lat, lon = [float(x) for x in location.split(',')]
+        except ValueError:
+            return {"status": "INVALID_REQUEST", "results": []}
+        geocoded_name = server.geocoded.get(f"{lat:.6f},{lon:.6f}")
+        results = []
+        for i in range(server.results_per_page):
+            n = page * server.results_per_page + i
+            if geocoded_name and n == 5: # Bury the real match a few places down the ranking
+                name = geocoded_name
+            else:
+                name = f"{HOSPITAL_NAMES[(_stable_hash(location) + n) % len(HOSPITAL_NAMES)]} Annexe {n}"
+            place = {
+                "place_id": f"fake_{_stable_hash(location + name):08x}_{n}",
+                "name": name,
+                "rating": round(3.0 + (n % 20) / 10.0, 1),
+                "user_ratings_total": 10 * n + 3,
+                "vicinity": f"Sector {n}, Delhi",
+                "geometry": {"location": {"lat": lat + 0.0005 * (i % 5), "lng": lon + 0.0005 * (i // 5)}}
+            }
+            results.append(place)
+        with server.lock:
+            for place in results:
+                server.places[place['place_id']] = place
+        data = {"status": "OK", "results": results}
+        if page + 1 < server.nearby_pages:
+            token = f"{location}:{page + 1}"
+            with server.lock:
+                server.tokens.setdefault(token, time.time() + server.token_delay)
+            data["next_page_token"] = token
+        return data
+
+    def _details(self, params):
+        place = self.server.places.get(params.get('place_id', ''))
+        if place is None:
+            return {"status": "NOT_FOUND"}
+        result = dict(place)
+        result.update({
+            "website": "https://example.org/" + place['place_id'],
+            "formatted_phone_number": "011 4000 %04d" % (_stable_hash(place['place_id']) % 10000),
+            "reviews": [{"author_name": "Patient %d" % i, "rating": 4, "text": "Good care. " * 20} for i in range(5)]
+        })
+        fields = params.get('fields')
+        if fields:
+            result = {k: v for k, v in result.items() if k in fields.split(',')}
+        return {"status": "OK", "result": result}
+
+    def _geocode(self, params):
+        address = params.get('address', '')
+        h = _stable_hash(address)
+        lat = round(28.40 + (h % 5000) / 10000.0, 6)
+        lon = round(76.90 + ((h // 5000) % 6000) / 10000.0, 6)
+        with self.server.lock:
+            self.server.geocoded[f"{lat:.6f},{lon:.6f}"] = address
+        return {"status": "OK", "results": [{"formatted_address": address,
+                                              "geometry": {"location": {"lat": lat, "lng": lon}}}]}
+
+
+def start_fake_upstream(port=0, **options):
+    """Starts the fake on a background thread and returns the server."""
+    server = FakeUpstreamServer(("127.0.0.1", port), **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds added to every response")
+    parser.add_argument('--connect-delay', type=float, default=0.05, help="Seconds added per new connection")
+    parser.add_argument('--token-delay', type=float, default=2.0, help="Seconds before a next_page_token is valid")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls failed with HTTP 500")
+    parser.add_argument('--fixtures', action='store_true', help="Serve the saved Lybrate pages from benchmarks/fixtures")
+    args = parser.parse_args()
+    fake = FakeUpstreamServer(("127.0.0.1", args.port), latency=args.latency, connect_delay=args.connect_delay,
+                              token_delay=args.token_delay, error_rate=args.error_rate, use_fixtures=args.fixtures)
+    print(f"Fake upstream listening on {fake.base_url}")
+    fake.serve_forever()
@@ -0,0 +1,158 @@
+"""
+Frozen copy of the original scrape_lybrate_doctors card extraction.
+
+Kept only as the reference implementation for bench_lybrate_parser.py, which
+checks lybrate_parser produces identical records and compares docs/second.
+"""
+import re
+
+from bs4 import BeautifulSoup
+
+
+def legacy_extract(content, city, specialty):
+    """Returns (doctors, potential card count) exactly as the original scraper computed them."""
+    doctors_data = []
+    soup = BeautifulSoup(content, 'lxml') # Using lxml as it's generally faster
+
+    # The structure from Doctor_rating_lr.ipynb:
+    # soup.find('div', {'class': 'grid__col-lt-20 lybMar-top-btm--half lybPad-left-right--quar'})
+    # then grid_cells = required_html.findAll('div', {'class': 'grid'})
+    # This structure might change. Let's try a more direct approach to find doctor cards.
+    # Common pattern for doctor cards on Lybrate: look for elements with itemprop="itemListElement" or similar
+    
+    # Attempting to find doctor cards. Lybrate's class names can be dynamic or complex.
+    # The notebook used 'grid' class, which is very generic.
+    # Let's look for a container that holds multiple doctor profiles.
+    # Based on typical Lybrate structure, doctor profiles are often within <div> elements
+    # that have specific classes or attributes. The notebook's selector was:
+    # 'div.grid__col-lt-20 > div.grid' (implicitly)
+    
+    # Updated selector strategy: find elements that are likely individual doctor cards.
+    # This might need adjustment if Lybrate's HTML structure has changed significantly.
+    doctor_cards_container = soup.find('div', class_=re.compile(r'grid__col-lt-20')) # Looser match for main container
+    if not doctor_cards_container:
+        doctor_cards_container = soup # Fallback to search whole soup if specific container not found
+
+    # Try to find individual doctor entries. The notebook used very generic 'div' with class 'grid'.
+    # This is highly prone to breaking. A more specific selector is needed.
+    # For example, if each doctor has a specific 'itemtype="http://schema.org/Physician"'
+    # Or a class like 'doctor-profile-card' (hypothetical)
+
+    # The notebook's logic for extracting details:
+    # heading = grid_cell.find('h2', {'itemprop': 'name'})
+    # name_link = heading.find('a')
+    # name = name_link.get_text().strip()
+    # profile_link = name_link['href']
+    # degree_tag = grid_cell.find('div', {'class': 'lybEllipsis ly-doctor__degree grid__col-20'})
+    # address_tag = grid_cell.find('span', {'itemprop': 'streetAddress'})
+    # right_part = grid_cell.findAll('div', {'class': 'grid__col-xs-10 grid--direction-row'}) for rating, exp, charges
+
+    # Let's try to find elements that are likely to be doctor cards.
+    # Often these are <article> tags or <div>s with specific schema.org attributes.
+    # The class 'grid' is too generic.
+    # Looking for elements that might contain an <h2> with itemprop="name"
+    
+    potential_cards = doctor_cards_container.find_all('div', class_=lambda x: x and 'ly-doctor' in x) # Heuristic
+    if not potential_cards: # Fallback to a more generic search if the above fails
+        # This is closer to the notebook's very broad 'grid' search, but we need to be careful.
+        # The notebook's `grid_cells = required_html.findAll('div', {'class': 'grid'})`
+        # followed by `if grid_cell['class'][0] != 'grid' or len(grid_cell['class']) != 1: continue`
+        # implies it was looking for <div class="grid"> specifically.
+        potential_cards = doctor_cards_container.find_all('div', class_='grid')
+
+
+    for card in potential_cards:
+        # The notebook's filter: `if grid_cell['class'][0] != 'grid' or len(grid_cell['class']) != 1: continue`
+        # This was to ensure it's exactly `class="grid"`. We need to be careful applying this if class list is longer.
+        if not (card.get('class') and card.get('class') == ['grid']): # Trying to replicate the notebook's specific filter
+            # If this filter is too strict, many valid cards might be skipped.
+            # Consider removing or adjusting if no results are found.
+            # print(f"Skipping card due to class filter: {card.get('class')}")
+            pass # Allow to proceed to try and extract, but be mindful this might pick up wrong divs
+
+
+        name_tag = card.find('h2', itemprop='name')
+        if not name_tag or not name_tag.find('a'):
+            continue # Skip if essential name link is missing
+
+        name_link_tag = name_tag.find('a')
+        name = name_link_tag.get_text(strip=True)
+        profile_link = name_link_tag.get('href', '')
+        if not profile_link.startswith('http'):
+            profile_link = "https://www.lybrate.com" + profile_link if profile_link.startswith('/') else ""
+        
+        scraped_city = profile_link.split('/')[3] if len(profile_link.split('/')) > 3 else city # Extract city from URL if possible
+
+        degree_tag = card.find('div', class_=re.compile(r'ly-doctor__degree'))
+        degree = degree_tag.get_text(strip=True).replace('\n', ' ').replace(',', ';') if degree_tag else "N/A"
+
+        address_tag = card.find('span', itemprop='streetAddress')
+        address = address_tag.get_text(strip=True).replace('\n', ' ').replace(',', ';') if address_tag else "N/A"
+        
+        rating = "0%"
+        experience = "0 years experience"
+        charges = "N/A"
+
+        # Extracting rating, experience, charges (from 'grid__col-xs-10 grid--direction-row')
+        # This part is tricky as class names can be very specific or change.
+        # The notebook used: `right_part = grid_cell.findAll('div', {'class': 'grid__col-xs-10 grid--direction-row'})`
+        # This selector is also quite generic.
+        
+        # Attempting to find the block containing rating/experience/charges
+        # These are often in a separate div or spans.
+        # Let's look for text patterns.
+        
+        # Votes/Rating (e.g., "95% (123 votes)")
+        rating_tag = card.find('span', class_=re.compile(r'lybRating')) # Common class for ratings
+        if rating_tag and rating_tag.find('span', class_=re.compile(r'lybRating__percentage')):
+            rating_text = rating_tag.find('span', class_=re.compile(r'lybRating__percentage')).get_text(strip=True)
+            votes_text_tag = rating_tag.find('span', class_=re.compile(r'lybRating__count'))
+            votes_text = votes_text_tag.get_text(strip=True) if votes_text_tag else ""
+            rating = f"{rating_text} {votes_text}".strip()
+        else: # Fallback to notebook's method if specific rating class not found
+            # This requires iterating through multiple divs as in the notebook
+            info_blocks = card.find_all('div', class_=re.compile(r'grid__col-xs-10')) # General info blocks
+            for block in info_blocks:
+                block_text = block.get_text(strip=True)
+                if '%' in block_text and 'vote' in block_text.lower(): # Heuristic for rating
+                    rating = block_text.replace('\n', ' ')
+                    break 
+        
+        # Experience
+        experience_tag = card.find(string=re.compile(r'\d+ Years Experience', re.IGNORECASE))
+        if experience_tag:
+            experience = experience_tag.strip()
+        else: # Fallback
+            info_blocks = card.find_all('div', class_=re.compile(r'grid__col-xs-10'))
+            for block in info_blocks:
+                block_text = block.get_text(strip=True)
+                if 'experience' in block_text.lower():
+                    experience = block_text.replace('\n', ' ')
+                    break
+        
+        # Consultation Fee / Charges
+        fee_tag = card.find('span', itemprop='priceRange')
+        if fee_tag:
+            charges = fee_tag.get_text(strip=True)
+        else: # Fallback
+            info_blocks = card.find_all('div', class_=re.compile(r'grid__col-xs-10'))
+            for block in info_blocks:
+                block_text = block.get_text(strip=True)
+                if '₹' in block_text or 'consultation fee' in block_text.lower():
+                    charges = block_text.replace('\n', ' ')
+                    break
+        
+        if name: # Only add if a name was found
+            doctors_data.append({
+                "name": name,
+                "profile_link": profile_link,
+                "degree": degree,
+                "address": address,
+                "rating_votes": rating,
+                "experience": experience,
+                "charges": charges,
+                "scraped_specialty": specialty, # The specialty used for search
+                "scraped_city": scraped_city
+            })
+
+    return doctors_data, len(potential_cards)
@@ -0,0 +1,273 @@
+"""
+Load test of the Flask routes against the local fake upstream, plus microbenchmarks.
+
+Serves app.py on a local threaded server, drives each route with --concurrency
+parallel clients, and reports throughput, p50/p95/p99 latency, errors,
+upstream calls (from the fake's counters) and process memory. The
+microbenchmarks time Lybrate listing parsing over the saved fixtures and
+the find_by_name candidate ranking. Results can be saved as JSON and
+compared with an earlier run:
+
+    python benchmarks/load_test.py --requests 200 --concurrency 16 --output run.json
+    python benchmarks/load_test.py --compare run.json  # exits 1 on regressions
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+from fake_upstream import HOSPITAL_NAMES, load_fixture_pages, start_fake_upstream
+from quota_env import disable_quota
+
+ROUTES = ['nearby', 'details', 'find_by_name', 'lybrate']
+CITIES = ['delhi', 'mumbai', 'bangalore', 'chennai']
+SPECIALTIES = ['dentist', 'gynaecologist', 'general-physician', 'dermatologist', 'ent-specialist']
+
+
+def memory_mb():
+    """(current RSS, peak RSS) of this process in MB."""
+    current = peak = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024.0
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if peak is None:
+        scale = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0 # ru_maxrss is bytes on macOS, KB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    return current, peak
+
+
+def summarize(latencies, elapsed):
+    latencies = np.asarray(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {
+        "requests": int(len(latencies)),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(latencies.max()), 2) if len(latencies) else 0.0,
+    }
+
+
+def route_inputs(route, count, place_ids):
+    """Query strings for `count` distinct requests to `route`."""
+    if route == 'nearby':
+        return [('/hospital/nearby', {'lat': f"{28.45 + (i % 50) * 0.006:.4f}",
+                                      'lon': f"{77.00 + (i // 50) * 0.006:.4f}", 'radius': '1000'})
+                for i in range(count)]
+    if route == 'details':
+        return [('/hospital/details', {'place_id': place_ids[i % len(place_ids)]}) for i in range(count)]
+    if route == 'find_by_name':
+        return [('/hospital/find_by_name', {'name': f"{HOSPITAL_NAMES[i % len(HOSPITAL_NAMES)]} Branch {i}"})
+                for i in range(count)]
+    return [('/doctors/lybrate', {'city': CITIES[i % len(CITIES)],
+                                  'specialty': SPECIALTIES[(i // len(CITIES)) % len(SPECIALTIES)],
+                                  'page': str(1 + i // (len(CITIES) * len(SPECIALTIES)) % 9)})
+            for i in range(count)]
+
+
+def run_route(base_url, inputs, total, concurrency):
+    """Sends `total` requests cycling over `inputs`; returns (latencies in seconds, error count, elapsed)."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    next_index = iter(range(total))
+    local = threading.local()
+
+    def worker():
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        while True:
+            with lock:
+                i = next(next_index, None)
+            if i is None:
+                return
+            path, params = inputs[i % len(inputs)]
+            start = time.perf_counter()
+            try:
+                response = session.get(base_url + path, params=params, timeout=120)
+                failed = response.status_code >= 400
+            except requests.exceptions.RequestException:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def micro_parse(seconds):
+    from lybrate_parser import parse_doctor_cards
+    pages = load_fixture_pages()
+    results = {}
+    for backend in ('bs4', 'lxml'):
+        timings = []
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for content in pages:
+                start = time.perf_counter()
+                parse_doctor_cards(content, 'delhi', 'dentist', backend=backend)
+                timings.append(time.perf_counter() - start)
+        results[f"parse_{backend}"] = summarize(timings, sum(timings))
+    return results
+
+
+def micro_name_match(seconds, index_size):
+    from name_match import NameIndex
+    index = NameIndex()
+    for i in range(index_size): # Names seen earlier, so scoring runs against a realistic index
+        index.add(f"seen_{i}", f"{HOSPITAL_NAMES[i % len(HOSPITAL_NAMES)]} Annexe {i}")
+    candidates = [{"place_id": f"candidate_{i}", "name": f"{HOSPITAL_NAMES[i % len(HOSPITAL_NAMES)]} Annexe {i}"}
+                  for i in range(60)] # One full nearby search
+    queries = [f"{name} Branch {i}" for i, name in enumerate(HOSPITAL_NAMES)]
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for query in queries:
+            start = time.perf_counter()
+            index.rank(query, candidates)
+            timings.append(time.perf_counter() - start)
+    return {"name_match_rank": summarize(timings, sum(timings))}
+
+
+def compare(results, baseline, tolerance):
+    """Prints metric changes against `baseline`; returns the regressions beyond `tolerance`."""
+    regressions = []
+    for section in ('routes', 'micro'):
+        for name, current in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(name)
+            if not previous:
+                continue
+            for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+                before, after = previous.get(metric), current.get(metric)
+                if not before or after is None:
+                    continue
+                change = (after - before) / before
+                worse = -change if metric == 'throughput_rps' else change
+                flag = "  REGRESSION" if worse > tolerance else ""
+                print(f"{section}/{name} {metric}: {before} -> {after} ({change:+.1%}){flag}")
+                if flag:
+                    regressions.append(f"{section}/{name} {metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route load test and microbenchmarks against the fake upstream")
+    parser.add_argument('--routes', default=','.join(ROUTES), help="Comma-separated subset of " + ','.join(ROUTES))
+    parser.add_argument('--requests', type=int, default=200, help="Requests per route")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--keys', type=int, default=0, help="Distinct inputs per route (default: one per request)")
+    parser.add_argument('--warm', action='store_true', help="Keep caches between routes")
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every upstream response")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="Seconds before a next_page_token is valid")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of upstream calls failed with HTTP 500")
+    parser.add_argument('--fixtures', action='store_true', help="Serve the saved Lybrate pages")
+    parser.add_argument('--quota', action='store_true', help="Keep the QUOTA_*_QPS budgets set in the environment (disabled otherwise)")
+    parser.add_argument('--micro-seconds', type=float, default=2.0, help="Time per microbenchmark; 0 skips them")
+    parser.add_argument('--index-size', type=int, default=20000, help="Names indexed before the name-match benchmark")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Baseline JSON file from an earlier --output")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Relative change reported as a regression")
+    args = parser.parse_args()
+
+    fake = start_fake_upstream(latency=args.latency, token_delay=args.token_delay, error_rate=args.error_rate,
+                               use_fixtures=args.fixtures)
+    os.environ.setdefault("GOOGLE_API_KEY", "AIza-benchmark-key")
+    os.environ["GOOGLE_MAPS_BASE_URL"] = fake.base_url
+    os.environ["LYBRATE_BASE_URL"] = fake.base_url
+    os.environ["NEARBY_PAGE_TOKEN_DELAY"] = str(args.token_delay)
+    if not args.quota:
+        disable_quota(os.environ)
+
+    import app
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # No access log lines
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    # Place ids the fake can answer details for
+    place_ids = []
+    lat = 28.5
+    while len(place_ids) < max(args.keys or args.requests, 1):
+        places = app.google_places_api.search_places_by_coordinate(f"{lat:.4f},77.1", "5000", "hospital") or []
+        place_ids.extend(place['place_id'] for place in places)
+        lat += 0.01
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "git_rev": subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                      capture_output=True, text=True).stdout.strip() or None,
+            "args": vars(args),
+        },
+        "routes": {},
+        "micro": {},
+    }
+    for route in [r.strip() for r in args.routes.split(',') if r.strip()]:
+        if route not in ROUTES:
+            parser.error(f"Unknown route {route}")
+        inputs = route_inputs(route, args.keys or args.requests, place_ids)
+        if not args.warm:
+            app.response_cache.clear()
+        fake.reset_counters()
+        latencies, errors, elapsed = run_route(base_url, inputs, args.requests, args.concurrency)
+        summary = summarize(latencies, elapsed)
+        current, peak = memory_mb()
+        summary.update({"errors": errors, "upstream": fake.stats()["calls"],
+                        "injected_errors": fake.stats()["injected_errors"],
+                        "rss_mb": round(current, 1) if current else None, "peak_rss_mb": round(peak, 1)})
+        results["routes"][route] = summary
+        print(f"{route:>13}: {summary['throughput_rps']:8.1f} req/s  p50 {summary['p50_ms']:8.1f}ms  "
+              f"p95 {summary['p95_ms']:8.1f}ms  p99 {summary['p99_ms']:8.1f}ms  errors {errors}  "
+              f"upstream {summary['upstream']}  rss {summary['rss_mb']}MB")
+
+    if args.micro_seconds > 0:
+        results["micro"].update(micro_parse(args.micro_seconds))
+        results["micro"].update(micro_name_match(args.micro_seconds, args.index_size))
+        for name, summary in results["micro"].items():
+            print(f"{name:>16}: {summary['throughput_rps']:9.1f} ops/s  p50 {summary['p50_ms']:.3f}ms  "
+                  f"p99 {summary['p99_ms']:.3f}ms")
+
+    server.shutdown()
+    fake.shutdown()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
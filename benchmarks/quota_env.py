@@ -0,0 +1,20 @@
+"""
+Environment shared by the benchmarks that start the app: Google quota off.
+
+The fake upstream spends no real quota, so a client-side budget would only
+measure the limiter instead of the code under test.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from throttle import DEFAULT_BUDGETS
+
+QUOTA_ENV = [f"QUOTA_{name.upper()}_QPS" for name in DEFAULT_BUDGETS]
+
+
+def disable_quota(env):
+    """Sets every QUOTA_*_QPS budget in `env` (a dict, or os.environ) to 0, overriding the deployment's."""
+    for name in QUOTA_ENV:
+        env[name] = "0"
+    return env
@@ -0,0 +1,352 @@
+"""
+Response cache for Google Places / Geocoding lookups.
+
+Hospital metadata changes rarely and traffic is skewed toward a few thousand
+popular place_ids, so repeat lookups are served from an in-process LRU with a
+TTL per kind of lookup ('details', 'nearby', 'geocode'). An optional SQLite
+tier keeps entries across restarts. Keys are normalized by the *_key helpers
+below so equivalent requests share an entry.
+
+Entries are kept for a grace window past their TTL. With a Refresher attached,
+hot entries are reloaded in the background shortly before they expire, and a
+hot entry that has already expired is served stale while it is reloaded.
+Cold stale entries are reloaded synchronously, and are still served if the
+reload fails.
+
+Cached values are shared between requests and must be treated as read-only.
+get_or_load_async applies the same rules to coroutine loaders (asgi_app.py).
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from refresher import CACHE_REFRESH_ENABLED, Refresher
+from singleflight import upstream_flights
+
+MISSING = object() # Sentinel for "not in cache", since falsy values ([] from geocode) are cacheable
+
+
+class Uncached(object):
+    """Wraps a loader result that is returned to the caller but not cached, e.g. a partial answer."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def unwrap(value):
+    """The value inside an Uncached, or `value` itself."""
+    return value.value if isinstance(value, Uncached) else value
+
+# kind -> (ttl in seconds, max in-memory entries)
+DEFAULT_POLICIES = {
+    'details': (int(os.environ.get("CACHE_TTL_DETAILS", str(24 * 3600))),
+                int(os.environ.get("CACHE_SIZE_DETAILS", "5000"))),
+    'nearby': (int(os.environ.get("CACHE_TTL_NEARBY", str(6 * 3600))),
+               int(os.environ.get("CACHE_SIZE_NEARBY", "1000"))),
+    'geocode': (int(os.environ.get("CACHE_TTL_GEOCODE", str(30 * 24 * 3600))),
+                int(os.environ.get("CACHE_SIZE_GEOCODE", "5000"))),
+}
+# kind -> seconds an expired entry may still be served (stale-while-revalidate)
+DEFAULT_GRACE = {
+    'details': int(os.environ.get("CACHE_GRACE_DETAILS", str(12 * 3600))),
+    'nearby': int(os.environ.get("CACHE_GRACE_NEARBY", str(3 * 3600))),
+    'geocode': int(os.environ.get("CACHE_GRACE_GEOCODE", str(7 * 24 * 3600))),
+}
+CACHE_REFRESH_AHEAD = float(os.environ.get("CACHE_REFRESH_AHEAD", "0.1")) # Last fraction of a TTL in which hot entries are refreshed
+CACHE_DISK_PATH = os.environ.get("CACHE_DISK_PATH") # e.g. /var/cache/hospital-api/cache.sqlite3; unset disables the disk tier
+
+
+# --- Key normalization ---
+def details_key(place_id, fields):
+    return f"{place_id}|{','.join(sorted(set(fields)))}"
+
+
+def nearby_key(location, radius, types, precision=4):
+    """Rounds the centre to `precision` decimals (4 ~ 11 m) so nearby points share an entry."""
+    try:
+        lat, lon = [round(float(x), precision) for x in str(location).split(',')]
+        return f"{lat},{lon}|{int(float(radius))}|{str(types).strip().lower()}"
+    except ValueError: # Let the upstream reject it; just don't share the entry
+        return f"{str(location).replace(' ', '')}|{radius}|{types}"
+
+
+def geocode_key(name):
+    return re.sub(r'\s+', ' ', name).strip().lower()
+
+
+class LRUCache(object):
+    """Thread-safe, size-bounded LRU with per-entry expiry."""
+
+    def __init__(self, maxsize, ttl, grace=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.grace = grace # Seconds past expiry an entry is kept for stale reads
+        self._data = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        value, expires_at = self.get_entry(key)
+        return value if value is MISSING or expires_at >= time.time() else MISSING
+
+    def get_entry(self, key):
+        """Returns (value, expires_at), including stale entries within the grace window; (MISSING, None) otherwise."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING, None
+            expires_at, value = entry
+            now = time.time()
+            if expires_at + self.grace < now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING, None
+            self._data.move_to_end(key)
+            if expires_at < now:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return value, expires_at
+
+    def peek(self, key):
+        """Returns the fresh value or MISSING, without counting a hit or miss or touching the LRU order."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[0] < time.time():
+            return MISSING
+        return entry[1]
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl, "grace": self.grace,
+                    "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+
+class SQLiteCache(object):
+    """On-disk tier shared by all kinds; survives restarts. Values are stored as JSON."""
+
+    def __init__(self, path, max_rows=200000, grace=0):
+        self.path = path
+        self.max_rows = max_rows
+        self.grace = grace # Longest grace window of any kind; rows are pruned only after it
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache ("
+                           "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                           "expires_at REAL NOT NULL, PRIMARY KEY (kind, key))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, kind, key, grace=0):
+        """Returns (value, expires_at), or (MISSING, None) if absent or expired for more than `grace` seconds."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE kind = ? AND key = ?",
+                                     (kind, key)).fetchone()
+            if row is None or row[1] + grace < time.time():
+                self.misses += 1
+                return MISSING, None
+            self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def peek(self, kind, key):
+        """Returns (value, expires_at) of a fresh row, or (MISSING, None), without counting a hit or miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE kind = ? AND key = ?",
+                                     (kind, key)).fetchone()
+        if row is None or row[1] < time.time():
+            return MISSING, None
+        return json.loads(row[0]), row[1]
+
+    def set(self, kind, key, value, expires_at):
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (kind, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                               (kind, key, payload, expires_at))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._prune()
+
+    def _prune(self):
+        cursor = self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time() - self.grace,))
+        self.evictions += cursor.rowcount
+        overflow = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_rows
+        if overflow > 0:
+            cursor = self._conn.execute("DELETE FROM cache WHERE rowid IN "
+                                        "(SELECT rowid FROM cache ORDER BY expires_at LIMIT ?)", (overflow,))
+            self.evictions += cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            return {"path": self.path, "rows": rows, "max_rows": self.max_rows,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class ResponseCache(object):
+    """In-process LRU per kind in front of an optional SQLite tier."""
+
+    def __init__(self, policies=None, disk_path=None, flights=None, grace=None, refresher=None):
+        policies = policies or DEFAULT_POLICIES
+        grace = DEFAULT_GRACE if grace is None else grace
+        self.memory = {kind: LRUCache(maxsize, ttl, grace.get(kind, 0)) for kind, (ttl, maxsize) in policies.items()}
+        self.disk = SQLiteCache(disk_path, grace=max(grace.values() or [0])) if disk_path else None
+        self.flights = flights # Optional SingleFlight: concurrent misses on one key share a single load
+        self.refresher = refresher # Optional Refresher for hot entries near or past expiry
+        self.stale_served = 0
+
+    def get_entry(self, kind, key):
+        """Returns (value, expires_at) from memory or disk, including stale entries within the grace window."""
+        value, expires_at = self.memory[kind].get_entry(key)
+        if value is MISSING and self.disk is not None:
+            value, expires_at = self.disk.get(kind, key, grace=self.memory[kind].grace)
+            if value is not MISSING:
+                self.memory[kind].set(key, value, expires_at) # Promote to the memory tier
+        return value, expires_at
+
+    def get(self, kind, key):
+        """Returns the fresh cached value, or MISSING."""
+        value, expires_at = self.get_entry(kind, key)
+        return value if value is MISSING or expires_at >= time.time() else MISSING
+
+    def peek(self, kind, key):
+        """Returns the fresh cached value, or MISSING, without counting a hit or miss."""
+        value = self.memory[kind].peek(key)
+        if value is MISSING and self.disk is not None:
+            value, expires_at = self.disk.peek(kind, key)
+            if value is not MISSING:
+                self.memory[kind].set(key, value, expires_at)
+        return value
+
+    def set(self, kind, key, value):
+        expires_at = time.time() + self.memory[kind].ttl
+        self.memory[kind].set(key, value, expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(kind, key, value, expires_at)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                print(f"Error writing {kind} entry to disk cache: {e}")
+
+    def get_or_load(self, kind, key, loader):
+        """
+        Returns the cached value, or calls loader() and caches its result unless it is None.
+        Hot entries are refreshed in the background near expiry and served stale past it.
+        """
+        value, serve = self._lookup(kind, key, lambda: self._coalesced_load(kind, key, loader))
+        if serve:
+            return value
+        loaded = self._coalesced_load(kind, key, loader, recheck=True)
+        return self._loaded_or_stale(loaded, value)
+
+    async def get_or_load_async(self, kind, key, loader, flights):
+        """
+        get_or_load for a coroutine function `loader`; concurrent misses share one load through
+        `flights` (an AsyncSingleFlight). Background refreshes still run on the refresher's
+        threads, which hand the load back to this event loop.
+        """
+        loop = asyncio.get_running_loop()
+        value, serve = self._lookup(kind, key, lambda: asyncio.run_coroutine_threadsafe(
+            flights.do(kind, key, lambda: self._load_async(kind, key, loader)), loop).result())
+        if serve:
+            return value
+        loaded = await flights.do(kind, key, lambda: self._load_async(kind, key, loader, recheck=True))
+        return self._loaded_or_stale(loaded, value)
+
+    def _lookup(self, kind, key, reload):
+        """
+        Returns (cached value or MISSING, whether to serve it without loading). Hot entries
+        near or past expiry get reload() scheduled on the refresher.
+        """
+        if self.refresher is not None:
+            self.refresher.record_access(kind, key)
+        value, expires_at = self.get_entry(kind, key)
+        if value is MISSING:
+            return value, False
+        remaining = expires_at - time.time()
+        refreshing = (self.refresher is not None and remaining < CACHE_REFRESH_AHEAD * self.memory[kind].ttl
+                      and self.refresher.is_hot(kind, key) and self.refresher.refresh(kind, key, reload))
+        if remaining >= 0:
+            return value, True
+        if refreshing:
+            self.stale_served += 1
+            return value, True
+        return value, False
+
+    def _loaded_or_stale(self, loaded, stale):
+        if loaded is None and stale is not MISSING:
+            self.stale_served += 1
+            return stale # The upstream failed; a stale answer beats none
+        return loaded
+
+    def _coalesced_load(self, kind, key, loader, recheck=False):
+        if self.flights is None:
+            return self._load(kind, key, loader, recheck)
+        # Followers wait for the leader's load; the leader looks again in case a load just finished
+        return self.flights.do(kind, key, lambda: self._load(kind, key, loader, recheck))
+
+    def _load(self, kind, key, loader, recheck=False):
+        # The caller already counted its miss; the recheck must not count another
+        value = self.peek(kind, key) if recheck else MISSING
+        if value is MISSING:
+            value = loader()
+            if isinstance(value, Uncached):
+                return value.value
+            if value is not None:
+                self.set(kind, key, value)
+        return value
+
+    async def _load_async(self, kind, key, loader, recheck=False):
+        value = self.peek(kind, key) if recheck else MISSING
+        if value is MISSING:
+            value = await loader()
+            if isinstance(value, Uncached):
+                return value.value
+            if value is not None:
+                self.set(kind, key, value)
+        return value
+
+    def clear(self):
+        for lru in self.memory.values():
+            lru.clear()
+
+    def stats(self):
+        stats = {kind: lru.stats() for kind, lru in self.memory.items()}
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        if self.refresher is not None:
+            stats['refresh'] = dict(self.refresher.stats(), stale_served=self.stale_served)
+        return stats
+
+
+response_cache = ResponseCache(disk_path=CACHE_DISK_PATH, flights=upstream_flights,
+                               refresher=Refresher() if CACHE_REFRESH_ENABLED else None)
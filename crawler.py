@@ -0,0 +1,167 @@
+"""
+Crawl jobs for multi-page, multi-specialty Lybrate scraping.
+
+A job takes a set of (city, specialty, page range) targets, like the
+Specialities_by_city.csv loop in Doctor_rating_lr.ipynb, and fetches them
+with bounded concurrency behind a per-host politeness rate limit. Pages of a
+target are fetched in order and the target stops at the first page that
+yields no doctors. Doctors are deduped by profile_link, and the results are
+written to a single Parquet file instead of appended to per-specialty CSVs.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from throttle import RateLimiter
+
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "4")) # Targets crawled at once, across all jobs
+CRAWL_RATE_LIMIT = float(os.environ.get("CRAWL_RATE_LIMIT", "2")) # Lybrate pages per second, across all jobs
+CRAWL_OUTPUT_DIR = os.environ.get("CRAWL_OUTPUT_DIR", "crawl_output")
+CRAWL_MAX_JOBS = 100 # Finished jobs kept for status queries
+MAX_PAGES_PER_TARGET = 50
+
+
+class CrawlTarget(object):
+    def __init__(self, city, specialty, first_page=1, last_page=9):
+        self.city = city
+        self.specialty = specialty
+        self.first_page = first_page
+        self.last_page = last_page
+
+    def to_dict(self):
+        return {"city": self.city, "specialty": self.specialty,
+                "first_page": self.first_page, "last_page": self.last_page}
+
+
+class CrawlJob(object):
+    def __init__(self, targets, output_dir):
+        self.job_id = uuid.uuid4().hex
+        self.targets = targets
+        self.output_path = os.path.join(output_dir, f"{self.job_id}.parquet")
+        self.status = 'queued' # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.finished_at = None
+        self.pages_fetched = 0
+        self.targets_done = 0
+        self.duplicates = 0
+        self.errors = []
+        self.records = []
+        self._seen_profiles = set()
+        self._pending = len(targets)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Moves a queued job to running when the pool picks up its first target."""
+        with self._lock:
+            if self.status == 'queued':
+                self.status = 'running'
+
+    def add_page(self, target, page, doctors):
+        with self._lock:
+            self.pages_fetched += 1
+            for doctor in doctors:
+                key = doctor.get('profile_link') or (doctor.get('name'), doctor.get('address'))
+                if key in self._seen_profiles:
+                    self.duplicates += 1
+                    continue
+                self._seen_profiles.add(key)
+                record = dict(doctor)
+                record['page'] = page
+                self.records.append(record)
+
+    def add_error(self, target, page, message):
+        with self._lock:
+            if len(self.errors) < 100:
+                self.errors.append({"city": target.city, "specialty": target.specialty,
+                                    "page": page, "error": message})
+
+    def target_finished(self):
+        """Marks one target done; returns True when it was the last one."""
+        with self._lock:
+            self.targets_done += 1
+            self._pending -= 1
+            return self._pending == 0
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "targets_total": len(self.targets),
+                "targets_done": self.targets_done,
+                "pages_fetched": self.pages_fetched,
+                "doctors": len(self.records),
+                "duplicates_skipped": self.duplicates,
+                "errors": list(self.errors),
+                "output_path": self.output_path if self.status == 'done' else None,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at
+            }
+
+
+class CrawlManager(object):
+    """Runs crawl jobs on a shared, bounded pool using `scrape_page(city, specialty, page)`."""
+
+    def __init__(self, scrape_page, concurrency=CRAWL_CONCURRENCY, rate_limit=CRAWL_RATE_LIMIT,
+                 output_dir=CRAWL_OUTPUT_DIR):
+        self.scrape_page = scrape_page
+        self.output_dir = output_dir
+        self.politeness = RateLimiter(rate_limit, burst=1) # One host (lybrate.com), so one shared limiter
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="crawl")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, targets):
+        job = CrawlJob(targets, self.output_dir)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > CRAWL_MAX_JOBS: # Oldest finished first; queued and running jobs are kept
+                finished = next((job_id for job_id, old in self._jobs.items() if old.finished_at is not None), None)
+                if finished is None:
+                    break
+                del self._jobs[finished]
+        for target in targets:
+            self._executor.submit(self._crawl_target, job, target)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _crawl_target(self, job, target):
+        job.start()
+        try:
+            for page in range(target.first_page, target.last_page + 1):
+                self.politeness.acquire()
+                result = self.scrape_page(target.city, target.specialty, page)
+                if result.get('error'):
+                    job.add_error(target, page, result['error'])
+                    break
+                doctors = result.get('doctors', [])
+                job.add_page(target, page, doctors)
+                if not doctors: # Past the last page of this specialty
+                    break
+        except Exception as e:
+            print(f"Error crawling {target.city}/{target.specialty}: {e}")
+            job.add_error(target, None, str(e))
+        finally:
+            if job.target_finished():
+                self._finish(job)
+
+    def _finish(self, job):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            columns = ["name", "profile_link", "degree", "address", "rating_votes", "experience",
+                       "charges", "scraped_specialty", "scraped_city", "page"]
+            pd.DataFrame(job.records, columns=columns).to_parquet(job.output_path, index=False)
+            job.status = 'done'
+        except Exception as e:
+            print(f"Error writing crawl output {job.output_path}: {e}")
+            job.add_error(CrawlTarget(None, None), None, f"Could not write output: {e}")
+            job.status = 'failed'
+        job.finished_at = time.time()
@@ -0,0 +1,452 @@
+"""
+Columnar store of scraped doctors and Google Places results.
+
+Records are upserted into NumPy columns keyed by profile_link / place_id:
+numeric fields are parsed once at ingest (rating percentage and votes,
+years of experience, consultation fee), and city/specialty/type are stored
+as integer category codes. Queries are boolean masks plus a partial sort,
+so filtering and ranking millions of rows takes milliseconds. Changed rows
+are appended to Parquet part files on a background thread and reloaded on
+start; parts are compacted into one file once there are too many.
+"""
+import atexit
+import glob
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from spatial_index import haversine_m
+
+DATASET_DIR = os.environ.get("DATASET_DIR", "") # Parquet directory; empty (the default) keeps the store in memory only
+DATASET_FLUSH_ROWS = int(os.environ.get("DATASET_FLUSH_ROWS", "2000")) # Changed rows written per Parquet part
+DATASET_FLUSH_INTERVAL = float(os.environ.get("DATASET_FLUSH_INTERVAL", "60")) # Max seconds changed rows wait for a flush
+DATASET_MAX_PARTS = 32 # Beyond this many part files the table is rewritten as one
+DOCTOR_PRIOR_VOTES = 10 # Votes worth of the average rating mixed into each doctor's score
+HOSPITAL_PRIOR_REVIEWS = 50 # Reviews worth of the average rating mixed into each hospital's score
+
+flush_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dataset-flush") # Parquet writes, off request threads
+
+RATING_PERCENT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+VOTES_RE = re.compile(r'(\d[\d,]*)\s*(?:votes?|ratings?)', re.IGNORECASE)
+EXPERIENCE_RE = re.compile(r'(\d+)\s*(?:\+\s*)?years?', re.IGNORECASE)
+FEE_RE = re.compile(r'(?:₹|Rs\.?|INR)\s*([\d,]+)', re.IGNORECASE)
+
+
+# --- Parsing at ingest ---
+def _number(match, group=1):
+    return float(match.group(group).replace(',', '')) if match else math.nan
+
+
+def parse_rating_votes(text):
+    """'92% (22 votes)' -> (92.0, 22.0); missing parts are NaN."""
+    text = text or ''
+    return _number(RATING_PERCENT_RE.search(text)), _number(VOTES_RE.search(text))
+
+
+def parse_experience(text):
+    """'13 Years Experience' -> 13.0"""
+    return _number(EXPERIENCE_RE.search(text or ''))
+
+
+def parse_charges(text):
+    """'₹ 400 Consultation Fee' -> 400.0"""
+    return _number(FEE_RE.search(text or ''))
+
+
+class ColumnTable(object):
+    """
+    Keyed table of NumPy columns: float columns (NaN for missing), category columns stored as
+    int32 codes, and plain text columns. Upserts replace a row in place, so row numbers are stable.
+    """
+
+    def __init__(self, name, key, numeric, categories, text, integers=(), directory=None, capacity=1024):
+        self.name = name
+        self.key = key
+        self.numeric = list(numeric)
+        self.integers = set(integers) # Numeric columns returned as ints
+        self.categories = list(categories)
+        self.text = [key] + [column for column in text if column != key]
+        self.directory = os.path.join(directory, name) if directory else None
+        self._size = 0
+        self._rows = {} # key -> row
+        self._values = {column: np.full(capacity, math.nan) for column in self.numeric}
+        self._codes = {column: np.full(capacity, -1, dtype=np.int32) for column in self.categories}
+        self._vocab = {column: {} for column in self.categories} # value -> code
+        self._labels = {column: [] for column in self.categories} # code -> value
+        self._texts = {column: [] for column in self.text}
+        self._dirty = set() # rows changed since the last flush
+        self._last_flush = time.time()
+        self._flush_queued = False
+        self._loading = False
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock() # One writer at a time, so parts land in snapshot order
+        if self.directory:
+            self._load()
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, rows=1):
+        capacity = len(self._values[self.numeric[0]]) if self.numeric else len(self._codes[self.categories[0]])
+        if self._size + rows <= capacity:
+            return
+        extra = max(capacity, self._size + rows - capacity)
+        for column in self.numeric:
+            self._values[column] = np.concatenate([self._values[column], np.full(extra, math.nan)])
+        for column in self.categories:
+            self._codes[column] = np.concatenate([self._codes[column], np.full(extra, -1, dtype=np.int32)])
+
+    def category_mask(self, codes, column, value):
+        """Rows of `codes` (a view from columns()) whose `column` equals `value`."""
+        code = self._vocab[column].get(value)
+        if code is None: # Never stored; -1 would match the rows missing a value
+            return np.zeros(len(codes), dtype=bool)
+        return codes == code
+
+    def _code_for_insert(self, column, value):
+        if value is None:
+            return -1
+        vocab = self._vocab[column]
+        code = vocab.get(value)
+        if code is None:
+            code = vocab[value] = len(self._labels[column])
+            self._labels[column].append(value)
+        return code
+
+    def upsert(self, records):
+        """Adds or replaces records (dicts with the key, numeric, category and text columns)."""
+        with self._lock:
+            for record in records:
+                key = record.get(self.key)
+                if not key:
+                    continue
+                row = self._rows.get(key)
+                if row is None:
+                    self._grow()
+                    row = self._rows[key] = self._size
+                    self._size += 1
+                    for column in self.text:
+                        self._texts[column].append(record.get(column))
+                else:
+                    for column in self.text:
+                        self._texts[column][row] = record.get(column)
+                for column in self.numeric:
+                    value = record.get(column)
+                    self._values[column][row] = math.nan if value is None else value
+                for column in self.categories:
+                    self._codes[column][row] = self._code_for_insert(column, record.get(column))
+                self._dirty.add(row)
+            self._maybe_flush()
+
+    def update(self, key, changes):
+        """Overwrites `changes` (column -> value) on the row of `key`, keeping its other columns; False if unknown."""
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return False
+            record = self.records(np.array([row]))[0]
+            record.update(changes)
+            self.upsert([record])
+            return True
+
+    def upsert_frame(self, frame):
+        """Bulk upsert of a DataFrame; rows with new keys are appended column-wise instead of one by one."""
+        frame = frame[frame[self.key].notna()].drop_duplicates(subset=self.key, keep='last')
+        with self._lock:
+            known = frame[self.key].isin(self._rows)
+            if known.any():
+                updates = frame[known]
+                self.upsert(updates.astype(object).where(updates.notna(), None).to_dict('records'))
+            new = frame[~known]
+            if new.empty:
+                return
+            self._grow(len(new))
+            start, end = self._size, self._size + len(new)
+            for column in self.text:
+                values = new[column].astype(object).where(new[column].notna(), None) if column in new else [None] * len(new)
+                self._texts[column].extend(list(values))
+            for column in self.numeric:
+                if column in new:
+                    self._values[column][start:end] = pd.to_numeric(new[column], errors='coerce').to_numpy(dtype=float)
+            for column in self.categories:
+                if column not in new:
+                    continue
+                codes, uniques = pd.factorize(new[column]) # -1 for missing values
+                mapping = np.array([self._code_for_insert(column, value) for value in uniques] + [-1], dtype=np.int32)
+                self._codes[column][start:end] = mapping[codes]
+            self._rows.update(zip(new[self.key].tolist(), range(start, end)))
+            self._size = end
+            self._dirty.update(range(start, end))
+            self._maybe_flush()
+
+    def columns(self):
+        """Views of the numeric and code columns up to the current size, for vectorized queries."""
+        with self._lock:
+            size = self._size
+            return ({column: values[:size] for column, values in self._values.items()},
+                    {column: codes[:size] for column, codes in self._codes.items()})
+
+    def records(self, rows):
+        """Row dicts for `rows`, in order."""
+        with self._lock:
+            out = []
+            for row in rows.tolist():
+                record = {column: self._texts[column][row] for column in self.text}
+                for column in self.categories:
+                    code = int(self._codes[column][row])
+                    record[column] = self._labels[column][code] if code >= 0 else None
+                for column in self.numeric:
+                    value = float(self._values[column][row])
+                    record[column] = None if math.isnan(value) else int(value) if column in self.integers else value
+                out.append(record)
+            return out
+
+    # --- Persistence ---
+    def _snapshot(self, rows):
+        """Copies of `rows` (sorted row numbers) from every column; cheap enough to take under the lock."""
+        if len(rows) == self._size: # The whole table: slicing beats gathering row by row
+            texts = {column: self._texts[column][:self._size] for column in self.text}
+        else:
+            texts = {column: [self._texts[column][row] for row in rows.tolist()] for column in self.text}
+        codes = {column: (self._codes[column][rows], list(self._labels[column])) for column in self.categories}
+        values = {column: self._values[column][rows] for column in self.numeric}
+        return texts, codes, values
+
+    @staticmethod
+    def _frame(snapshot):
+        texts, codes, values = snapshot
+        data = dict(texts)
+        for column, (column_codes, labels) in codes.items(): # Code -1 picks the trailing None
+            data[column] = np.asarray(labels + [None], dtype=object)[column_codes]
+        data.update(values)
+        return pd.DataFrame(data)
+
+    def _maybe_flush(self):
+        """Queues a flush on the background writer once enough rows changed or waited long enough (lock held)."""
+        if (self.directory and self._dirty and not self._loading and not self._flush_queued
+                and (len(self._dirty) >= DATASET_FLUSH_ROWS or time.time() - self._last_flush >= DATASET_FLUSH_INTERVAL)):
+            self._flush_queued = True
+            flush_executor.submit(self.flush)
+
+    def flush(self):
+        """
+        Writes rows changed since the last flush as a new Parquet part, or the whole table as one
+        part once there are DATASET_MAX_PARTS. Rows are copied under the table lock and written
+        outside it, so upserts and queries never wait on Parquet.
+        """
+        if not self.directory:
+            return
+        with self._write_lock:
+            parts = self._parts() if os.path.isdir(self.directory) else []
+            compact = len(parts) >= DATASET_MAX_PARTS # Compact: one part holding the whole table
+            with self._lock:
+                self._flush_queued = False
+                if not self._dirty:
+                    return
+                dirty, self._dirty = self._dirty, set()
+                rows = np.arange(self._size) if compact else np.array(sorted(dirty), dtype=np.intp)
+                snapshot = self._snapshot(rows)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self._write_part(self._frame(snapshot))
+                if compact:
+                    for path in parts:
+                        os.remove(path)
+            except Exception as e:
+                print(f"Error writing {self.name} dataset part: {e}")
+                with self._lock:
+                    self._dirty |= dirty # Retried by the next flush
+            self._last_flush = time.time()
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.directory, "part-*.parquet")))
+
+    def _write_part(self, frame):
+        # Part names sort by creation time, so later parts override earlier ones on load
+        path = os.path.join(self.directory, f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet")
+        frame.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    def _load(self):
+        self._loading = True
+        for path in self._parts() if os.path.isdir(self.directory) else []:
+            try:
+                frame = pd.read_parquet(path)
+            except Exception as e:
+                print(f"Error reading dataset part {path}: {e}")
+                continue
+            self.upsert_frame(frame)
+        self._dirty = set() # Everything loaded is already on disk
+        self._loading = False
+
+    def stats(self):
+        with self._lock:
+            return {"rows": self._size, "unflushed_rows": len(self._dirty),
+                    "parts": len(self._parts()) if self.directory and os.path.isdir(self.directory) else 0,
+                    "categories": {column: len(labels) for column, labels in self._labels.items()}}
+
+
+def _weighted_score(rating, count, prior_count):
+    """Bayesian average: each rating is pulled toward the mean of all given ratings by `prior_count` votes."""
+    count = np.nan_to_num(count)
+    rated = ~np.isnan(rating)
+    mean = rating[rated].mean() if rated.any() else 0.0
+    return (np.nan_to_num(rating) * count + mean * prior_count) / (count + prior_count)
+
+
+def _top(rows, keys, limit, offset, descending=True):
+    """
+    Picks rows[offset:offset + limit] ordered by `keys` (one per row, NaN last);
+    only the needed prefix is fully sorted. Returns (rows, their keys).
+    """
+    needed = min(offset + limit, len(rows))
+    if needed == 0:
+        return rows[:0], keys[:0]
+    order_keys = -keys if descending else keys.copy()
+    order_keys[np.isnan(order_keys)] = np.inf
+    if needed < len(rows):
+        part = np.argpartition(order_keys, needed - 1)[:needed]
+        rows, keys, order_keys = rows[part], keys[part], order_keys[part]
+    # Ties keep row order, so pages are stable between identical queries
+    order = np.lexsort((rows, order_keys))[offset:offset + limit]
+    return rows[order], keys[order]
+
+
+class DoctorStore(object):
+    """Doctors from Lybrate listings, keyed by profile_link."""
+    SORTS = {'score': True, 'rating': True, 'votes': True, 'experience': True, 'fee': False} # column -> descending
+
+    def __init__(self, directory=DATASET_DIR):
+        self.table = ColumnTable("doctors", key="profile_link",
+                                 numeric=["rating_percent", "votes", "experience_years", "fee", "scraped_at"],
+                                 categories=["scraped_city", "scraped_specialty"],
+                                 text=["name", "degree", "address", "rating_votes", "experience", "charges"],
+                                 integers=["votes", "experience_years", "fee"], directory=directory)
+
+    def ingest(self, doctors, scraped_at=None):
+        scraped_at = scraped_at or time.time()
+        records = []
+        for doctor in doctors:
+            rating, votes = parse_rating_votes(doctor.get('rating_votes'))
+            record = dict(doctor)
+            record.update({
+                "scraped_city": (doctor.get('scraped_city') or '').lower() or None,
+                "scraped_specialty": (doctor.get('scraped_specialty') or '').lower() or None,
+                "rating_percent": rating, "votes": votes,
+                "experience_years": parse_experience(doctor.get('experience')),
+                "fee": parse_charges(doctor.get('charges')),
+                "scraped_at": scraped_at,
+            })
+            records.append(record)
+        self.table.upsert(records)
+
+    def query(self, city=None, specialty=None, min_rating=None, min_votes=None, max_fee=None,
+              min_experience=None, sort='score', limit=20, offset=0):
+        """Returns (matching doctors ranked by `sort`, total matches)."""
+        values, codes = self.table.columns()
+        mask = np.ones(len(values["votes"]), dtype=bool)
+        for column, value in (("scraped_city", city), ("scraped_specialty", specialty)):
+            if value:
+                mask &= self.table.category_mask(codes[column], column, value.lower())
+        # NaN comparisons are False, so rows missing a filtered value drop out
+        if min_rating is not None:
+            mask &= values["rating_percent"] >= min_rating
+        if min_votes is not None:
+            mask &= values["votes"] >= min_votes
+        if max_fee is not None:
+            mask &= values["fee"] <= max_fee
+        if min_experience is not None:
+            mask &= values["experience_years"] >= min_experience
+
+        rows = np.nonzero(mask)[0]
+        if sort == 'score':
+            keys = _weighted_score(values["rating_percent"][rows], values["votes"][rows], DOCTOR_PRIOR_VOTES)
+        else:
+            keys = values[{"rating": "rating_percent", "votes": "votes", "experience": "experience_years",
+                           "fee": "fee"}[sort]][rows]
+        top, keys = _top(rows, keys, limit, offset, descending=self.SORTS[sort])
+        doctors = self.table.records(top)
+        if sort == 'score':
+            for doctor, score in zip(doctors, keys.tolist()):
+                doctor["score"] = round(score, 2)
+        return doctors, len(rows)
+
+
+class HospitalStore(object):
+    """Places seen in Nearby and Details responses, keyed by place_id."""
+    SORTS = {'score': True, 'rating': True, 'reviews': True} # column -> descending
+
+    def __init__(self, directory=DATASET_DIR):
+        self.table = ColumnTable("hospitals", key="place_id",
+                                 numeric=["rating", "user_ratings_total", "lat", "lng", "updated_at"],
+                                 categories=["type"],
+                                 text=["name", "vicinity"],
+                                 integers=["user_ratings_total"], directory=directory)
+
+    def ingest_places(self, places, place_type=None):
+        now = time.time()
+        records = []
+        for place in places:
+            location = place.get('geometry', {}).get('location') or place.get('location') or {}
+            records.append({
+                "place_id": place.get('place_id'), "name": place.get('name'), "vicinity": place.get('vicinity'),
+                "rating": place.get('rating'), "user_ratings_total": place.get('user_ratings_total'),
+                "lat": location.get('lat'), "lng": location.get('lng'),
+                "type": str(place_type).strip().lower() if place_type else None, "updated_at": now,
+            })
+        self.table.upsert(records)
+
+    def update_details(self, details):
+        """Refreshes rating fields of a known place from a details response, keeping its other columns."""
+        changes = {key: details[key] for key in ("name", "vicinity", "rating", "user_ratings_total") if key in details}
+        changes["updated_at"] = time.time()
+        self.table.update(details.get('place_id'), changes)
+
+    def query(self, lat=None, lon=None, radius=None, place_type=None, min_rating=None, min_reviews=None,
+              sort='score', limit=20, offset=0):
+        """Returns (matching places ranked by `sort`, total matches)."""
+        values, codes = self.table.columns()
+        mask = np.ones(len(values["rating"]), dtype=bool)
+        if place_type:
+            mask &= self.table.category_mask(codes["type"], "type", place_type.strip().lower())
+        if min_rating is not None:
+            mask &= values["rating"] >= min_rating
+        if min_reviews is not None:
+            mask &= values["user_ratings_total"] >= min_reviews
+        distances = None
+        if lat is not None and lon is not None and radius is not None:
+            dlat = radius / 111320.0
+            dlon = radius / (111320.0 * max(math.cos(math.radians(lat)), 1e-6))
+            mask &= (np.abs(values["lat"] - lat) <= dlat) & (np.abs(values["lng"] - lon) <= dlon) # Cheap box first
+        rows = np.nonzero(mask)[0]
+        if lat is not None and lon is not None and radius is not None:
+            distances = haversine_m(lat, lon, values["lat"][rows], values["lng"][rows])
+            inside = distances <= radius
+            rows, distances = rows[inside], distances[inside]
+
+        if sort == 'score':
+            keys = _weighted_score(values["rating"][rows], values["user_ratings_total"][rows], HOSPITAL_PRIOR_REVIEWS)
+        else:
+            keys = values["rating" if sort == 'rating' else "user_ratings_total"][rows]
+        top, top_keys = _top(rows, keys, limit, offset, descending=self.SORTS[sort])
+        places = self.table.records(top)
+        if distances is not None: # Recomputed for the page only; cheaper than carrying them through the sort
+            for place, distance in zip(places, haversine_m(lat, lon, values["lat"][top], values["lng"][top]).tolist()):
+                place["distance_m"] = round(distance, 1)
+        if sort == 'score':
+            for place, score in zip(places, top_keys.tolist()):
+                place["score"] = round(score, 3)
+        return places, len(rows)
+
+
+doctor_store = DoctorStore()
+hospital_store = HospitalStore()
+atexit.register(doctor_store.table.flush)
+atexit.register(hospital_store.table.flush)
@@ -0,0 +1,166 @@
+"""
+Shared, thread-safe HTTP connection pooling for all outbound calls.
+
+One requests.Session is kept per upstream host, so repeated calls to
+maps.googleapis.com or lybrate.com reuse keep-alive connections instead of
+paying a fresh TCP+TLS handshake on every call. Each session retries
+429/5xx responses with exponential backoff and applies a per-host timeout.
+AsyncSessionPool is the aiohttp counterpart used by the async serving mode.
+"""
+import asyncio
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import aiohttp
+except ImportError: # Only the async serving mode (asgi_app.py) needs it
+    aiohttp = None
+
+# --- Configuration (overridable via environment variables) ---
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "20")) # Max keep-alive connections per host
+RETRY_TOTAL = int(os.environ.get("HTTP_RETRY_TOTAL", "3"))
+RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", "0.5")) # Sleeps 0.5s, 1s, 2s, ... between retries
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_TIMEOUT = (3.05, 10) # (connect, read) in seconds
+ASYNC_MAX_CONNECTIONS = int(os.environ.get("ASYNC_MAX_CONNECTIONS", "1000")) # Open upstream connections in async mode
+ASYNC_POOL_TIMEOUT = float(os.environ.get("ASYNC_POOL_TIMEOUT", "30")) # Seconds a call may wait for a free connection
+
+
+class SessionPool(object):
+    """Hands out one pooled, retrying requests.Session per upstream host."""
+
+    def __init__(self, pool_maxsize=POOL_MAXSIZE, retries=RETRY_TOTAL,
+                 backoff_factor=RETRY_BACKOFF, default_timeout=DEFAULT_TIMEOUT):
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.default_timeout = default_timeout
+        self._sessions = {}
+        self._timeouts = {}
+        self._pool_sizes = {} # host -> pool_maxsize, where it differs from the default
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _host_key(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _adapter(self, pool_maxsize):
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+            raise_on_status=False # Let callers see the final response and call raise_for_status()
+        )
+        return HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry, pool_block=False)
+
+    def _build_session(self, pool_maxsize):
+        adapter = self._adapter(pool_maxsize)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def session_for(self, url):
+        """Returns the shared session for the host of `url`, creating it on first use."""
+        key = self._host_key(url)
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = self._build_session(self._pool_sizes.get(key, self.pool_maxsize))
+                    self._sessions[key] = session
+        return session
+
+    def set_pool_size(self, url, pool_maxsize):
+        """
+        Keeps up to `pool_maxsize` connections for the host of `url`; set it to the number of threads
+        that call the host at once, or connections beyond the pool are closed after each call.
+        """
+        key = self._host_key(url)
+        with self._lock:
+            self._pool_sizes[key] = pool_maxsize
+            session = self._sessions.get(key)
+            if session is not None: # Already handed out (e.g. to googlemaps.Client); swap its adapter in place
+                adapter = self._adapter(pool_maxsize)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+    def set_timeout(self, url, timeout):
+        """Sets the (connect, read) timeout used for every call to the host of `url`."""
+        self._timeouts[self._host_key(url)] = timeout
+
+    def timeout_for(self, url):
+        return self._timeouts.get(self._host_key(url), self.default_timeout)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout_for(url))
+        return self.session_for(url).get(url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class AsyncSessionPool(object):
+    """
+    One aiohttp.ClientSession per event loop, with the per-host timeouts of `sessions` (a SessionPool)
+    and the same retry and backoff on 429/5xx and connection errors. Connections are capped by
+    `max_connections`; calls beyond it wait for a free one instead of opening more.
+    """
+
+    def __init__(self, sessions, max_connections=ASYNC_MAX_CONNECTIONS, retries=RETRY_TOTAL,
+                 backoff_factor=RETRY_BACKOFF, pool_timeout=ASYNC_POOL_TIMEOUT):
+        if aiohttp is None:
+            raise RuntimeError("The async serving mode needs aiohttp (pip install -r requirements.txt)")
+        self.sessions = sessions
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_timeout = pool_timeout
+        self._clients = {} # event loop -> session
+
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=0)
+            client = self._clients[loop] = aiohttp.ClientSession(connector=connector)
+        return client
+
+    async def get(self, url, params=None, headers=None):
+        """The response with its body already read (`await response.read()` returns it); raises aiohttp errors."""
+        connect, read = self.sessions.timeout_for(url)
+        # `connect` covers the wait for a pooled connection as well as opening one
+        timeout = aiohttp.ClientTimeout(connect=self.pool_timeout + connect, sock_connect=connect, sock_read=read)
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client().get(url, params=params, headers=headers, timeout=timeout)
+                await response.read() # Returns the connection to the pool; later reads return the same body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+                continue
+            if response.status not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            retry_after = response.headers.get('Retry-After', '')
+            await asyncio.sleep(float(retry_after) if retry_after.isdigit() else self.backoff_factor * 2 ** attempt)
+
+    async def close(self):
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+
+http_pool = SessionPool()
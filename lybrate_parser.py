@@ -0,0 +1,267 @@
+"""
+Compiled extraction of doctor cards from Lybrate listing pages.
+
+Produces the same records as the original scrape_lybrate_doctors loop, but
+only builds the listing container (SoupStrainer), walks each card once, and
+compiles every pattern at import time. The optional 'lxml' backend skips
+BeautifulSoup entirely and evaluates precompiled XPath on the lxml tree.
+"""
+import os
+import re
+
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer, Tag
+from bs4.dammit import UnicodeDammit
+from lxml import etree
+from lxml import html as lxml_html
+
+from metrics import timed
+
+LYBRATE_ORIGIN = "https://www.lybrate.com" # Profile links are always reported against the real site
+LYBRATE_PARSER = os.environ.get("LYBRATE_PARSER", "bs4") # 'bs4' or 'lxml'
+
+# --- Precompiled patterns ---
+CONTAINER_CLASS_RE = re.compile(r'grid__col-lt-20')
+RATING_PERCENTAGE_RE = re.compile(r'lybRating__percentage')
+RATING_COUNT_RE = re.compile(r'lybRating__count')
+EXPERIENCE_RE = re.compile(r'\d+ Years Experience', re.IGNORECASE)
+CONTAINER_STRAINER = SoupStrainer('div', class_=CONTAINER_CLASS_RE)
+
+CONTAINER_XPATH = etree.XPath("(//div[contains(@class, 'grid__col-lt-20')])[1]")
+DOCTOR_CARDS_XPATH = etree.XPath(".//div[contains(@class, 'ly-doctor')]")
+GRID_CARDS_XPATH = etree.XPath(".//div[contains(concat(' ', normalize-space(@class), ' '), ' grid ')]")
+TEXT_XPATH = etree.XPath(".//text()[not(parent::script) and not(parent::style)]")
+
+
+def parse_doctor_cards(content, city, specialty, backend=None):
+    """
+    Extracts doctor records from a listing page.
+    Returns (doctors, number of potential cards), like the original scraper's loop.
+    """
+    if (backend or LYBRATE_PARSER) == 'lxml':
+        return _parse_lxml(content, city, specialty)
+    return _parse_bs4(content, city, specialty)
+
+
+def _record(name, profile_link, degree, address, rating, experience, charges, city, specialty):
+    if not profile_link.startswith('http'):
+        profile_link = LYBRATE_ORIGIN + profile_link if profile_link.startswith('/') else ""
+    link_parts = profile_link.split('/')
+    return {
+        "name": name,
+        "profile_link": profile_link,
+        "degree": degree,
+        "address": address,
+        "rating_votes": rating,
+        "experience": experience,
+        "charges": charges,
+        "scraped_specialty": specialty, # The specialty used for search
+        "scraped_city": link_parts[3] if len(link_parts) > 3 else city # Extract city from URL if possible
+    }
+
+
+def _first_block(block_texts, predicate, default):
+    """First info block text (grid__col-xs-10, in document order) satisfying predicate."""
+    for text in block_texts:
+        if predicate(text):
+            return text.replace('\n', ' ')
+    return default
+
+
+def _is_rating(text):
+    return '%' in text and 'vote' in text.lower() # Heuristic for rating
+
+
+def _is_experience(text):
+    return 'experience' in text.lower()
+
+
+def _is_charges(text):
+    return '₹' in text or 'consultation fee' in text.lower()
+
+
+# --- BeautifulSoup backend ---
+def _parse_bs4(content, city, specialty):
+    with timed('lybrate_parse'):
+        soup = BeautifulSoup(content, 'lxml', parse_only=CONTAINER_STRAINER)
+        container = soup.find('div', class_=CONTAINER_CLASS_RE)
+        if container is None:
+            container = BeautifulSoup(content, 'lxml') # Fall back to searching the whole page
+
+    with timed('lybrate_extract'):
+        doctor_cards, grid_cards = [], []
+        for div in container.find_all('div'):
+            classes = div.get('class') or ()
+            if any('ly-doctor' in c for c in classes):
+                doctor_cards.append(div)
+            elif 'grid' in classes:
+                grid_cards.append(div)
+        potential_cards = doctor_cards or grid_cards
+
+        doctors = []
+        for card in potential_cards:
+            doctor = _extract_card_bs4(card, city, specialty)
+            if doctor:
+                doctors.append(doctor)
+    return doctors, len(potential_cards)
+
+
+def _extract_card_bs4(card, city, specialty):
+    """Collects every field in one walk over the card's descendants."""
+    name_tag = degree_tag = address_tag = rating_tag = fee_tag = experience_string = None
+    info_blocks = []
+    for node in card.descendants:
+        if isinstance(node, Tag):
+            if node.name == 'div':
+                classes = node.get('class') or ()
+                if degree_tag is None and any('ly-doctor__degree' in c for c in classes):
+                    degree_tag = node
+                if any('grid__col-xs-10' in c for c in classes):
+                    info_blocks.append(node)
+            elif node.name == 'span':
+                itemprop = node.get('itemprop')
+                if itemprop == 'streetAddress':
+                    address_tag = address_tag if address_tag is not None else node
+                elif itemprop == 'priceRange':
+                    fee_tag = fee_tag if fee_tag is not None else node
+                if rating_tag is None and any('lybRating' in c for c in node.get('class') or ()):
+                    rating_tag = node
+            elif node.name == 'h2' and name_tag is None and node.get('itemprop') == 'name':
+                name_tag = node
+        elif experience_string is None and isinstance(node, NavigableString) and EXPERIENCE_RE.search(node):
+            experience_string = node
+
+    name_link_tag = name_tag.find('a') if name_tag is not None else None
+    if name_link_tag is None:
+        return None # Skip if essential name link is missing
+    name = name_link_tag.get_text(strip=True)
+    if not name:
+        return None
+
+    block_texts = None
+    percentage_tag = rating_tag.find('span', class_=RATING_PERCENTAGE_RE) if rating_tag is not None else None
+    if percentage_tag is not None:
+        votes_tag = rating_tag.find('span', class_=RATING_COUNT_RE)
+        votes_text = votes_tag.get_text(strip=True) if votes_tag is not None else ""
+        rating = f"{percentage_tag.get_text(strip=True)} {votes_text}".strip()
+    else:
+        block_texts = [block.get_text(strip=True) for block in info_blocks]
+        rating = _first_block(block_texts, _is_rating, "0%")
+
+    if experience_string is not None:
+        experience = experience_string.strip()
+    else:
+        if block_texts is None:
+            block_texts = [block.get_text(strip=True) for block in info_blocks]
+        experience = _first_block(block_texts, _is_experience, "0 years experience")
+
+    if fee_tag is not None:
+        charges = fee_tag.get_text(strip=True)
+    else:
+        if block_texts is None:
+            block_texts = [block.get_text(strip=True) for block in info_blocks]
+        charges = _first_block(block_texts, _is_charges, "N/A")
+
+    degree = degree_tag.get_text(strip=True).replace('\n', ' ').replace(',', ';') if degree_tag is not None else "N/A"
+    address = address_tag.get_text(strip=True).replace('\n', ' ').replace(',', ';') if address_tag is not None else "N/A"
+    return _record(name, name_link_tag.get('href', ''), degree, address, rating, experience, charges, city, specialty)
+
+
+# --- lxml / XPath backend ---
+def _text(element):
+    """Equivalent of BeautifulSoup's get_text(strip=True)."""
+    return ''.join(piece.strip() for piece in TEXT_XPATH(element))
+
+
+def _class_tokens(element):
+    return (element.get('class') or '').split()
+
+
+def _parse_lxml(content, city, specialty):
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8')
+        except UnicodeDecodeError:
+            content = UnicodeDammit(content).unicode_markup
+    with timed('lybrate_parse'):
+        try:
+            root = lxml_html.document_fromstring(content)
+        except ValueError: # Unicode strings with an XML encoding declaration
+            root = lxml_html.document_fromstring(content.encode('utf-8'))
+
+    with timed('lybrate_extract'):
+        containers = CONTAINER_XPATH(root)
+        container = containers[0] if containers else root
+        potential_cards = DOCTOR_CARDS_XPATH(container) or GRID_CARDS_XPATH(container)
+
+        doctors = []
+        for card in potential_cards:
+            doctor = _extract_card_lxml(card, city, specialty)
+            if doctor:
+                doctors.append(doctor)
+    return doctors, len(potential_cards)
+
+
+def _extract_card_lxml(card, city, specialty):
+    """Collects every field in one walk over the card's descendant elements."""
+    name_tag = degree_tag = address_tag = rating_tag = fee_tag = None
+    info_blocks = []
+    for node in card.iterdescendants(etree.Element):
+        tag = node.tag
+        if tag == 'div':
+            classes = _class_tokens(node)
+            if degree_tag is None and any('ly-doctor__degree' in c for c in classes):
+                degree_tag = node
+            if any('grid__col-xs-10' in c for c in classes):
+                info_blocks.append(node)
+        elif tag == 'span':
+            itemprop = node.get('itemprop')
+            if itemprop == 'streetAddress':
+                address_tag = address_tag if address_tag is not None else node
+            elif itemprop == 'priceRange':
+                fee_tag = fee_tag if fee_tag is not None else node
+            if rating_tag is None and any('lybRating' in c for c in _class_tokens(node)):
+                rating_tag = node
+        elif tag == 'h2' and name_tag is None and node.get('itemprop') == 'name':
+            name_tag = node
+
+    name_link_tag = next(name_tag.iterdescendants('a'), None) if name_tag is not None else None
+    if name_link_tag is None:
+        return None # Skip if essential name link is missing
+    name = _text(name_link_tag)
+    if not name:
+        return None
+
+    block_texts = None
+    percentage_tag = votes_tag = None
+    if rating_tag is not None:
+        for span in rating_tag.iterdescendants('span'):
+            classes = _class_tokens(span)
+            if percentage_tag is None and any(RATING_PERCENTAGE_RE.search(c) for c in classes):
+                percentage_tag = span
+            if votes_tag is None and any(RATING_COUNT_RE.search(c) for c in classes):
+                votes_tag = span
+    if percentage_tag is not None:
+        votes_text = _text(votes_tag) if votes_tag is not None else ""
+        rating = f"{_text(percentage_tag)} {votes_text}".strip()
+    else:
+        block_texts = [_text(block) for block in info_blocks]
+        rating = _first_block(block_texts, _is_rating, "0%")
+
+    experience_string = next((text for text in card.itertext() if EXPERIENCE_RE.search(text)), None)
+    if experience_string is not None:
+        experience = experience_string.strip()
+    else:
+        if block_texts is None:
+            block_texts = [_text(block) for block in info_blocks]
+        experience = _first_block(block_texts, _is_experience, "0 years experience")
+
+    if fee_tag is not None:
+        charges = _text(fee_tag)
+    else:
+        if block_texts is None:
+            block_texts = [_text(block) for block in info_blocks]
+        charges = _first_block(block_texts, _is_charges, "N/A")
+
+    degree = _text(degree_tag).replace('\n', ' ').replace(',', ';') if degree_tag is not None else "N/A"
+    address = _text(address_tag).replace('\n', ' ').replace(',', ';') if address_tag is not None else "N/A"
+    return _record(name, name_link_tag.get('href', ''), degree, address, rating, experience, charges, city, specialty)
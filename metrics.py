@@ -0,0 +1,211 @@
+"""
+Latency metrics in the Prometheus text format, without extra dependencies.
+
+Histograms are fixed-bucket counters guarded by one lock each, so an
+observation costs a bisect and a few additions. `timed(phase)` measures one
+upstream phase (geocode, nearby page, details, Lybrate fetch/parse/extract)
+into upstream_phase_seconds and, when the current request is traced, also
+into its Server-Timing header. SamplingProfiler is an opt-in stack sampler
+for finding where slow requests spend their time.
+"""
+import bisect
+import collections
+import contextvars
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TRACE_HEADER = "X-Trace" # Send "X-Trace: 1" to get a Server-Timing header with per-phase timings
+TRACE_ALL_REQUESTS = os.environ.get("METRICS_TRACE_ALL", "0") == "1"
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", "0")) # Seconds between stack samples; 0 disables
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram(object):
+    """Cumulative-bucket latency histogram keyed by label values."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {} # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labelvalues, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {values[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}")
+        return "\n".join(lines)
+
+
+def render_samples(name, metric_type, documentation, samples):
+    """Text block for a counter or gauge; `samples` is a list of (labels dict, value)."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines)
+
+
+request_latency = Histogram("http_request_duration_seconds", "Time spent handling requests, per route.",
+                            ("route", "method", "status"))
+phase_latency = Histogram("upstream_phase_seconds", "Time spent per upstream phase.", ("phase",))
+
+
+# --- Per-request traces ---
+# A context variable rather than a thread-local, so traces also follow asyncio tasks (asgi_app.py)
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+def start_trace():
+    _trace.set([])
+
+
+def end_trace():
+    """Returns the (phase, seconds) list collected since start_trace and stops tracing."""
+    trace = _trace.get()
+    _trace.set(None)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def with_current_trace(fn):
+    """Wraps fn so phases it times on another thread are added to the caller's trace."""
+    trace = current_trace()
+    if trace is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _trace.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _trace.reset(token)
+    return run
+
+
+def server_timing(trace):
+    """Server-Timing header value; repeated phases are summed and counted."""
+    totals = collections.OrderedDict()
+    for phase, seconds in trace:
+        total, count = totals.get(phase, (0.0, 0))
+        totals[phase] = (total + seconds, count + 1)
+    return ", ".join(f'{phase};dur={total * 1000:.1f};desc="x{count}"' for phase, (total, count) in totals.items())
+
+
+@contextmanager
+def timed(phase):
+    """Records the block's duration as upstream phase `phase`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - start)
+
+
+def observe_phase(phase, seconds):
+    phase_latency.observe(seconds, phase)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((phase, seconds))
+
+
+# --- Sampling profiler ---
+class SamplingProfiler(object):
+    """
+    Samples the Python stacks of tracked threads every `interval` seconds and counts them
+    in collapsed-stack form ("frame;frame;frame count"), ready for flamegraph tools.
+    Only threads handling a request are tracked, so idle pool threads add nothing.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL, max_stacks=5000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self._threads = set()
+        self._stacks = collections.Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.samples = 0
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def track(self, thread_id=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._threads.add(thread_id or threading.get_ident())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def untrack(self, thread_id=None):
+        with self._lock:
+            self._threads.discard(thread_id or threading.get_ident())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                threads = set(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    key = ";".join(reversed(stack))
+                    with self._lock:
+                        self.samples += 1
+                        if key in self._stacks or len(self._stacks) < self.max_stacks:
+                            self._stacks[key] += 1
+
+    def collapsed(self, reset=False):
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+            if reset:
+                self._stacks.clear()
+                self.samples = 0
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+profiler = SamplingProfiler()
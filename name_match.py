@@ -0,0 +1,188 @@
+"""
+Fuzzy hospital name matching for /hospital/find_by_name.
+
+Names are normalized (case, punctuation, spelling variants such as
+speciality/specialty, and generic words like hospital/centre/clinic), then
+indexed by character trigrams and tokens. Scoring a query against many names
+is a couple of np.bincount calls over the inverted index, instead of one
+substring test (and often one details call) per candidate.
+"""
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+NAME_MATCH_THRESHOLD = 0.6 # Minimum similarity for a name to count as the same place
+NAME_INDEX_MAX_PLACES = int(os.environ.get("NAME_INDEX_MAX_PLACES", "200000")) # Rows, old names included, before a rebuild
+
+SPELLING_VARIANTS = {
+    'speciality': 'specialty', 'specialities': 'specialty', 'specialties': 'specialty',
+    'superspeciality': 'super specialty', 'superspecialty': 'super specialty',
+    'superspecialities': 'super specialty', 'superspecialties': 'super specialty',
+    'multispeciality': 'multi specialty', 'multispecialty': 'multi specialty',
+    'centre': 'center', 'centres': 'center', 'centers': 'center',
+    'hosp': 'hospital', 'hospitals': 'hospital', 'clinics': 'clinic',
+    'st': 'saint', 'mt': 'mount', 'govt': 'government', 'intl': 'international',
+    'pvt': 'private', 'ltd': 'limited', 'opp': 'opposite', '&': 'and',
+}
+STOPWORDS = frozenset([
+    'hospital', 'center', 'clinic', 'the', 'of', 'and', 'a', 'an', 'in', 'at',
+    'private', 'limited', 'llp', 'inc', 'co', 'emergency', 'super', 'multi', 'specialty'
+])
+TOKEN_RE = re.compile(r"[a-z0-9]+|&")
+
+
+def normalize_name(name):
+    """Lowercased, accent-free tokens with spelling variants unified and generic words dropped."""
+    text = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode('ascii').lower()
+    text = re.sub(r"['’`]", '', text) # St Stephen's -> st stephens
+    tokens = []
+    for token in TOKEN_RE.findall(text):
+        tokens.extend(SPELLING_VARIANTS.get(token, token).split())
+    meaningful = [token for token in tokens if token not in STOPWORDS]
+    return meaningful or tokens # "Hospital" alone should still match something
+
+
+def _trigrams(tokens):
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex(object):
+    """
+    Trigram and token inverted index over place names, scored with NumPy.
+
+    Rows are append-only, so a renamed place leaves its old row behind. Once
+    `max_places` rows exist the index is rebuilt from the live rows, keeping
+    the most recently added half; evicted places are indexed again the next
+    time a search returns them.
+    """
+
+    def __init__(self, capacity=1024, max_places=NAME_INDEX_MAX_PLACES):
+        self.max_places = max(max_places, 2)
+        self._initial_capacity = capacity
+        self._reset()
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        self._rows = {} # place_id -> row
+        self._names = [] # row -> original name
+        self._gram_counts = np.zeros(self._initial_capacity) # row -> number of distinct trigrams
+        self._token_counts = np.zeros(self._initial_capacity) # row -> number of distinct tokens
+        self._gram_postings = {} # trigram -> list of rows
+        self._token_postings = {} # token -> list of rows
+        self._arrays = {} # (kind, key) -> posting list as an array, dropped when the list grows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, place_id, name):
+        """Indexes a place name; re-adding an unchanged name is a no-op."""
+        if not place_id or not name:
+            return
+        with self._lock:
+            row = self._rows.get(place_id)
+            if row is not None:
+                if self._names[row] == name:
+                    return
+                self._rows.pop(place_id) # Renamed: index it again under a new row
+            if len(self._names) >= self.max_places:
+                self._rebuild(self.max_places // 2)
+            self._append(place_id, name)
+
+    def _rebuild(self, keep):
+        """Re-indexes the `keep` most recently added live names; dead rows go too (call with the lock held)."""
+        live = sorted(self._rows.items(), key=lambda item: item[1])[-keep:]
+        names = self._names
+        self._reset()
+        for place_id, row in live:
+            self._append(place_id, names[row])
+
+    def _append(self, place_id, name):
+        """Indexes `name` under a new row (call with the lock held)."""
+        tokens = set(normalize_name(name))
+        grams = _trigrams(tokens)
+        row = len(self._names)
+        if row == len(self._gram_counts):
+            self._gram_counts = np.resize(self._gram_counts, row * 2)
+            self._token_counts = np.resize(self._token_counts, row * 2)
+        self._rows[place_id] = row
+        self._names.append(name)
+        self._gram_counts[row] = len(grams)
+        self._token_counts[row] = len(tokens)
+        for gram in grams:
+            self._gram_postings.setdefault(gram, []).append(row)
+            self._arrays.pop(('gram', gram), None)
+        for token in tokens:
+            self._token_postings.setdefault(token, []).append(row)
+            self._arrays.pop(('token', token), None)
+
+    def add_places(self, places):
+        for place in places:
+            self.add(place.get('place_id'), place.get('name'))
+
+    def scores(self, query, place_ids):
+        """Similarity in [0, 1] of `query` to each place_id's indexed name (0 for unknown ids)."""
+        tokens = set(normalize_name(query))
+        grams = _trigrams(tokens)
+        with self._lock:
+            n = len(self._names)
+            rows = np.array([self._rows.get(place_id, -1) for place_id in place_ids], dtype=np.intp)
+            gram_hits = self._count_hits('gram', grams, self._gram_postings, n)
+            token_hits = self._count_hits('token', tokens, self._token_postings, n)
+            gram_counts = self._gram_counts
+            token_counts = self._token_counts
+        known = rows >= 0
+        safe_rows = np.where(known, rows, 0)
+        # Trigram Dice coefficient tolerates spelling differences; token overlap coefficient
+        # rewards one name containing the other ("Emergency, Max ..." vs "Max ...").
+        dice = 2.0 * gram_hits[safe_rows] / np.maximum(len(grams) + gram_counts[safe_rows], 1)
+        overlap = token_hits[safe_rows] / np.maximum(np.minimum(len(tokens), token_counts[safe_rows]), 1)
+        return np.where(known, 0.5 * dice + 0.5 * overlap, 0.0)
+
+    def _count_hits(self, kind, keys, postings, n):
+        """Number of `keys` each row contains, from the posting lists (call with the lock held)."""
+        arrays = []
+        for key in keys:
+            array = self._arrays.get((kind, key))
+            if array is None:
+                hits = postings.get(key)
+                if hits is None:
+                    continue
+                array = self._arrays[(kind, key)] = np.array(hits, dtype=np.intp)
+            arrays.append(array)
+        if not arrays or n == 0:
+            return np.zeros(max(n, 1))
+        return np.bincount(np.concatenate(arrays), minlength=n)
+
+    def rank(self, query, places, threshold=NAME_MATCH_THRESHOLD, margin=0.1):
+        """
+        Places whose names score at least `threshold` and within `margin` of the best score,
+        best first. An exact normalized match is kept alone. Ties keep the input (Google
+        ranking) order.
+        """
+        if not places:
+            return []
+        self.add_places(places)
+        scores = self.scores(query, [place.get('place_id') for place in places])
+        best = scores.max()
+        if best < threshold:
+            return []
+        floor = best - 1e-9 if best >= 1.0 - 1e-9 else max(threshold, best - margin)
+        keep = np.nonzero(scores >= floor)[0]
+        order = keep[np.argsort(-scores[keep], kind='stable')]
+        return [places[i] for i in order]
+
+
+def name_similarity(a, b):
+    """Same score as NameIndex.scores, for a single pair of names."""
+    tokens_a, tokens_b = set(normalize_name(a)), set(normalize_name(b))
+    grams_a, grams_b = _trigrams(tokens_a), _trigrams(tokens_b)
+    dice = 2.0 * len(grams_a & grams_b) / max(len(grams_a) + len(grams_b), 1)
+    overlap = len(tokens_a & tokens_b) / max(min(len(tokens_a), len(tokens_b)), 1)
+    return 0.5 * dice + 0.5 * overlap
@@ -0,0 +1,80 @@
+"""
+Background scheduling for paginated upstream fetches.
+
+Google only honours a next_page_token a couple of seconds after issuing it.
+Rather than sleeping in the request thread, follow-up pages are scheduled on
+a DelayedExecutor and handed out through short-lived cursors, so a request
+can return page 1 immediately and later pages are picked up when ready.
+"""
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class DelayedExecutor(object):
+    """Runs callables after a delay on a small worker pool, without blocking the caller."""
+
+    def __init__(self, max_workers=4, thread_name_prefix="delayed"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._queue = [] # heap of (run_at, seq, future, fn, args, kwargs)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"{thread_name_prefix}-timer", daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay, fn, *args, **kwargs):
+        """Returns a Future for fn(*args, **kwargs), which starts running `delay` seconds from now."""
+        future = Future()
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._seq), future, fn, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._cond.wait(timeout)
+                _, _, future, fn, args, kwargs = heapq.heappop(self._queue)
+            if future.set_running_or_notify_cancel():
+                self._executor.submit(self._call, future, fn, args, kwargs)
+
+    @staticmethod
+    def _call(future, fn, args, kwargs):
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+
+class CursorStore(object):
+    """Maps opaque cursor ids to pending page futures until they expire."""
+
+    def __init__(self, ttl=120):
+        self.ttl = ttl # Google page tokens only live a few minutes anyway
+        self._cursors = {} # cursor -> (expires_at, ready_at, future)
+        self._lock = threading.Lock()
+        self._adds = 0
+
+    def add(self, future, ready_at):
+        """Registers `future` (expected to resolve around `ready_at`, a time.time() value) and returns its cursor."""
+        cursor = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._adds += 1
+            if self._adds % 256 == 0: # Drop expired cursors now and then instead of on every add
+                self._cursors = {c: entry for c, entry in self._cursors.items() if entry[0] > now}
+            self._cursors[cursor] = (now + self.ttl, ready_at, future)
+        return cursor
+
+    def get(self, cursor):
+        """Returns (future, ready_at), or (None, None) for unknown or expired cursors."""
+        with self._lock:
+            entry = self._cursors.get(cursor)
+        if entry is None or entry[0] < time.time():
+            return None, None
+        return entry[2], entry[1]
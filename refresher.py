@@ -0,0 +1,90 @@
+"""
+Background refresh of hot cache entries (stale-while-revalidate).
+
+Accesses to cached place_ids, geocoded names and nearby cells are counted
+with an exponentially decaying score. When a hot entry is close to expiry,
+or already expired but within its grace window, ResponseCache serves the
+cached value and hands the reload to this refresher. The reload runs on a
+small pool, at batch priority for Google quota, and is capped by a pending
+queue limit and a refresh rate.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from throttle import RateLimiter, priority_class
+
+CACHE_REFRESH_ENABLED = os.environ.get("CACHE_REFRESH_ENABLED", "1") == "1"
+REFRESH_WORKERS = int(os.environ.get("REFRESH_WORKERS", "2"))
+REFRESH_MAX_PENDING = int(os.environ.get("REFRESH_MAX_PENDING", "64")) # Refreshes queued or running at once
+REFRESH_RATE = float(os.environ.get("REFRESH_RATE", "2")) # Refreshes started per second
+REFRESH_HOT_SCORE = float(os.environ.get("REFRESH_HOT_SCORE", "3")) # Decayed accesses that make an entry hot
+REFRESH_HALF_LIFE = float(os.environ.get("REFRESH_HALF_LIFE", "3600")) # Seconds for an access to count half
+REFRESH_MAX_TRACKED = 50000 # Keys whose access scores are remembered
+
+
+class Refresher(object):
+    """Access-frequency tracking plus a bounded pool for background reloads."""
+
+    def __init__(self, workers=REFRESH_WORKERS, max_pending=REFRESH_MAX_PENDING, rate=REFRESH_RATE,
+                 hot_score=REFRESH_HOT_SCORE, half_life=REFRESH_HALF_LIFE, max_tracked=REFRESH_MAX_TRACKED):
+        self.max_pending = max_pending
+        self.hot_score = hot_score
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cache-refresh")
+        self._budget = RateLimiter(rate)
+        self._scores = OrderedDict() # (kind, key) -> (score, last access), least recently accessed first
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._counters = {"scheduled": 0, "completed": 0, "failed": 0, "skipped_pending": 0, "skipped_rate": 0}
+
+    def record_access(self, kind, key):
+        now = time.time()
+        with self._lock:
+            score, last = self._scores.pop((kind, key), (0.0, now))
+            self._scores[(kind, key)] = (score * 0.5 ** ((now - last) / self.half_life) + 1.0, now)
+            while len(self._scores) > self.max_tracked:
+                self._scores.popitem(last=False)
+
+    def score(self, kind, key):
+        now = time.time()
+        with self._lock:
+            score, last = self._scores.get((kind, key), (0.0, now))
+        return score * 0.5 ** ((now - last) / self.half_life)
+
+    def is_hot(self, kind, key):
+        return self.score(kind, key) >= self.hot_score
+
+    def refresh(self, kind, key, reload):
+        """Schedules reload() unless one is pending for the key or the limits are reached; returns True if it is pending."""
+        with self._lock:
+            if (kind, key) in self._pending:
+                return True
+            if len(self._pending) >= self.max_pending:
+                self._counters["skipped_pending"] += 1
+                return False
+            if not self._budget.acquire(timeout=0):
+                self._counters["skipped_rate"] += 1
+                return False
+            self._pending.add((kind, key))
+            self._counters["scheduled"] += 1
+        self._executor.submit(self._run, kind, key, reload)
+        return True
+
+    def _run(self, kind, key, reload):
+        try:
+            with priority_class('batch'): # Refreshes yield Google quota to user requests
+                ok = reload() is not None
+        except Exception as e:
+            print(f"Error refreshing {kind} entry {key}: {e}")
+            ok = False
+        with self._lock:
+            self._pending.discard((kind, key))
+            self._counters["completed" if ok else "failed"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=len(self._pending), tracked=len(self._scores))
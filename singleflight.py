@@ -0,0 +1,101 @@
+"""
+Request coalescing for upstream calls.
+
+While a call for some key is in flight, identical calls (same group and key)
+wait for it and receive its result, or re-raise its exception, instead of
+hitting the upstream themselves. Nothing is remembered once the call returns;
+caching stays the job of cache.ResponseCache. AsyncSingleFlight does the
+same for coroutines in the async serving mode (asgi_app.py).
+"""
+import asyncio
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Thread-safe: one in-flight call per (group, key), shared by every concurrent caller."""
+
+    def __init__(self):
+        self._calls = {} # (group, key) -> _Call
+        self._lock = threading.Lock()
+        self._counters = {} # group -> {"calls": n, "coalesced": n, "errors": n}
+
+    def _count(self, group, name, n=1):
+        counters = self._counters.setdefault(group, {"calls": 0, "coalesced": 0, "errors": 0})
+        counters[name] += n
+
+    def do(self, group, key, fn):
+        """Returns fn(), running it only if no identical call is already in flight."""
+        with self._lock:
+            call = self._calls.get((group, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(group, key)] = _Call()
+                self._count(group, "calls")
+            else:
+                self._count(group, "coalesced")
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[(group, key)]
+                    if call.error is not None or call.result is None: # None is how the callers signal failure
+                        self._count(group, "errors")
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            stats = {group: dict(counters) for group, counters in self._counters.items()}
+            for group, _ in self._calls:
+                stats[group]["in_flight"] = stats[group].get("in_flight", 0) + 1
+        return stats
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    SingleFlight for coroutines on one event loop. The shared call runs as its own task, so a caller
+    that is cancelled (a client disconnect, a lookup no longer needed) does not cancel it for the others.
+    Pass `shared` to count into another SingleFlight's stats.
+    """
+
+    def __init__(self, shared=None):
+        super(AsyncSingleFlight, self).__init__()
+        if shared is not None:
+            self._counters, self._lock = shared._counters, shared._lock
+
+    async def do(self, group, key, fn):
+        """Returns await fn(), running it only if no identical call is already in flight."""
+        with self._lock:
+            task = self._calls.get((group, key))
+            if task is None:
+                task = self._calls[(group, key)] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda done: self._finish(group, key, done))
+                self._count(group, "calls")
+            else:
+                self._count(group, "coalesced")
+        return await asyncio.shield(task)
+
+    def _finish(self, group, key, task):
+        with self._lock:
+            del self._calls[(group, key)]
+            if task.cancelled() or task.exception() is not None or task.result() is None:
+                self._count(group, "errors")
+
+
+upstream_flights = SingleFlight()
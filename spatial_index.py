@@ -0,0 +1,314 @@
+"""
+Local geospatial store of places seen in Google Places responses.
+
+Places are bucketed on a lat/lon grid and distances are computed with a
+vectorized haversine over the candidate buckets, so radius queries over
+100k+ places stay well under a millisecond for city-scale radii.
+
+Coverage is tracked separately: a nearby search that returned everything in
+its circle (fewer than Google's 60-result cap) marks that circle, and the grid
+cells inside it, as covered for its place type. A query can be answered
+locally only when its whole circle is covered by fresh searches.
+"""
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+INDEX_CELL_DEG = 0.01 # ~1.1 km buckets for places
+COVERAGE_CELL_DEG = 0.01 # ~1.1 km cells for coverage bookkeeping
+NEARBY_INDEX_TTL = int(os.environ.get("NEARBY_INDEX_TTL", str(6 * 3600))) # Seconds a covered area stays fresh
+FULL_SCAN_CELLS = 2500 # Beyond this many buckets a masked scan of all rows is cheaper
+COVERAGE_MAX_CELLS = 2500 # Circles whose box spans more coverage cells are not tracked cell by cell
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters; works elementwise on NumPy arrays."""
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _bounding_box(lat, lon, radius_m):
+    dlat = radius_m / METERS_PER_DEGREE_LAT
+    dlon = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def _cell_range(box, cell_deg):
+    min_lat, max_lat, min_lon, max_lon = box
+    return (int(math.floor(min_lat / cell_deg)), int(math.floor(max_lat / cell_deg)),
+            int(math.floor(min_lon / cell_deg)), int(math.floor(max_lon / cell_deg)))
+
+
+def _cells(box, cell_deg):
+    first_row, last_row, first_col, last_col = _cell_range(box, cell_deg)
+    for i in range(first_row, last_row + 1):
+        for j in range(first_col, last_col + 1):
+            yield i, j
+
+
+def _cell_count(box, cell_deg):
+    first_row, last_row, first_col, last_col = _cell_range(box, cell_deg)
+    return (last_row - first_row + 1) * (last_col - first_col + 1)
+
+
+def _cell_grid(box, cell_deg):
+    """Row and column indices of every cell in the box, as flat NumPy arrays."""
+    first_row, last_row, first_col, last_col = _cell_range(box, cell_deg)
+    rows, cols = np.meshgrid(np.arange(first_row, last_row + 1), np.arange(first_col, last_col + 1), indexing='ij')
+    return rows.ravel(), cols.ravel()
+
+
+class PlaceIndex(object):
+    """Grid-bucketed point store for one place type."""
+
+    def __init__(self, capacity=1024):
+        self._lat = np.empty(capacity)
+        self._lon = np.empty(capacity)
+        self._records = [] # row -> simplified place dict
+        self._rows = {} # place_id -> row
+        self._buckets = {} # (i, j) -> list of rows
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def upsert(self, record):
+        """Adds or replaces a place; `record` needs place_id and location {lat, lng}."""
+        lat, lon = float(record['location']['lat']), float(record['location']['lng'])
+        cell = (int(math.floor(lat / INDEX_CELL_DEG)), int(math.floor(lon / INDEX_CELL_DEG)))
+        with self._lock:
+            row = self._rows.get(record['place_id'])
+            if row is None:
+                row = len(self._records)
+                if row == len(self._lat):
+                    self._lat = np.resize(self._lat, row * 2)
+                    self._lon = np.resize(self._lon, row * 2)
+                self._records.append(record)
+                self._rows[record['place_id']] = row
+                self._buckets.setdefault(cell, []).append(row)
+            else:
+                old_cell = (int(math.floor(self._lat[row] / INDEX_CELL_DEG)),
+                            int(math.floor(self._lon[row] / INDEX_CELL_DEG)))
+                if old_cell != cell: # The place moved; rebucket it
+                    self._buckets[old_cell].remove(row)
+                    self._buckets.setdefault(cell, []).append(row)
+                self._records[row] = record
+            self._lat[row] = lat
+            self._lon[row] = lon
+
+    def get(self, place_id):
+        with self._lock:
+            row = self._rows.get(place_id)
+            return self._records[row] if row is not None else None
+
+    def query(self, lat, lon, radius_m):
+        """Returns the records within radius_m of (lat, lon), nearest first."""
+        box = _bounding_box(lat, lon, radius_m)
+        with self._lock:
+            count = len(self._records)
+            if count == 0:
+                return []
+            if _cell_count(box, INDEX_CELL_DEG) > FULL_SCAN_CELLS:
+                lats, lons = self._lat[:count], self._lon[:count]
+                rows = np.nonzero((lats >= box[0]) & (lats <= box[1]) & (lons >= box[2]) & (lons <= box[3]))[0]
+            else:
+                candidate_rows = []
+                for cell in _cells(box, INDEX_CELL_DEG):
+                    bucket = self._buckets.get(cell)
+                    if bucket:
+                        candidate_rows.extend(bucket)
+                if not candidate_rows:
+                    return []
+                rows = np.array(candidate_rows, dtype=np.intp)
+            distances = haversine_m(lat, lon, self._lat[rows], self._lon[rows])
+            inside = distances <= radius_m
+            rows = rows[inside][np.argsort(distances[inside], kind='stable')]
+            records = self._records
+            return [records[row] for row in rows.tolist()]
+
+
+class CoverageMap(object):
+    """
+    Remembers which circles (and the grid cells inside them) were fully searched, and when;
+    also which cells had a search of their own cut off at Google's result cap.
+    """
+
+    def __init__(self, ttl=NEARBY_INDEX_TTL, capacity=256):
+        self.ttl = ttl
+        self._circles = np.empty((capacity, 4)) # rows of lat, lon, radius_m, searched_at
+        self._circle_count = 0
+        self._cells = {} # (i, j) -> searched_at
+        self._dense = {} # (i, j) -> when a search of just that cell was truncated
+        self._next_expiry = 0.0
+        self._lock = threading.Lock()
+
+    def _compact_circles(self, cutoff):
+        """Drops circles searched before `cutoff`. Caller holds the lock."""
+        circles = self._circles[:self._circle_count]
+        fresh = circles[circles[:, 3] >= cutoff]
+        self._circles[:len(fresh)] = fresh
+        self._circle_count = len(fresh)
+
+    def _expire(self, now):
+        """Drops entries older than the TTL, at most every quarter TTL. Caller holds the lock."""
+        if now < self._next_expiry:
+            return
+        cutoff = now - self.ttl
+        self._compact_circles(cutoff)
+        self._cells = {cell: t for cell, t in self._cells.items() if t >= cutoff}
+        self._dense = {cell: t for cell, t in self._dense.items() if t >= cutoff}
+        self._next_expiry = now + self.ttl / 4.0
+
+    def mark(self, lat, lon, radius_m, searched_at=None):
+        searched_at = searched_at or time.time()
+        box = _bounding_box(lat, lon, radius_m)
+        if _cell_count(box, COVERAGE_CELL_DEG) > COVERAGE_MAX_CELLS: # Only the circle itself is remembered
+            rows = cols = np.zeros(0, dtype=np.intp)
+            inside = np.zeros(0, dtype=bool)
+        else:
+            rows, cols = _cell_grid(box, COVERAGE_CELL_DEG)
+            # A cell is covered when all four corners lie inside the searched circle
+            inside = np.ones(len(rows), dtype=bool)
+            for corner_row, corner_col in ((rows, cols), (rows, cols + 1), (rows + 1, cols), (rows + 1, cols + 1)):
+                inside &= haversine_m(lat, lon, corner_row * COVERAGE_CELL_DEG, corner_col * COVERAGE_CELL_DEG) <= radius_m
+        with self._lock:
+            self._expire(searched_at)
+            if self._circle_count == len(self._circles):
+                self._compact_circles(searched_at - self.ttl)
+                if self._circle_count == len(self._circles):
+                    self._circles = np.resize(self._circles, (self._circle_count * 2, 4))
+            self._circles[self._circle_count] = (lat, lon, radius_m, searched_at)
+            self._circle_count += 1
+            for i, j in zip(rows[inside].tolist(), cols[inside].tolist()):
+                self._cells[(i, j)] = searched_at
+
+    def uncovered_cells(self, lat, lon, radius_m, now=None):
+        """
+        Returns the cells of the circle not covered by a fresh search; empty when it is fully
+        covered, None when it spans too many cells to check.
+        """
+        cutoff = (now or time.time()) - self.ttl
+        with self._lock:
+            circles = self._circles[:self._circle_count]
+            if np.any((circles[:, 3] >= cutoff)
+                      & (haversine_m(lat, lon, circles[:, 0], circles[:, 1]) + radius_m <= circles[:, 2])):
+                return []
+        box = _bounding_box(lat, lon, radius_m)
+        if _cell_count(box, COVERAGE_CELL_DEG) > COVERAGE_MAX_CELLS:
+            return None
+        rows, cols = _cell_grid(box, COVERAGE_CELL_DEG)
+        # A cell overlaps the circle when its point nearest to the centre lies inside it
+        nearest_lat = np.clip(lat, rows * COVERAGE_CELL_DEG, (rows + 1) * COVERAGE_CELL_DEG)
+        nearest_lon = np.clip(lon, cols * COVERAGE_CELL_DEG, (cols + 1) * COVERAGE_CELL_DEG)
+        overlaps = haversine_m(lat, lon, nearest_lat, nearest_lon) <= radius_m
+        with self._lock:
+            return [(i, j) for i, j in zip(rows[overlaps].tolist(), cols[overlaps].tolist())
+                    if self._cells.get((i, j), 0) < cutoff]
+
+    def mark_dense(self, cells, searched_at=None):
+        searched_at = searched_at or time.time()
+        with self._lock:
+            self._expire(searched_at)
+            for cell in cells:
+                self._dense[cell] = searched_at
+
+    def any_dense(self, cells, now=None):
+        """True if a fresh search of one of `cells` was truncated, so searching it again would not cover it."""
+        cutoff = (now or time.time()) - self.ttl
+        with self._lock:
+            return any(self._dense.get(cell, 0) >= cutoff for cell in cells)
+
+
+class NearbyIndex(object):
+    """Per-type place indexes plus coverage, fed from Places responses."""
+
+    def __init__(self, ttl=NEARBY_INDEX_TTL):
+        self.ttl = ttl
+        self._indexes = {} # place type -> PlaceIndex
+        self._coverage = {} # place type -> CoverageMap
+        self._lock = threading.Lock()
+        self.local_answers = 0
+        self.fallbacks = 0
+
+    def _for_type(self, place_type):
+        place_type = str(place_type).strip().lower()
+        with self._lock:
+            if place_type not in self._indexes:
+                self._indexes[place_type] = PlaceIndex()
+                self._coverage[place_type] = CoverageMap(self.ttl)
+            return self._indexes[place_type], self._coverage[place_type]
+
+    def ingest(self, places, place_type):
+        """Stores places from a nearby search page of `place_type`."""
+        index, _ = self._for_type(place_type)
+        for place in places:
+            location = place.get('geometry', {}).get('location')
+            if not place.get('place_id') or not location:
+                continue
+            index.upsert({
+                "name": place.get("name"),
+                "place_id": place.get("place_id"),
+                "rating": place.get("rating"),
+                "user_ratings_total": place.get("user_ratings_total"),
+                "vicinity": place.get("vicinity"),
+                "location": location
+            })
+
+    def update_place(self, details):
+        """Refreshes a known place from a details response, in every type index that holds it."""
+        place_id = details.get('place_id')
+        if not place_id:
+            return
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            record = index.get(place_id)
+            if record is None:
+                continue
+            updated = dict(record)
+            for key in ("name", "rating", "user_ratings_total", "vicinity"):
+                if key in details:
+                    updated[key] = details[key]
+            if details.get('geometry', {}).get('location'):
+                updated['location'] = details['geometry']['location']
+            index.upsert(updated)
+
+    def mark_covered(self, lat, lon, radius_m, place_type):
+        _, coverage = self._for_type(place_type)
+        coverage.mark(lat, lon, radius_m)
+
+    def uncovered_cells(self, lat, lon, radius_m, place_type):
+        _, coverage = self._for_type(place_type)
+        return coverage.uncovered_cells(lat, lon, radius_m)
+
+    def mark_dense(self, cells, place_type):
+        _, coverage = self._for_type(place_type)
+        coverage.mark_dense(cells)
+
+    def any_dense(self, cells, place_type):
+        _, coverage = self._for_type(place_type)
+        return coverage.any_dense(cells)
+
+    def count_answer(self, local):
+        """Counts a nearby query answered locally, or one sent to Google."""
+        with self._lock:
+            if local:
+                self.local_answers += 1
+            else:
+                self.fallbacks += 1
+
+    def query(self, lat, lon, radius_m, place_type):
+        """Simplified place dicts within the circle, nearest first (no coverage check)."""
+        index, _ = self._for_type(place_type)
+        return index.query(lat, lon, radius_m)
+
+    def stats(self):
+        with self._lock:
+            return {"places": {t: len(index) for t, index in self._indexes.items()},
+                    "local_answers": self.local_answers, "fallbacks": self.fallbacks}
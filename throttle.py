@@ -0,0 +1,300 @@
+"""
+Client-side rate limiting for upstream calls.
+
+RateLimiter is a plain token bucket. QuotaLimiter puts one priority-aware
+bucket per Google API and per billing SKU in front of every Places Nearby,
+Place Details and Geocoding request, queues callers for a bounded time when a
+budget is exhausted, and keeps call, wait and estimated spend counters.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RateLimiter(object):
+    """Thread-safe token bucket: `rate` tokens per second, bursting up to `burst`. A rate of 0 or less never limits."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0 # Total seconds callers spent waiting for tokens
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """Blocks until `tokens` are available; returns False if that would take longer than `timeout`."""
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+            with self._lock:
+                self.waited += wait
+
+    def _try_acquire(self, tokens, priority):
+        return self.acquire(tokens, timeout=0)
+
+    def release(self, tokens=1):
+        """Returns tokens taken by a call that did not go ahead."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.burst, self._tokens + tokens)
+
+    async def acquire_async(self, tokens=1, timeout=None, priority=0):
+        """
+        acquire for coroutines: sleeps on the event loop instead of blocking its thread.
+        Async waiters poll rather than queue; lower priorities poll less eagerly.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        slept = 0.0
+        try:
+            while not self._try_acquire(tokens, priority):
+                with self._lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = max((tokens - self._tokens) / self.rate, 0.001) * (1 + priority)
+                if deadline is not None and now + wait > deadline:
+                    return False
+                await asyncio.sleep(wait)
+                slept += time.monotonic() - now
+            return True
+        finally:
+            if slept:
+                with self._lock:
+                    self.waited += slept
+
+
+class PriorityRateLimiter(RateLimiter):
+    """Token bucket whose waiters are served by priority (lower first), FIFO within a priority."""
+
+    def __init__(self, rate, burst=None):
+        super(PriorityRateLimiter, self).__init__(rate, burst)
+        self._ready = threading.Condition(self._lock)
+        self._queue = [] # heap of (priority, ticket)
+        self._tickets = itertools.count()
+
+    def acquire(self, tokens=1, timeout=None, priority=0):
+        """Like RateLimiter.acquire, but only the best-priority waiter may take tokens."""
+        if self.rate <= 0:
+            return True
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        entry = (priority, next(self._tickets))
+        with self._ready:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = None # Not at the head: sleep until the queue changes
+                    if self._queue[0] == entry:
+                        if self._tokens >= tokens:
+                            self._tokens -= tokens
+                            return True
+                        wait = (tokens - self._tokens) / self.rate
+                    if deadline is not None:
+                        if now >= deadline or (wait is not None and now + wait > deadline):
+                            return False
+                        wait = deadline - now if wait is None else wait
+                    self._ready.wait(wait)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self.waited += time.monotonic() - start
+                self._ready.notify_all()
+
+    def _try_acquire(self, tokens, priority):
+        return self.acquire(tokens, timeout=0, priority=priority)
+
+    def release(self, tokens=1):
+        super(PriorityRateLimiter, self).release(tokens)
+        with self._ready:
+            self._ready.notify_all()
+
+
+# --- Google API quota ---
+PRIORITIES = {'interactive': 0, 'batch': 1} # Lower is served first
+
+# Estimated USD per 1000 requests (Places legacy and Geocoding list prices, before free credit)
+SKU_COSTS = {
+    'geocode': 5.0,
+    'nearby': 32.0,
+    'details_basic': 17.0,
+    'details_contact': 20.0,
+    'details_atmosphere': 22.0,
+    'details_contact_atmosphere': 25.0,
+}
+DETAILS_BASIC_FIELDS = frozenset(['address_components', 'adr_address', 'business_status', 'formatted_address',
+                                  'geometry', 'icon', 'name', 'photos', 'place_id', 'plus_code', 'types', 'url',
+                                  'utc_offset', 'vicinity'])
+DETAILS_CONTACT_FIELDS = frozenset(['formatted_phone_number', 'international_phone_number', 'website',
+                                    'opening_hours', 'current_opening_hours', 'secondary_opening_hours'])
+DETAILS_ATMOSPHERE_FIELDS = frozenset(['rating', 'reviews', 'user_ratings_total', 'price_level', 'editorial_summary',
+                                       'delivery', 'dine_in', 'takeout', 'reservable', 'wheelchair_accessible_entrance'])
+
+# Requests per second per budget (an API or a SKU); 0 disables a budget. All are off unless a
+# deployment sets QUOTA_<NAME>_QPS to match its Google project, e.g. QUOTA_NEARBY_QPS=10.
+DEFAULT_BUDGETS = {
+    'nearby': 0,
+    'details': 0,
+    'geocode': 0,
+    'details_basic': 0,
+    'details_contact': 0,
+    'details_atmosphere': 0,
+    'details_contact_atmosphere': 0,
+}
+QUOTA_MAX_WAIT = {
+    'interactive': float(os.environ.get("QUOTA_MAX_WAIT_INTERACTIVE", "5")), # Seconds queued before giving up
+    'batch': float(os.environ.get("QUOTA_MAX_WAIT_BATCH", "60")),
+}
+
+_priority = contextvars.ContextVar('priority', default='interactive') # Per thread, and per asyncio task
+
+
+@contextmanager
+def priority_class(name):
+    """Runs the block's Google calls under priority class `name` ('interactive' or 'batch')."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def with_current_priority(fn):
+    """Wraps fn so it runs under the caller's priority class on another thread (e.g. an executor)."""
+    priority = current_priority()
+
+    def run(*args, **kwargs):
+        with priority_class(priority):
+            return fn(*args, **kwargs)
+    return run
+
+
+def details_sku(fields):
+    """Billing SKU of a Place Details request for `fields`."""
+    fields = set(fields)
+    contact = bool(fields & DETAILS_CONTACT_FIELDS)
+    atmosphere = bool(fields & DETAILS_ATMOSPHERE_FIELDS)
+    if contact and atmosphere:
+        return 'details_contact_atmosphere'
+    if atmosphere:
+        return 'details_atmosphere'
+    if contact:
+        return 'details_contact'
+    return 'details_basic'
+
+
+def _load_budgets():
+    return {name: float(os.environ.get(f"QUOTA_{name.upper()}_QPS", str(rate)))
+            for name, rate in DEFAULT_BUDGETS.items()}
+
+
+class QuotaLimiter(object):
+    """
+    Shared quota for Google calls. A call takes one token from its API budget and one from
+    its SKU budget, waiting in priority order for at most QUOTA_MAX_WAIT of its class. If the
+    second budget runs out, the token taken from the first is given back.
+    """
+
+    def __init__(self, budgets=None, costs=None, max_wait=None):
+        budgets = _load_budgets() if budgets is None else budgets
+        self.costs = costs or SKU_COSTS
+        self.max_wait = max_wait or QUOTA_MAX_WAIT
+        self.budgets = {name: PriorityRateLimiter(rate) for name, rate in budgets.items() if rate > 0}
+        self._counters = {} # sku -> counters
+        self._lock = threading.Lock()
+
+    def acquire(self, api, sku=None, priority=None):
+        """Waits for quota for one call; returns False if it was not available within the max wait."""
+        sku = sku or api
+        priority = priority or current_priority()
+        start = time.monotonic()
+        deadline = start + self.max_wait.get(priority, self.max_wait['interactive'])
+        granted = True
+        taken = []
+        for name in (api, sku) if sku != api else (api,):
+            budget = self.budgets.get(name)
+            if budget is None:
+                continue
+            if not budget.acquire(timeout=max(deadline - time.monotonic(), 0), priority=PRIORITIES.get(priority, 0)):
+                granted = False
+                break
+            taken.append(budget)
+        if not granted:
+            for budget in taken:
+                budget.release() # The other budget refused: give back what this call took
+        self._record(sku, priority, granted, time.monotonic() - start)
+        return granted
+
+    async def acquire_async(self, api, sku=None, priority=None):
+        """acquire for coroutines (asgi_app.py): waits on the event loop instead of blocking it."""
+        sku = sku or api
+        priority = priority or current_priority()
+        start = time.monotonic()
+        deadline = start + self.max_wait.get(priority, self.max_wait['interactive'])
+        granted = True
+        taken = []
+        for name in (api, sku) if sku != api else (api,):
+            budget = self.budgets.get(name)
+            if budget is None:
+                continue
+            if not await budget.acquire_async(timeout=max(deadline - time.monotonic(), 0),
+                                              priority=PRIORITIES.get(priority, 0)):
+                granted = False
+                break
+            taken.append(budget)
+        if not granted:
+            for budget in taken:
+                budget.release() # The other budget refused: give back what this call took
+        self._record(sku, priority, granted, time.monotonic() - start)
+        return granted
+
+    def _record(self, sku, priority, granted, waited):
+        with self._lock:
+            counters = self._counters.setdefault(sku, {"calls": 0, "rejected": 0, "throttled": 0,
+                                                       "wait_seconds": 0.0, "by_priority": {}})
+            if granted:
+                counters["calls"] += 1
+                counters["by_priority"][priority] = counters["by_priority"].get(priority, 0) + 1
+            else:
+                counters["rejected"] += 1
+            if waited > 0.001:
+                counters["throttled"] += 1
+                counters["wait_seconds"] += waited
+
+    def stats(self):
+        with self._lock:
+            skus = {}
+            total = 0.0
+            for sku, counters in self._counters.items():
+                spend = counters["calls"] * self.costs.get(sku, 0.0) / 1000.0
+                total += spend
+                skus[sku] = dict(counters, by_priority=dict(counters["by_priority"]),
+                                 wait_seconds=round(counters["wait_seconds"], 3),
+                                 estimated_spend_usd=round(spend, 4))
+        budgets = {name: {"qps": budget.rate, "queued": len(budget._queue)} for name, budget in self.budgets.items()}
+        return {"skus": skus, "budgets": budgets, "estimated_spend_usd": round(total, 4)}